@@ -0,0 +1,78 @@
+"""
+Benchmark the token bucket acquire path, without network I/O.
+
+The bucket's Lua script is replaced by a fake which hands out slots instantly,
+so this measures the Python overhead of each acquire: working out how long to
+sleep, checking `max_sleep`, and logging.
+
+Run with `python -m benchmarks.acquire_path`.
+"""
+
+import argparse
+import io
+import logging
+import time
+import timeit
+from collections.abc import Callable, Iterable, Sequence
+from datetime import datetime
+from typing import Any
+from uuid import uuid4
+
+from redis import Redis
+
+from limiters import MaxSleepExceededError, SyncTokenBucket
+from limiters.token_bucket import logger
+
+
+class FakeScriptBucket(SyncTokenBucket):
+    """A token bucket whose script assigns a slot that has already passed, without calling Redis."""
+
+    def script(self, keys: Sequence[str], args: Iterable[Any]) -> Any:
+        if self.server_time:
+            return 0
+        return int(time.time() * 1000) - 1
+
+
+def legacy_parse_timestamp(bucket: SyncTokenBucket, timestamp: int) -> float:
+    """How `parse_timestamp` used to work out the sleep time, with datetimes and unthrottled logging."""
+    wake_up_time = datetime.fromtimestamp(timestamp / 1000)
+    now = datetime.now()
+    if wake_up_time < now:
+        return 0
+    sleep_time = (wake_up_time - now).total_seconds()
+    if bucket.max_sleep != 0.0 and sleep_time > bucket.max_sleep:
+        raise MaxSleepExceededError(f'Scheduled to sleep `{sleep_time}` seconds.')
+    logger.info('Sleeping %s seconds (%s)', sleep_time, bucket.name)
+    return sleep_time
+
+
+def run(label: str, func: Callable[[], object], iterations: int) -> None:
+    elapsed = min(timeit.repeat(func, number=iterations, repeat=5))
+    print(f'{label:<32} {elapsed / iterations * 1_000_000:6.2f} µs per call')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--iterations', type=int, default=100_000)
+    args = parser.parse_args()
+
+    # Log the way a service would, so formatting is part of the cost
+    logging.basicConfig(level=logging.INFO, stream=io.StringIO())
+
+    # The connection is never used, since the script is fake
+    connection = Redis()
+    config = {'name': f'bench-{uuid4().hex[:8]}', 'capacity': 10, 'refill_frequency': 1, 'refill_amount': 10}
+    bucket = FakeScriptBucket(**config, connection=connection)
+    server_time_bucket = FakeScriptBucket(**config, server_time=True, connection=connection)
+
+    def throttled_timestamp() -> int:
+        return int(time.time() * 1000) + 50
+
+    run('parse_timestamp (legacy)', lambda: legacy_parse_timestamp(bucket, throttled_timestamp()), args.iterations)
+    run('parse_timestamp', lambda: bucket.parse_timestamp(throttled_timestamp()), args.iterations)
+    run('acquire', bucket.acquire, args.iterations)
+    run('acquire (server time)', server_time_bucket.acquire, args.iterations)
+
+
+if __name__ == '__main__':
+    main()
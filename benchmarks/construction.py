@@ -0,0 +1,55 @@
+"""
+Micro-benchmark for limiter construction.
+
+Compares plain pydantic validation (how limiters used to be built)
+with the cached validation path, for repeated and for unique configs.
+
+Run with `python -m benchmarks.construction`. No Redis server is needed,
+since constructing a limiter doesn't touch the network.
+"""
+
+import argparse
+import timeit
+from collections.abc import Callable
+from typing import Any
+
+from pydantic import BaseModel
+from redis import Redis
+
+from limiters import SyncSemaphore, SyncTokenBucket
+
+
+def uncached(cls: type[BaseModel], **kwargs: Any) -> None:
+    """Construct a limiter the way we did before validation was cached."""
+    instance = cls.__new__(cls)
+    BaseModel.__init__(instance, **kwargs)
+
+
+def report(label: str, fn: Callable[[], Any], number: int) -> None:
+    seconds = min(timeit.repeat(fn, number=number, repeat=5))
+    print(f'{label:<45} {seconds / number * 1_000_000:8.2f} µs per limiter')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--number', type=int, default=20_000)
+    args = parser.parse_args()
+
+    connection = Redis()
+    bucket = {'capacity': 10, 'refill_frequency': 1.0, 'refill_amount': 10, 'max_sleep': 5, 'connection': connection}
+    semaphore = {'capacity': 5, 'max_sleep': 5, 'connection': connection}
+    counter = iter(range(10**9))
+
+    for cls, kwargs in ((SyncTokenBucket, bucket), (SyncSemaphore, semaphore)):
+        name = cls.__name__
+        report(f'{name}: pydantic validation (before)', lambda: uncached(cls, name='tenant:1', **kwargs), args.number)
+        report(f'{name}: cached validation (after)', lambda: cls(name='tenant:1', **kwargs), args.number)
+        report(
+            f'{name}: cache miss (unique names)',
+            lambda: cls(name=f'tenant:{next(counter)}', **kwargs),
+            args.number,
+        )
+
+
+if __name__ == '__main__':
+    main()
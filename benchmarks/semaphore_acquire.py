@@ -0,0 +1,121 @@
+"""
+Benchmark semaphore acquire/release round trips and latency.
+
+Compares the single-script acquire and release with the previous protocol,
+which created the semaphore in one script, then called BLPOP, then refreshed
+expiries in a pipeline, and released with another pipeline.
+
+Run with `python -m benchmarks.semaphore_acquire --url redis://127.0.0.1:6378`.
+"""
+
+import argparse
+import statistics
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+from uuid import uuid4
+
+from redis import Redis
+from redis.connection import Connection
+
+from limiters import SyncSemaphore
+
+# The create-if-missing script the semaphore used before acquiring with BLPOP
+LEGACY_CREATE_SCRIPT = """
+if redis.call('SETNX', KEYS[2], 1) == 1 then
+    local args = { 'RPUSH', KEYS[1] }
+    for _ = 1, tonumber(ARGV[1]) do
+        table.insert(args, 1)
+    end
+    redis.call(unpack(args))
+    return true
+end
+return false
+"""
+
+
+class RoundTripCounter:
+    """Count requests sent to Redis, by wrapping `Connection.send_packed_command`."""
+
+    def __init__(self) -> None:
+        self.count = 0
+        self._lock = threading.Lock()
+        self._original = Connection.send_packed_command
+
+    def __enter__(self) -> 'RoundTripCounter':
+        original = self._original
+
+        def send_packed_command(connection: Connection, *args: Any, **kwargs: Any) -> None:
+            with self._lock:
+                self.count += 1
+            return original(connection, *args, **kwargs)
+
+        Connection.send_packed_command = send_packed_command
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        Connection.send_packed_command = self._original
+
+
+def legacy_cycle(semaphore: SyncSemaphore, create_script: Callable[..., object]) -> float:
+    start = time.perf_counter()
+    create_script(keys=[semaphore.key, semaphore.exists], args=[semaphore.capacity])
+    semaphore.connection.blpop(semaphore.key, semaphore.max_sleep)
+    pipeline = semaphore.connection.pipeline()
+    pipeline.expire(semaphore.key, semaphore.expiry)
+    pipeline.expire(semaphore.exists, semaphore.expiry)
+    pipeline.execute()
+    elapsed = time.perf_counter() - start
+
+    pipeline = semaphore.connection.pipeline()
+    pipeline.lpush(semaphore.key, 1)
+    pipeline.expire(semaphore.key, semaphore.expiry)
+    pipeline.expire(semaphore.exists, semaphore.expiry)
+    pipeline.execute()
+    return elapsed
+
+
+def current_cycle(semaphore: SyncSemaphore) -> float:
+    start = time.perf_counter()
+    semaphore.__enter__()
+    elapsed = time.perf_counter() - start
+    semaphore.__exit__(None, None, None)
+    return elapsed
+
+
+def run(label: str, cycle: Callable[[], float], iterations: int, threads: int) -> None:
+    with RoundTripCounter() as counter, ThreadPoolExecutor(threads) as pool:
+        latencies = sorted(pool.map(lambda _: cycle(), range(iterations)))
+
+    p50 = statistics.median(latencies) * 1000
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+    print(
+        f'{label:<8} round trips per acquire+release: {counter.count / iterations:5.2f}   '
+        f'acquire p50: {p50:6.3f} ms   p99: {p99:6.3f} ms'
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--url', default='redis://127.0.0.1:6378')
+    parser.add_argument('--iterations', type=int, default=2_000)
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--capacity', type=int, default=5)
+    args = parser.parse_args()
+
+    connection = Redis.from_url(args.url)
+    semaphore = SyncSemaphore(name=f'bench-{uuid4().hex[:8]}', capacity=args.capacity, connection=connection)
+    create_script = connection.register_script(LEGACY_CREATE_SCRIPT)
+
+    # Warm up connections and scripts
+    current_cycle(semaphore)
+    legacy_cycle(semaphore, create_script)
+
+    run('legacy', lambda: legacy_cycle(semaphore, create_script), args.iterations, args.threads)
+    run('current', lambda: current_cycle(semaphore), args.iterations, args.threads)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,379 @@
+"""
+Benchmark limiter throughput, latency and accuracy against a Redis server.
+
+Drives the sync and async token buckets and semaphores with a number of
+concurrent workers (threads or tasks), spread over a number of limiter keys,
+and reports, per limiter:
+
+* acquires per second
+* p50, p99 and p99.9 acquire latency, including any time spent waiting
+* Redis round trips and commands per acquire (counted client-side)
+* accuracy: for token buckets, how many acquires went through, relative to
+  what the configured rate allows; for semaphores, the most holders seen at
+  once on any key, relative to the capacity
+
+Each result is written as a line of JSON, to stdout or appended to `--output`,
+so runs can be stored and compared over time.
+
+Run with `python -m benchmarks.suite --url redis://127.0.0.1:6378`, add `--cluster`
+for a `RedisCluster`, or use `--backend spawn` to start a throwaway `redis-server`
+process, `--backend fakeredis` to use an in-process fake, or `--backend memory` to
+use the limiters' own in-memory backend.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import platform
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from collections.abc import Awaitable, Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from datetime import UTC, datetime
+from importlib.metadata import version
+from typing import Any
+from uuid import uuid4
+
+import redis.asyncio.connection
+import redis.connection
+from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
+from redis.asyncio.cluster import RedisCluster as AsyncRedisCluster
+from redis.cluster import RedisCluster
+
+from limiters import AsyncSemaphore, AsyncTokenBucket, SyncSemaphore, SyncTokenBucket
+from limiters.memory import AsyncMemoryBackend, SyncMemoryBackend
+
+LIMITERS = ('sync-token-bucket', 'async-token-bucket', 'sync-semaphore', 'async-semaphore')
+
+
+class CommandCounter:
+    """
+    Count round trips and commands sent to Redis, on sync and async connections.
+
+    Round trips are calls to `send_packed_command`; a pipeline is one round trip,
+    but counts one command per command in it.
+    """
+
+    def __init__(self) -> None:
+        self.round_trips = 0
+        self.commands = 0
+        self._lock = threading.Lock()
+        self._originals: list[tuple[type, str, Any]] = []
+
+    def _add(self, round_trips: int, commands: int) -> None:
+        with self._lock:
+            self.round_trips += round_trips
+            self.commands += commands
+
+    def _wrap(self, cls: type, name: str, count: Callable[..., None]) -> None:
+        original = getattr(cls, name)
+        wrapper: Any
+        if asyncio.iscoroutinefunction(original):
+
+            async def wrapper(*args: Any, **kwargs: Any) -> Any:
+                count(*args)
+                return await original(*args, **kwargs)
+
+        else:
+
+            def wrapper(*args: Any, **kwargs: Any) -> Any:
+                count(*args)
+                return original(*args, **kwargs)
+
+        setattr(cls, name, wrapper)
+        self._originals.append((cls, name, original))
+
+    def __enter__(self) -> 'CommandCounter':
+        for cls in (redis.connection.AbstractConnection, redis.asyncio.connection.AbstractConnection):
+            self._wrap(cls, 'send_packed_command', lambda *args: self._add(1, 0))
+            self._wrap(cls, 'send_command', lambda *args: self._add(0, 1))
+            self._wrap(cls, 'pack_commands', lambda connection, commands: self._add(0, len(commands)))
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        for cls, name, original in reversed(self._originals):
+            setattr(cls, name, original)
+        self._originals.clear()
+
+
+class ConcurrencyTracker:
+    """Track the most holders of each semaphore seen at once, as seen by this process."""
+
+    def __init__(self) -> None:
+        self.current: defaultdict[str, int] = defaultdict(int)
+        self.max = 0
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def hold(self, key: str) -> Iterator[None]:
+        with self._lock:
+            self.current[key] += 1
+            self.max = max(self.max, self.current[key])
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.current[key] -= 1
+
+
+class Backend:
+    """Creates connections to the Redis server (or fake) under test."""
+
+    def __init__(self, label: str, sync: Callable[[], Any], async_: Callable[[], Any]) -> None:
+        self.label = label
+        self.sync = sync
+        self.async_ = async_
+
+
+@contextlib.contextmanager
+def redis_backend(args: argparse.Namespace) -> Iterator[Backend]:
+    if args.backend == 'memory':
+        yield Backend('memory', SyncMemoryBackend, AsyncMemoryBackend)
+        return
+
+    if args.backend == 'fakeredis':
+        try:
+            import fakeredis
+        except ImportError:
+            sys.exit('The fakeredis backend requires fakeredis (and lupa): pip install fakeredis[lua]')
+        server = fakeredis.FakeServer()
+        yield Backend(
+            'fakeredis', lambda: fakeredis.FakeRedis(server=server), lambda: fakeredis.FakeAsyncRedis(server=server)
+        )
+        return
+
+    if args.backend == 'spawn':
+        if (executable := shutil.which('redis-server')) is None:
+            sys.exit('The spawn backend requires redis-server on the PATH')
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            port = s.getsockname()[1]
+        process = subprocess.Popen(
+            [executable, '--port', str(port), '--save', '', '--appendonly', 'no'], stdout=subprocess.DEVNULL
+        )
+        url = f'redis://127.0.0.1:{port}'
+        try:
+            for _ in range(100):
+                with contextlib.suppress(redis.exceptions.ConnectionError):
+                    Redis.from_url(url).ping()
+                    break
+                time.sleep(0.05)
+            yield Backend(f'redis-server {url}', lambda: Redis.from_url(url), lambda: AsyncRedis.from_url(url))
+        finally:
+            process.terminate()
+            process.wait()
+        return
+
+    if args.cluster:
+        yield Backend(
+            f'cluster {args.url}', lambda: RedisCluster.from_url(args.url), lambda: AsyncRedisCluster.from_url(args.url)
+        )
+    else:
+        yield Backend(args.url, lambda: Redis.from_url(args.url), lambda: AsyncRedis.from_url(args.url))
+
+
+def bucket_config(args: argparse.Namespace) -> dict[str, Any]:
+    return {
+        'capacity': args.capacity,
+        'refill_frequency': args.refill_frequency,
+        'refill_amount': max(1, round(args.rate * args.refill_frequency)),
+    }
+
+
+def names(args: argparse.Namespace) -> list[str]:
+    run_id = uuid4().hex[:8]
+    return [f'bench-{run_id}-{i}' for i in range(args.keys)]
+
+
+def run_sync(args: argparse.Namespace, limiters: list[Any], cycle: Callable[[Any], float]) -> tuple[list[float], float]:
+    """Run `cycle` on the limiters from `concurrency` threads, until the duration is up."""
+
+    def worker(offset: int) -> list[float]:
+        latencies = []
+        i = offset
+        while time.perf_counter() < deadline:
+            latencies.append(cycle(limiters[i % len(limiters)]))
+            i += 1
+        return latencies
+
+    start = time.perf_counter()
+    deadline = start + args.duration
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        results = list(pool.map(worker, range(args.concurrency)))
+    return [latency for latencies in results for latency in latencies], time.perf_counter() - start
+
+
+async def run_async(
+    args: argparse.Namespace, limiters: list[Any], cycle: Callable[[Any], Awaitable[float]]
+) -> tuple[list[float], float]:
+    """Run `cycle` on the limiters from `concurrency` tasks, until the duration is up."""
+
+    async def worker(offset: int) -> list[float]:
+        latencies = []
+        i = offset
+        while time.perf_counter() < deadline:
+            latencies.append(await cycle(limiters[i % len(limiters)]))
+            i += 1
+        return latencies
+
+    start = time.perf_counter()
+    deadline = start + args.duration
+    results = await asyncio.gather(*(worker(offset) for offset in range(args.concurrency)))
+    return [latency for latencies in results for latency in latencies], time.perf_counter() - start
+
+
+def sync_token_bucket(args: argparse.Namespace, backend: Backend) -> tuple[list[float], float, dict[str, Any]]:
+    connection = backend.sync()
+    buckets = [SyncTokenBucket(name=name, connection=connection, **bucket_config(args)) for name in names(args)]
+
+    def cycle(bucket: SyncTokenBucket) -> float:
+        start = time.perf_counter()
+        bucket.acquire()
+        return time.perf_counter() - start
+
+    latencies, elapsed = run_sync(args, buckets, cycle)
+    return latencies, elapsed, bucket_accuracy(args, len(latencies), elapsed)
+
+
+def async_token_bucket(args: argparse.Namespace, backend: Backend) -> tuple[list[float], float, dict[str, Any]]:
+    async def main() -> tuple[list[float], float]:
+        connection = backend.async_()
+        buckets = [AsyncTokenBucket(name=name, connection=connection, **bucket_config(args)) for name in names(args)]
+
+        async def cycle(bucket: AsyncTokenBucket) -> float:
+            start = time.perf_counter()
+            await bucket.acquire()
+            return time.perf_counter() - start
+
+        return await run_async(args, buckets, cycle)
+
+    latencies, elapsed = asyncio.run(main())
+    return latencies, elapsed, bucket_accuracy(args, len(latencies), elapsed)
+
+
+def bucket_accuracy(args: argparse.Namespace, acquired: int, elapsed: float) -> dict[str, Any]:
+    # Each bucket starts out full, then refills at the configured rate
+    config = bucket_config(args)
+    allowed = args.keys * (config['capacity'] + config['refill_amount'] * int(elapsed / config['refill_frequency']))
+    return {'acquired': acquired, 'allowed': allowed, 'ratio': acquired / allowed}
+
+
+def sync_semaphore(args: argparse.Namespace, backend: Backend) -> tuple[list[float], float, dict[str, Any]]:
+    connection = backend.sync()
+    semaphores = [SyncSemaphore(name=name, capacity=args.capacity, connection=connection) for name in names(args)]
+    tracker = ConcurrencyTracker()
+
+    def cycle(semaphore: SyncSemaphore) -> float:
+        start = time.perf_counter()
+        with semaphore:
+            latency = time.perf_counter() - start
+            with tracker.hold(semaphore.key):
+                time.sleep(args.hold)
+        return latency
+
+    latencies, elapsed = run_sync(args, semaphores, cycle)
+    return latencies, elapsed, semaphore_accuracy(args, tracker)
+
+
+def async_semaphore(args: argparse.Namespace, backend: Backend) -> tuple[list[float], float, dict[str, Any]]:
+    tracker = ConcurrencyTracker()
+
+    async def main() -> tuple[list[float], float]:
+        connection = backend.async_()
+        semaphores = [AsyncSemaphore(name=name, capacity=args.capacity, connection=connection) for name in names(args)]
+
+        async def cycle(semaphore: AsyncSemaphore) -> float:
+            start = time.perf_counter()
+            async with semaphore:
+                latency = time.perf_counter() - start
+                with tracker.hold(semaphore.key):
+                    await asyncio.sleep(args.hold)
+            return latency
+
+        return await run_async(args, semaphores, cycle)
+
+    latencies, elapsed = asyncio.run(main())
+    return latencies, elapsed, semaphore_accuracy(args, tracker)
+
+
+def semaphore_accuracy(args: argparse.Namespace, tracker: ConcurrencyTracker) -> dict[str, Any]:
+    return {'max_holders': tracker.max, 'capacity': args.capacity, 'ratio': tracker.max / args.capacity}
+
+
+BENCHMARKS = {
+    'sync-token-bucket': sync_token_bucket,
+    'async-token-bucket': async_token_bucket,
+    'sync-semaphore': sync_semaphore,
+    'async-semaphore': async_semaphore,
+}
+
+
+def percentile(latencies: list[float], q: float) -> float:
+    return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+
+def run(args: argparse.Namespace, backend: Backend, limiter: str) -> dict[str, Any]:
+    with CommandCounter() as counter:
+        latencies, elapsed, accuracy = BENCHMARKS[limiter](args, backend)
+
+    latencies.sort()
+    acquires = len(latencies)
+    return {
+        'limiter': limiter,
+        'backend': backend.label,
+        'concurrency': args.concurrency,
+        'keys': args.keys,
+        'duration': round(elapsed, 3),
+        'acquires': acquires,
+        'acquires_per_second': round(acquires / elapsed, 1),
+        'latency_ms': {
+            'mean': round(statistics.fmean(latencies) * 1000, 3),
+            'p50': round(percentile(latencies, 0.5) * 1000, 3),
+            'p99': round(percentile(latencies, 0.99) * 1000, 3),
+            'p999': round(percentile(latencies, 0.999) * 1000, 3),
+        },
+        'round_trips_per_acquire': round(counter.round_trips / acquires, 3),
+        'commands_per_acquire': round(counter.commands / acquires, 3),
+        'accuracy': accuracy,
+        'timestamp': datetime.now(UTC).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'redis_py': version('redis'),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--backend', choices=['redis', 'spawn', 'fakeredis', 'memory'], default='redis')
+    parser.add_argument('--url', default='redis://127.0.0.1:6378', help='server to use with the redis backend')
+    parser.add_argument('--cluster', action='store_true', help='connect to --url with RedisCluster')
+    parser.add_argument('--limiter', choices=LIMITERS, action='append', help='limiters to run (default: all)')
+    parser.add_argument('--concurrency', type=int, default=8, help='threads or tasks per limiter')
+    parser.add_argument('--keys', type=int, default=1, help='number of limiter keys to spread acquires over')
+    parser.add_argument('--duration', type=float, default=5.0, help='seconds to run each limiter for')
+    parser.add_argument('--capacity', type=int, default=10, help='bucket or semaphore capacity')
+    parser.add_argument('--rate', type=float, default=1000, help='token bucket refills per second, per key')
+    parser.add_argument('--refill-frequency', type=float, default=0.01, help='seconds between token bucket refills')
+    parser.add_argument('--hold', type=float, default=0.001, help='seconds to hold each semaphore for')
+    parser.add_argument('--output', help='append results to this file, instead of printing them')
+    args = parser.parse_args()
+
+    with redis_backend(args) as backend:
+        for limiter in args.limiter or LIMITERS:
+            line = json.dumps(run(args, backend, limiter))
+            if args.output:
+                with open(args.output, 'a') as f:
+                    f.write(line + '\n')
+            else:
+                print(line, flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,52 @@
-from limiters.exceptions import MaxSleepExceededError
+# The limiter modules import the exceptions from here, so they go first
+from limiters.exceptions import LeaseExpiredError, MaxSleepExceededError  # isort: split
+
+from limiters.adaptive import (
+    AsyncAdaptiveLeaseSemaphore,
+    AsyncAdaptiveLimit,
+    AsyncAdaptiveTokenBucket,
+    Outcome,
+    SyncAdaptiveLeaseSemaphore,
+    SyncAdaptiveLimit,
+    SyncAdaptiveTokenBucket,
+)
+from limiters.base import AcquireResult, KeyLayout
+from limiters.composite import AsyncCompositeLimiter, SyncCompositeLimiter
+from limiters.gcra import AsyncGCRA, SyncGCRA
+from limiters.lease_semaphore import AsyncLeaseSemaphore, Lease, SyncLeaseSemaphore
+from limiters.scripts import load_scripts, load_scripts_async
 from limiters.semaphore import AsyncSemaphore, SyncSemaphore
+from limiters.sliding_window import AsyncSlidingWindow, SyncSlidingWindow
 from limiters.token_bucket import AsyncTokenBucket, SyncTokenBucket
+from limiters.weighted_semaphore import AsyncWeightedSemaphore, SyncWeightedSemaphore
 
-__all__ = ('AsyncSemaphore', 'AsyncTokenBucket', 'MaxSleepExceededError', 'SyncSemaphore', 'SyncTokenBucket')
+__all__ = (
+    'AcquireResult',
+    'AsyncAdaptiveLeaseSemaphore',
+    'AsyncAdaptiveLimit',
+    'AsyncAdaptiveTokenBucket',
+    'AsyncCompositeLimiter',
+    'AsyncGCRA',
+    'AsyncLeaseSemaphore',
+    'AsyncSemaphore',
+    'AsyncSlidingWindow',
+    'AsyncTokenBucket',
+    'AsyncWeightedSemaphore',
+    'KeyLayout',
+    'Lease',
+    'LeaseExpiredError',
+    'MaxSleepExceededError',
+    'Outcome',
+    'SyncAdaptiveLeaseSemaphore',
+    'SyncAdaptiveLimit',
+    'SyncAdaptiveTokenBucket',
+    'SyncCompositeLimiter',
+    'SyncGCRA',
+    'SyncLeaseSemaphore',
+    'SyncSemaphore',
+    'SyncSlidingWindow',
+    'SyncTokenBucket',
+    'SyncWeightedSemaphore',
+    'load_scripts',
+    'load_scripts_async',
+)
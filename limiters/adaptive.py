@@ -0,0 +1,212 @@
+"""
+Limits that adapt to feedback from the upstream they protect.
+
+An `AdaptiveLimit` is a number shared through Redis, which callers adjust by reporting
+how their requests went: it goes up additively on success, and down multiplicatively
+when the upstream throttles them or times out (AIMD). Every process reports to, and
+reads back from, the same key, so the whole fleet converges on the same limit.
+
+The adaptive token buckets use the limit as their capacity and refill amount, and the
+adaptive lease semaphores use it as their capacity. Each limiter uses the limit as of
+its last report, so processes should report outcomes regularly, or call `current()`.
+"""
+
+from dataclasses import dataclass
+from enum import StrEnum
+from typing import Any, ClassVar
+
+from pydantic import BaseModel, Field, PrivateAttr, root_validator, validator
+
+from limiters.base import AsyncLuaScriptBase, KeyLayout, SyncLuaScriptBase
+from limiters.lease_semaphore import AsyncLeaseSemaphore, SyncLeaseSemaphore
+from limiters.token_bucket import AsyncTokenBucket, SyncTokenBucket
+
+
+class Outcome(StrEnum):
+    SUCCESS = 'success'
+    THROTTLED = 'throttled'
+    TIMEOUT = 'timeout'
+
+
+@dataclass(frozen=True, slots=True)
+class Adjustment:
+    """A change to the whole-number limit, and the outcome that caused it."""
+
+    at: float
+    outcome: Outcome
+    before: float
+    after: float
+
+    @classmethod
+    def parse(cls, entry: str | bytes) -> 'Adjustment':
+        at, outcome, before, after = (entry.decode() if isinstance(entry, bytes) else entry).split(' ')
+        return cls(int(at) / 1000, Outcome(outcome), float(before), float(after))
+
+
+class AdaptiveLimitBase(BaseModel):
+    name: str
+    initial: int = Field(gt=0)
+    minimum: int = Field(gt=0, default=1)
+    maximum: int = Field(gt=0)
+    increase: float = Field(gt=0, default=1.0)
+    decrease: float = Field(gt=0, lt=1, default=0.5)
+    cooldown: float = Field(ge=0, default=1.0)
+    history_size: int = Field(gt=0, default=100)
+    expiry: int = Field(gt=0, default=86400)
+    key_layout: KeyLayout = KeyLayout.SHARED
+
+    _key: str = PrivateAttr()
+    _value: float = PrivateAttr()
+
+    @validator('maximum')
+    def maximum_above_minimum(cls, v: int, values: dict[str, Any]) -> int:
+        if 'minimum' in values and v < values['minimum']:
+            raise ValueError('maximum cannot be lower than the minimum')
+        if 'initial' in values and not values.get('minimum', 1) <= values['initial'] <= v:
+            raise ValueError('initial must be between the minimum and maximum')
+        return v
+
+    def _post_init(self) -> None:
+        self._key = self.key_layout.key('adaptive-limit', self.name)
+        self._value = self.initial
+
+    @property
+    def key(self) -> str:
+        return self._key
+
+    @property
+    def history_key(self) -> str:
+        return f'{self._key}-history'
+
+    @property
+    def value(self) -> int:
+        """The whole-number limit, as of the last report or call to `current()` in this process."""
+        return int(self._value)
+
+    def _script_args(self, outcome: Outcome | str) -> list[Any]:
+        return [
+            Outcome(outcome) if outcome else '',
+            self.initial,
+            self.minimum,
+            self.maximum,
+            self.increase,
+            self.decrease,
+            int(self.cooldown * 1000),
+            self.history_size,
+            self.expiry,
+        ]
+
+    def _update(self, result: Any) -> int:
+        self._value = float(result)
+        return self.value
+
+    def __str__(self) -> str:
+        return f'Adaptive limit instance for {self.key}'
+
+
+class SyncAdaptiveLimit(AdaptiveLimitBase, SyncLuaScriptBase):
+    script_name: ClassVar[str] = 'adaptive_limit.lua'
+
+    def report(self, outcome: Outcome | str) -> int:
+        """Adjust the shared limit for the outcome of a request, and return the new limit."""
+        return self._update(self.script(keys=[self.key, self.history_key], args=self._script_args(outcome)))
+
+    def current(self) -> int:
+        """Read the shared limit from Redis."""
+        return self._update(self.script(keys=[self.key, self.history_key], args=self._script_args('')))
+
+    def history(self) -> list[Adjustment]:
+        """The most recent changes to the whole-number limit, newest first."""
+        return [Adjustment.parse(entry) for entry in self.connection.lrange(self.history_key, 0, -1)]  # type: ignore[union-attr]
+
+
+class AsyncAdaptiveLimit(AdaptiveLimitBase, AsyncLuaScriptBase):
+    script_name: ClassVar[str] = 'adaptive_limit.lua'
+
+    async def report(self, outcome: Outcome | str) -> int:
+        """Adjust the shared limit for the outcome of a request, and return the new limit."""
+        return self._update(await self.script(keys=[self.key, self.history_key], args=self._script_args(outcome)))
+
+    async def current(self) -> int:
+        """Read the shared limit from Redis."""
+        return self._update(await self.script(keys=[self.key, self.history_key], args=self._script_args('')))
+
+    async def history(self) -> list[Adjustment]:
+        """The most recent changes to the whole-number limit, newest first."""
+        entries = await self.connection.lrange(self.history_key, 0, -1)  # type: ignore[union-attr]
+        return [Adjustment.parse(entry) for entry in entries]
+
+
+def _default_capacity(values: dict[str, Any], *fields: str) -> dict[str, Any]:
+    """Default the limiter's capacity fields to the limit's maximum, which is what they're validated against."""
+    if (limit := values.get('limit')) is not None:
+        for field in fields:
+            values.setdefault(field, limit.maximum)
+    return values
+
+
+def _check_lease_size(limit: AdaptiveLimitBase, values: dict[str, Any]) -> None:
+    if values.get('lease_size', 1) > limit.minimum:
+        raise ValueError("lease_size cannot exceed the limit's minimum")
+
+
+class SyncAdaptiveTokenBucket(SyncTokenBucket):
+    """A token bucket whose capacity and refill amount are both the current value of `limit`."""
+
+    limit: SyncAdaptiveLimit
+
+    @root_validator(pre=True)
+    def capacity_from_limit(cls, values: dict[str, Any]) -> dict[str, Any]:
+        return _default_capacity(values, 'capacity', 'refill_amount')
+
+    @validator('limit')
+    def lease_size_within_limit(cls, v: SyncAdaptiveLimit, values: dict[str, Any]) -> SyncAdaptiveLimit:
+        _check_lease_size(v, values)
+        return v
+
+    def _rate(self) -> tuple[int, int]:
+        return self.limit.value, self.limit.value
+
+
+class AsyncAdaptiveTokenBucket(AsyncTokenBucket):
+    """A token bucket whose capacity and refill amount are both the current value of `limit`."""
+
+    limit: AsyncAdaptiveLimit
+
+    @root_validator(pre=True)
+    def capacity_from_limit(cls, values: dict[str, Any]) -> dict[str, Any]:
+        return _default_capacity(values, 'capacity', 'refill_amount')
+
+    @validator('limit')
+    def lease_size_within_limit(cls, v: AsyncAdaptiveLimit, values: dict[str, Any]) -> AsyncAdaptiveLimit:
+        _check_lease_size(v, values)
+        return v
+
+    def _rate(self) -> tuple[int, int]:
+        return self.limit.value, self.limit.value
+
+
+class SyncAdaptiveLeaseSemaphore(SyncLeaseSemaphore):
+    """A lease semaphore whose capacity is the current value of `limit`."""
+
+    limit: SyncAdaptiveLimit
+
+    @root_validator(pre=True)
+    def capacity_from_limit(cls, values: dict[str, Any]) -> dict[str, Any]:
+        return _default_capacity(values, 'capacity')
+
+    def _script_args(self, holder: str) -> list[int | str]:
+        return [self.limit.value, holder, self._lease_ms()]
+
+
+class AsyncAdaptiveLeaseSemaphore(AsyncLeaseSemaphore):
+    """A lease semaphore whose capacity is the current value of `limit`."""
+
+    limit: AsyncAdaptiveLimit
+
+    @root_validator(pre=True)
+    def capacity_from_limit(cls, values: dict[str, Any]) -> dict[str, Any]:
+        return _default_capacity(values, 'capacity')
+
+    def _script_args(self, holder: str) -> list[int | str]:
+        return [self.limit.value, holder, self._lease_ms()]
@@ -0,0 +1,80 @@
+--- Script called from the AdaptiveLimit implementation, to adjust a shared limit.
+---
+--- The limit goes up additively on success, and down multiplicatively when
+--- the upstream throttles us or times out (AIMD, as in TCP congestion control).
+--- Each success adds `increase / limit`, so a full limit's worth of successes
+--- adds `increase`. Decreases happen at most once per cooldown, so one overload
+--- reported by many callers at once only cuts the limit once.
+---
+--- The state is stored as a string: "<limit> <last decrease>", where the last
+--- decrease is a millisecond timestamp. Changes to the whole-number limit are
+--- recorded in a capped list, as "<timestamp> <outcome> <before> <after>".
+---
+--- keys:
+--- * key: The key holding the limit
+--- * history: The key holding the adjustment history
+---
+--- args:
+--- * outcome: `success`, `throttled` or `timeout`, or empty to only read the limit
+--- * initial: The limit to start from
+--- * minimum: The lowest the limit can go
+--- * maximum: The highest the limit can go
+--- * increase: How much a full limit's worth of successes adds
+--- * decrease: The factor to multiply the limit by when throttled
+--- * cooldown: The minimum time between decreases, in milliseconds
+--- * history_size: How many adjustments to keep
+--- * expiry: How long to keep the state after the last report, in seconds
+---
+--- returns:
+--- * The current limit, as a string, since Lua numbers are truncated to integers in replies
+
+redis.replicate_commands()
+
+local key = KEYS[1]
+local history = KEYS[2]
+local outcome = ARGV[1]
+local initial = tonumber(ARGV[2])
+local minimum = tonumber(ARGV[3])
+local maximum = tonumber(ARGV[4])
+local increase = tonumber(ARGV[5])
+local decrease = tonumber(ARGV[6])
+local cooldown = tonumber(ARGV[7])
+local history_size = tonumber(ARGV[8])
+local expiry = tonumber(ARGV[9])
+
+local limit = initial
+local decreased = 0
+local state = redis.call('GET', key)
+if state then
+    local stored_limit, stored_decreased = string.match(state, '(%S+) (%S+)')
+    limit = tonumber(stored_limit)
+    decreased = tonumber(stored_decreased)
+end
+
+-- Keep within the bounds, in case they've been changed since the limit was stored
+limit = math.min(math.max(limit, minimum), maximum)
+
+if outcome == '' then
+    return tostring(limit)
+end
+
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+
+local adjusted = limit
+if outcome == 'success' then
+    adjusted = math.min(limit + increase / limit, maximum)
+elseif now - decreased >= cooldown then
+    adjusted = math.max(limit * decrease, minimum)
+    decreased = now
+end
+
+redis.call('SET', key, string.format('%.17g %d', adjusted, decreased), 'EX', expiry)
+
+if math.floor(adjusted) ~= math.floor(limit) then
+    redis.call('LPUSH', history, string.format('%d %s %.17g %.17g', now, outcome, limit, adjusted))
+    redis.call('LTRIM', history, 0, history_size - 1)
+    redis.call('EXPIRE', history, expiry)
+end
+
+return tostring(adjusted)
@@ -1,49 +1,181 @@
-from pathlib import Path
+import copy
+import time
+from collections.abc import Iterable, Sequence
+from dataclasses import dataclass
+from enum import Enum, StrEnum
 from typing import TYPE_CHECKING, Any, ClassVar
 
-from pydantic import BaseModel
+from pydantic import BaseModel, validator
 from redis import Redis as SyncRedis
 from redis.asyncio import Redis as AsyncRedis
 from redis.asyncio.cluster import RedisCluster as AsyncRedisCluster
 from redis.cluster import RedisCluster as SyncRedisCluster
-from redis.commands.core import AsyncScript, Script
 
+from limiters.memory import SCRIPTS, AsyncMemoryBackend, SyncMemoryBackend
+from limiters.metrics import LimiterMetrics
+from limiters.scripts import get_script
 
-class SyncLuaScriptBase(BaseModel):
+# Validated limiter state, keyed on the class and constructor arguments
+_validation_cache: dict[Any, tuple[dict[str, Any], set[str], dict[str, Any]]] = {}
+VALIDATION_CACHE_SIZE = 4096
+
+# Argument types which are safe to keep in the cache, since they're small, immutable values
+_CACHEABLE_TYPES = (str, int, float, Enum, type(None))
+
+
+class KeyLayout(StrEnum):
+    """
+    How limiter keys are hash-tagged, which decides how they're spread over a Redis cluster.
+
+    With the `shared` layout, every key is tagged `{limiter}`, so all limiters hash to
+    the same slot, on the same node. The `per-limiter` layout tags keys by limiter name,
+    as `{limiter:<name>}`, which spreads limiters over the cluster while keeping each
+    limiter's own keys in one slot, as its Lua scripts require.
+    """
+
+    SHARED = 'shared'
+    PER_LIMITER = 'per-limiter'
+
+    def key(self, kind: str, name: str) -> str:
+        """Return the key for a limiter of the given kind (e.g., `semaphore`)."""
+        if self is KeyLayout.PER_LIMITER:
+            return f'{{limiter:{name}}}:{kind}'
+        return f'{{limiter}}:{kind}:{name}'
+
+
+@dataclass(frozen=True, slots=True)
+class AcquireResult:
+    """
+    The outcome of a non-blocking `try_acquire` call.
+
+    Truthy if the tokens were granted. Otherwise, `retry_after` is how many
+    seconds until they would be available, e.g., for a `Retry-After` header.
+    """
+
+    granted: bool
+    retry_after: float = 0.0
+
+    def __bool__(self) -> bool:
+        return self.granted
+
+
+class CachedValidationModel(BaseModel):
+    """
+    A model which only runs pydantic validation once per distinct configuration.
+
+    Limiters are often created on the fly, e.g., once per request, for a limited
+    set of tenants or API tokens. Since they are immutable in practice, we can
+    reuse the result of validating identical constructor arguments, along with
+    any private state derived from them in `_post_init` (e.g., key names).
+
+    The connection is left out of the cache key, apart from its type, so we
+    never hold on to connections after the limiter is gone. Limiters created
+    with any other argument that isn't a plain value (e.g., metrics, or other
+    limiters) aren't cached at all, for the same reason. Each limiter gets its
+    own copy of the cached private state.
+    """
+
+    def __init__(self, **data: Any) -> None:
+        connection = data.get('connection')
+        arguments = [(k, v) for k, v in data.items() if k != 'connection']
+        if not all(isinstance(v, _CACHEABLE_TYPES) for _, v in arguments):
+            # The cache would hold on to these (and can't hash some of them); validate as normal
+            super().__init__(**data)
+            self._post_init()
+            return
+
+        cache_key = (self.__class__, connection.__class__, frozenset([(k, v.__class__, v) for k, v in arguments]))
+        if (cached := _validation_cache.get(cache_key)) is not None:
+            values, fields_set, private = cached
+            object.__setattr__(self, '__dict__', values | {'connection': connection})
+            object.__setattr__(self, '__fields_set__', set(fields_set))
+            for name, value in private.items():
+                object.__setattr__(self, name, copy.copy(value))
+            return
+
+        super().__init__(**data)
+        self._post_init()
+        if len(_validation_cache) >= VALIDATION_CACHE_SIZE:
+            _validation_cache.clear()
+        _validation_cache[cache_key] = (
+            {k: v for k, v in self.__dict__.items() if k != 'connection'},
+            set(self.__fields_set__),
+            {name: copy.copy(getattr(self, name)) for name in self.__private_attributes__ if hasattr(self, name)},
+        )
+
+    def _post_init(self) -> None:
+        """Derive private state from the validated fields."""
+        pass
+
+
+def _check_memory_backend(cls: type[Any], connection: Any) -> Any:
+    """Refuse a memory backend for limiters whose script it has no Python version of."""
+    if isinstance(connection, SyncMemoryBackend | AsyncMemoryBackend) and cls.script_name not in SCRIPTS:
+        raise ValueError(f'{cls.__name__} is not supported by the memory backends, only token buckets and semaphores')
+    return connection
+
+
+class SyncLuaScriptBase(CachedValidationModel):
     if TYPE_CHECKING:
-        connection: SyncRedis[str] | SyncRedisCluster[str]
+        connection: SyncRedis[str] | SyncRedisCluster[str] | SyncMemoryBackend
     else:
-        connection: SyncRedis | SyncRedisCluster
+        connection: SyncRedis | SyncRedisCluster | SyncMemoryBackend
+    metrics: LimiterMetrics | None = None
 
     script_name: ClassVar[str]
-    script: Script = None  # type: ignore[assignment]
 
     class Config:
         arbitrary_types_allowed = True
+        # Use limiters passed to other models (e.g., composite limiters) as they are, rather than copies
+        copy_on_model_validation = 'none'
+
+    @validator('connection')
+    def memory_backend_runs_script(cls, v: Any) -> Any:
+        return _check_memory_backend(cls, v)
 
-    def __init__(self, **kwargs: Any) -> None:
-        super().__init__(**kwargs)
+    def script(self, keys: Sequence[str], args: Iterable[Any]) -> Any:
+        """Run the limiter's Lua script, using the process-wide script registry."""
+        return self.run_script(self.script_name, keys, args)
 
-        # Load script on initialization
-        with open(Path(__file__).parent / self.script_name) as f:
-            self.script = self.connection.register_script(f.read())  # type: ignore[union-attr]
+    def run_script(self, script_name: str, keys: Sequence[str], args: Iterable[Any]) -> Any:
+        """Run one of the package's Lua scripts on the limiter's connection."""
+        if self.metrics is None:
+            return get_script(script_name).run(self.connection, keys, args)
+        start = time.perf_counter()
+        try:
+            return get_script(script_name).run(self.connection, keys, args)
+        finally:
+            self.metrics.redis_call(self, time.perf_counter() - start)
 
 
-class AsyncLuaScriptBase(BaseModel):
+class AsyncLuaScriptBase(CachedValidationModel):
     if TYPE_CHECKING:
-        connection: AsyncRedis[str] | AsyncRedisCluster[str]
+        connection: AsyncRedis[str] | AsyncRedisCluster[str] | AsyncMemoryBackend
     else:
-        connection: AsyncRedis | AsyncRedisCluster
+        connection: AsyncRedis | AsyncRedisCluster | AsyncMemoryBackend
+    metrics: LimiterMetrics | None = None
 
     script_name: ClassVar[str]
-    script: AsyncScript = None  # type: ignore[assignment]
 
     class Config:
         arbitrary_types_allowed = True
+        # Use limiters passed to other models (e.g., composite limiters) as they are, rather than copies
+        copy_on_model_validation = 'none'
+
+    @validator('connection')
+    def memory_backend_runs_script(cls, v: Any) -> Any:
+        return _check_memory_backend(cls, v)
 
-    def __init__(self, **kwargs: Any) -> None:
-        super().__init__(**kwargs)
+    async def script(self, keys: Sequence[str], args: Iterable[Any]) -> Any:
+        """Run the limiter's Lua script, using the process-wide script registry."""
+        return await self.run_script(self.script_name, keys, args)
 
-        # Load script on initialization
-        with open(Path(__file__).parent / self.script_name) as f:
-            self.script = self.connection.register_script(f.read())  # type: ignore[union-attr]
+    async def run_script(self, script_name: str, keys: Sequence[str], args: Iterable[Any]) -> Any:
+        """Run one of the package's Lua scripts on the limiter's connection."""
+        if self.metrics is None:
+            return await get_script(script_name).run_async(self.connection, keys, args)
+        start = time.perf_counter()
+        try:
+            return await get_script(script_name).run_async(self.connection, keys, args)
+        finally:
+            self.metrics.redis_call(self, time.perf_counter() - start)
@@ -0,0 +1,54 @@
+"""
+A local circuit for limiters which are known to be busy.
+
+When a call fails because it would have had to sleep for longer than
+`max_sleep`, we learn that the limiter has no tokens to hand out until
+at least then. Rather than have every caller in the process ask Redis
+again, just to be told to wait even longer, we remember that time per
+connection and limiter key, so callers who won't wait that long can fail
+right away. Entries are forgotten once the time has passed, or when we're
+remembering too many keys, starting with the ones tripped longest ago.
+"""
+
+import threading
+import time
+import weakref
+from typing import Any
+
+# The maximum number of keys to remember, before forgetting the ones that are no longer busy,
+# and then the ones tripped longest ago
+CIRCUIT_SIZE = 4096
+
+# When each limiter key is busy until, on the monotonic clock, per connection,
+# since the same key on different Redis instances is a different limiter.
+# Connections are held by weak reference, which, unlike their ID, never matches
+# a connection created after they're gone. Entries are kept in the order they
+# were tripped, and are shared by every thread, so they're only used under the lock.
+_busy_until: dict[tuple[weakref.ref[Any], str], float] = {}
+_lock = threading.Lock()
+
+
+def trip(connection: Any, key: str, wait: float) -> None:
+    """Remember that the limiter won't have tokens for another `wait` seconds."""
+    now = time.monotonic()
+    circuit_key = (weakref.ref(connection), key)
+    with _lock:
+        until = max(_busy_until.pop(circuit_key, 0.0), now + wait)
+        if len(_busy_until) >= CIRCUIT_SIZE:
+            for stale in [k for k, busy_until in _busy_until.items() if busy_until <= now]:
+                del _busy_until[stale]
+        while len(_busy_until) >= CIRCUIT_SIZE:
+            del _busy_until[next(iter(_busy_until))]
+        _busy_until[circuit_key] = until
+
+
+def busy_for(connection: Any, key: str) -> float:
+    """Return how many seconds the limiter is known to be busy for, or 0 if it isn't."""
+    circuit_key = (weakref.ref(connection), key)
+    with _lock:
+        if (until := _busy_until.get(circuit_key)) is None:
+            return 0.0
+        if (remaining := until - time.monotonic()) > 0:
+            return remaining
+        del _busy_until[circuit_key]
+        return 0.0
@@ -0,0 +1,113 @@
+--- Script called from the CompositeLimiter implementation, to acquire from
+--- several token buckets and semaphores at once, when all their keys are
+--- in the same slot.
+---
+--- Lua scripts are run atomically by default, and since redis
+--- is single threaded, there are no race conditions to worry about.
+---
+--- Everything is checked before anything is taken, and nothing is taken
+--- (or reserved) unless every limiter can go ahead right away, so we never
+--- hold on to tokens from one limiter while waiting for another.
+---
+--- keys, for each limiter in order:
+--- * token buckets: the bucket key
+--- * semaphores: the list key and the exists key
+---
+--- args, for each limiter in order, its kind, followed by:
+--- * token-bucket: capacity, refill_amount, refill_frequency, seconds, microseconds, tokens,
+---   ttl, packed (as for token_bucket.lua)
+--- * semaphore: capacity, expiry
+---
+--- returns:
+--- * Whether everything was acquired (1 or 0)
+--- * The number of milliseconds until the token buckets have enough tokens
+--- * Whether any semaphore is full (1 or 0)
+
+redis.replicate_commands()
+
+-- include: token_bucket.lua
+
+-- Work out when a token bucket can hand out the tokens, and the state to save if it does.
+-- This is the same as token_bucket.lua, without reserving a future slot.
+local function check_bucket(key, capacity, refill_amount, time_between_slots, seconds, microseconds, requested, ttl, packed)
+    if not seconds then
+        local time = redis.call('TIME')
+        seconds = tonumber(time[1])
+        microseconds = tonumber(time[2])
+    end
+    local now = (seconds * 1000) + (microseconds / 1000)
+
+    local slot, tokens, credits, _, due = reserve_slot(
+        redis.call('GET', key), now, capacity, refill_amount, time_between_slots, requested
+    )
+    return math.max(math.ceil(due - now), 0),
+        encode_state(slot, tokens, packed, credits),
+        state_expiry(ttl, slot, now, capacity, refill_amount, time_between_slots)
+end
+
+local buckets = {}
+local semaphores = {}
+local wait = 0
+local full = 0
+
+-- Check every limiter
+local key_index = 1
+local arg_index = 1
+while arg_index <= #ARGV do
+    local kind = ARGV[arg_index]
+    if kind == 'token-bucket' then
+        local key = KEYS[key_index]
+        local bucket_wait, state, ttl = check_bucket(
+            key,
+            tonumber(ARGV[arg_index + 1]),
+            tonumber(ARGV[arg_index + 2]),
+            tonumber(ARGV[arg_index + 3]) * 1000,
+            tonumber(ARGV[arg_index + 4]),
+            tonumber(ARGV[arg_index + 5]),
+            tonumber(ARGV[arg_index + 6]),
+            tonumber(ARGV[arg_index + 7]),
+            ARGV[arg_index + 8] == '1'
+        )
+        wait = math.max(wait, bucket_wait)
+        table.insert(buckets, { key, state, ttl })
+        key_index = key_index + 1
+        arg_index = arg_index + 9
+    elseif kind == 'semaphore' then
+        local key = KEYS[key_index]
+        local exists = KEYS[key_index + 1]
+        local capacity = tonumber(ARGV[arg_index + 1])
+
+        -- Create the semaphore, like semaphore.lua, if this is the first time it's used
+        if redis.call('SETNX', exists, 1) == 1 then
+            local args = { 'RPUSH', key }
+            for _ = 1, capacity do
+                table.insert(args, 1)
+            end
+            redis.call(unpack(args))
+        end
+
+        if redis.call('LLEN', key) == 0 then
+            full = 1
+        end
+        table.insert(semaphores, { key, exists, tonumber(ARGV[arg_index + 2]) })
+        key_index = key_index + 2
+        arg_index = arg_index + 3
+    else
+        return redis.error_reply('Unknown limiter kind: ' .. tostring(kind))
+    end
+end
+
+if wait > 0 or full == 1 then
+    return { 0, wait, full }
+end
+
+-- Everything is available, so take it
+for _, bucket in ipairs(buckets) do
+    redis.call('SET', bucket[1], bucket[2], 'PX', bucket[3])
+end
+for _, semaphore in ipairs(semaphores) do
+    redis.call('LPOP', semaphore[1])
+    redis.call('EXPIRE', semaphore[1], semaphore[3])
+    redis.call('EXPIRE', semaphore[2], semaphore[3])
+end
+return { 1, 0, 0 }
@@ -0,0 +1,243 @@
+import asyncio
+import logging
+import time
+from collections.abc import Sequence
+from types import TracebackType
+from typing import Any
+
+from pydantic import BaseModel, Field, PrivateAttr, validator
+from redis.asyncio.cluster import RedisCluster as AsyncRedisCluster
+from redis.cluster import RedisCluster as SyncRedisCluster
+from redis.crc import key_slot
+
+from limiters import MaxSleepExceededError
+from limiters.memory import AsyncMemoryBackend, SyncMemoryBackend
+from limiters.scripts import get_script
+from limiters.semaphore import AsyncSemaphore, SemaphoreBase, SyncSemaphore
+from limiters.token_bucket import AsyncTokenBucket, SyncTokenBucket, TokenBucketBase
+
+logger = logging.getLogger(__name__)
+
+
+class CompositeLimiterBase(BaseModel):
+    """
+    Acquire from several token buckets and semaphores at once.
+
+    Nothing is taken from any of the limiters unless all of them can go ahead,
+    so we never hold on to tokens from one limiter while waiting for another.
+    When all the keys are on the same connection and in the same cluster slot,
+    everything is checked and taken in a single script call. Otherwise, we
+    take from each limiter in turn, without waiting, and give back what we
+    took if any of them can't go ahead.
+    """
+
+    limiters: Sequence[TokenBucketBase | SemaphoreBase]
+    max_sleep: float = Field(ge=0, default=0.0)
+    poll_interval: float = Field(gt=0, default=0.05)
+
+    _keys: list[str] = PrivateAttr()
+    _single_script: bool = PrivateAttr()
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    @validator('limiters')
+    def at_least_one_limiter(cls, v: Sequence[TokenBucketBase | SemaphoreBase]) -> Sequence[Any]:
+        if not v:
+            raise ValueError('at least one limiter is required')
+        return v
+
+    @validator('limiters')
+    def not_one_memory_backend(cls, v: Sequence[TokenBucketBase | SemaphoreBase]) -> Sequence[Any]:
+        # Limiters sharing a connection are checked in one script, which the memory backends can't run
+        connection = v[0].connection  # type: ignore[union-attr]
+        if isinstance(connection, SyncMemoryBackend | AsyncMemoryBackend) and all(
+            limiter.connection is connection  # type: ignore[union-attr]
+            for limiter in v
+        ):
+            raise ValueError(
+                'composite limiters are not supported by the memory backends, unless each limiter has its own'
+            )
+        return v
+
+    def __init__(self, **data: Any) -> None:
+        super().__init__(**data)
+        self._keys = []
+        for limiter in self.limiters:
+            self._keys += [limiter.key, limiter.exists] if isinstance(limiter, SemaphoreBase) else [limiter.key]
+
+        connection = self.connection
+        if any(limiter.connection is not connection for limiter in self.limiters):  # type: ignore[union-attr]
+            self._single_script = False
+        elif isinstance(connection, SyncRedisCluster | AsyncRedisCluster):
+            self._single_script = len({key_slot(key.encode()) for key in self._keys}) == 1
+        else:
+            self._single_script = True
+
+    @property
+    def connection(self) -> Any:
+        return self.limiters[0].connection  # type: ignore[union-attr]
+
+    @property
+    def semaphores(self) -> list[Any]:
+        return [limiter for limiter in self.limiters if isinstance(limiter, SemaphoreBase)]
+
+    def _in_order(self) -> list[Any]:
+        """The limiters in the order we acquire them when we can't use a single script; buckets first."""
+        return sorted(self.limiters, key=lambda limiter: (isinstance(limiter, SemaphoreBase), limiter.key))
+
+    def _script_args(self, tokens: int) -> list[Any]:
+        args: list[Any] = []
+        for limiter in self.limiters:
+            if isinstance(limiter, TokenBucketBase):
+                args += ['token-bucket', *limiter._script_args(tokens)]
+            else:
+                args += ['semaphore', limiter.capacity, limiter.expiry]
+        return args
+
+    def _sleep_time(self, wait: float, full: bool, start: float) -> float:
+        """
+        Work out how long to sleep before trying again.
+
+        We know how long the token buckets need to refill, but not when a
+        semaphore holder will release its token, so for those we poll.
+        """
+        sleep_time = max(wait, self.poll_interval if full else 0)
+        if self.max_sleep != 0.0 and time.monotonic() - start + sleep_time > self.max_sleep:
+            raise MaxSleepExceededError(f'Max sleep ({self.max_sleep}s) exceeded waiting for {self}')
+        return sleep_time
+
+    def __str__(self) -> str:
+        return f'Composite limiter for {", ".join(limiter.key for limiter in self.limiters)}'
+
+
+class SyncCompositeLimiter(CompositeLimiterBase):
+    limiters: Sequence[SyncTokenBucket | SyncSemaphore]
+
+    def __enter__(self) -> float:
+        return self.acquire()
+
+    def acquire(self, tokens: int = 1) -> float:
+        """
+        Acquire from all the limiters, sleeping until every one of them can
+        go ahead. `tokens` is the number of tokens to take from each token
+        bucket; semaphores always hand out one. Returns the time slept.
+        """
+        start = time.monotonic()
+        while True:
+            acquired, wait, full = self.try_acquire(tokens)
+            if acquired:
+                return time.monotonic() - start
+            time.sleep(self._sleep_time(wait, full, start))
+
+    def try_acquire(self, tokens: int = 1) -> tuple[bool, float, bool]:
+        """
+        Acquire from all the limiters if they can all go ahead right away.
+
+        Returns whether we did, how many seconds until the token buckets have
+        enough tokens, and whether any of the semaphores are full.
+        """
+        if self._single_script:
+            acquired, wait, full = get_script('composite.lua').run(
+                self.connection, keys=self._keys, args=self._script_args(tokens)
+            )
+            return bool(acquired), wait / 1000, bool(full)
+
+        taken: list[SyncTokenBucket | SyncSemaphore] = []
+        for limiter in self._in_order():
+            if isinstance(limiter, SyncTokenBucket):
+                result = limiter.try_acquire(tokens)
+                if not result:
+                    self._give_back(taken, tokens)
+                    return False, result.retry_after, False
+            elif not limiter.try_acquire():
+                self._give_back(taken, tokens)
+                return False, 0, True
+            taken.append(limiter)
+        return True, 0, False
+
+    def _give_back(self, taken: list[SyncTokenBucket | SyncSemaphore], tokens: int) -> None:
+        for limiter in taken:
+            if isinstance(limiter, SyncTokenBucket):
+                limiter.refund(tokens)
+            else:
+                limiter.release()
+
+    def release(self) -> None:
+        """Return the semaphore tokens."""
+        for semaphore in self.semaphores:
+            semaphore.release()
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_val: BaseException | None,
+        exc_tb: TracebackType | None,
+    ) -> None:
+        self.release()
+
+
+class AsyncCompositeLimiter(CompositeLimiterBase):
+    limiters: Sequence[AsyncTokenBucket | AsyncSemaphore]
+
+    async def __aenter__(self) -> None:
+        await self.acquire()
+
+    async def acquire(self, tokens: int = 1) -> float:
+        """
+        Acquire from all the limiters, sleeping until every one of them can
+        go ahead. `tokens` is the number of tokens to take from each token
+        bucket; semaphores always hand out one. Returns the time slept.
+        """
+        start = time.monotonic()
+        while True:
+            acquired, wait, full = await self.try_acquire(tokens)
+            if acquired:
+                return time.monotonic() - start
+            await asyncio.sleep(self._sleep_time(wait, full, start))
+
+    async def try_acquire(self, tokens: int = 1) -> tuple[bool, float, bool]:
+        """
+        Acquire from all the limiters if they can all go ahead right away.
+
+        Returns whether we did, how many seconds until the token buckets have
+        enough tokens, and whether any of the semaphores are full.
+        """
+        if self._single_script:
+            acquired, wait, full = await get_script('composite.lua').run_async(
+                self.connection, keys=self._keys, args=self._script_args(tokens)
+            )
+            return bool(acquired), wait / 1000, bool(full)
+
+        taken: list[AsyncTokenBucket | AsyncSemaphore] = []
+        for limiter in self._in_order():
+            if isinstance(limiter, AsyncTokenBucket):
+                result = await limiter.try_acquire(tokens)
+                if not result:
+                    await self._give_back(taken, tokens)
+                    return False, result.retry_after, False
+            elif not await limiter.try_acquire():
+                await self._give_back(taken, tokens)
+                return False, 0, True
+            taken.append(limiter)
+        return True, 0, False
+
+    async def _give_back(self, taken: list[AsyncTokenBucket | AsyncSemaphore], tokens: int) -> None:
+        for limiter in taken:
+            if isinstance(limiter, AsyncTokenBucket):
+                await limiter.refund(tokens)
+            else:
+                await limiter.release()
+
+    async def release(self) -> None:
+        """Return the semaphore tokens."""
+        for semaphore in self.semaphores:
+            await semaphore.release()
+
+    async def __aexit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_val: BaseException | None,
+        exc_tb: TracebackType | None,
+    ) -> None:
+        await self.release()
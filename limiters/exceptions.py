@@ -4,3 +4,11 @@ class MaxSleepExceededError(Exception):
     """
 
     pass
+
+
+class LeaseExpiredError(Exception):
+    """
+    Raised when trying to extend a semaphore lease which has already expired.
+    """
+
+    pass
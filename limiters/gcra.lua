@@ -0,0 +1,50 @@
+--- Script called from the GCRA implementation.
+---
+--- Lua scripts are run atomically by default, and since redis
+--- is single threaded, there are no race conditions to worry about.
+---
+--- The generic cell rate algorithm only stores the theoretical arrival time
+--- (TAT): when the bucket would be empty again, had every token been handed
+--- out at exactly the configured rate. A request for n tokens moves the TAT
+--- n emission intervals forward, and may go ahead once the TAT is less than
+--- a burst of `capacity` tokens ahead of now.
+---
+--- Like the token bucket, this is forward looking: tokens are reserved right
+--- away, and the client sleeps until they're due.
+---
+--- keys:
+--- * key: The key to use for the TAT
+---
+--- args:
+--- * emission_interval: The time between tokens, in microseconds
+--- * capacity: The number of tokens that can be handed out in a burst
+--- * tokens: The number of tokens to acquire
+--- * max_wait: The longest wait to accept, in microseconds, or 0 for no limit
+---
+--- returns:
+--- * Whether the tokens were reserved (1 or 0), and the number of microseconds
+---   to wait for them. Tokens are not reserved if the wait exceeds max_wait.
+
+redis.replicate_commands()
+
+local key = KEYS[1]
+local emission_interval = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local tokens = tonumber(ARGV[3])
+local max_wait = tonumber(ARGV[4])
+
+-- Use the Redis clock, so the rate doesn't depend on client clocks
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000000 + tonumber(time[2])
+
+local tat = math.max(tonumber(redis.call('GET', key)) or now, now)
+local new_tat = tat + tokens * emission_interval
+local wait = math.max(new_tat - capacity * emission_interval - now, 0)
+
+if max_wait > 0 and wait > max_wait then
+    return { 0, math.ceil(wait) }
+end
+
+-- Once the TAT has passed, the key carries no information, so let it expire
+redis.call('SET', key, string.format('%d', math.ceil(new_tat)), 'PX', math.ceil((new_tat - now) / 1000))
+return { 1, math.ceil(wait) }
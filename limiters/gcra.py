@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import time
+from types import TracebackType
+from typing import ClassVar
+
+from pydantic import BaseModel, Field, PrivateAttr
+
+from limiters import MaxSleepExceededError, circuit
+from limiters.base import AsyncLuaScriptBase, KeyLayout, SyncLuaScriptBase
+from limiters.logs import RateLimitedLogger
+from limiters.metrics import report_rejected
+
+logger = logging.getLogger(__name__)
+sleep_logger = RateLimitedLogger(logger)
+
+
+class GCRABase(BaseModel):
+    name: str
+    capacity: int = Field(gt=0)
+    refill_frequency: float = Field(gt=0)
+    refill_amount: int = Field(gt=0)
+    max_sleep: float = Field(ge=0, default=0.0)
+    key_layout: KeyLayout = KeyLayout.SHARED
+    local_circuit: bool = False
+
+    _key: str = PrivateAttr()
+    _emission_interval: float = PrivateAttr()
+
+    def _post_init(self) -> None:
+        self._key = self.key_layout.key('gcra', self.name)
+        # Tokens are spread out evenly, rather than added `refill_amount` at the time
+        self._emission_interval = self.refill_frequency / self.refill_amount * 1_000_000
+
+    @property
+    def key(self) -> str:
+        """Key to use for the theoretical arrival time."""
+        return self._key
+
+    def _script_args(self, tokens: int) -> list[int | float]:
+        if not 0 < tokens <= self.capacity:
+            raise ValueError(
+                f'Cannot acquire {tokens} tokens from {self.name}; must be between 1 and the capacity ({self.capacity})'
+            )
+        return [self._emission_interval, self.capacity, tokens, int(self.max_sleep * 1_000_000)]
+
+    def _check_circuit(self) -> None:
+        """With `local_circuit`, fail fast if we already know we'd sleep for longer than `max_sleep`."""
+        if (
+            self.local_circuit
+            and self.max_sleep != 0.0
+            and (wait := circuit.busy_for(self.connection, self.key)) > self.max_sleep  # type: ignore[attr-defined]
+        ):
+            raise self._max_sleep_error(wait)
+
+    def _max_sleep_error(self, sleep_time: float) -> MaxSleepExceededError:
+        report_rejected(self)
+        return MaxSleepExceededError(
+            f'Scheduled to sleep `{sleep_time}` seconds. '
+            f'This exceeds the maximum accepted sleep time of `{self.max_sleep}` seconds for {self.name}.'
+        )
+
+    def _trip_circuit(self, result: tuple[int, int], tokens: int) -> None:
+        # Nothing is reserved when we refuse, so we only know when a single token is due
+        if self.local_circuit and tokens == 1 and not result[0]:
+            circuit.trip(self.connection, self.key, result[1] / 1_000_000)  # type: ignore[attr-defined]
+
+    def sleep_time(self, result: tuple[int, int]) -> float:
+        """Work out how long to sleep, from the result of the GCRA script."""
+        reserved, wait = result
+        sleep_time = wait / 1_000_000
+        if not reserved:
+            raise self._max_sleep_error(sleep_time)
+        if sleep_time:
+            sleep_logger.info('Sleeping %s seconds (%s)', sleep_time, self.name)
+        return sleep_time
+
+    def __str__(self) -> str:
+        return f'GCRA instance for {self.key}'
+
+
+class SyncGCRA(GCRABase, SyncLuaScriptBase):
+    script_name: ClassVar[str] = 'gcra.lua'
+
+    def __enter__(self) -> float:
+        return self.acquire()
+
+    def acquire(self, tokens: int = 1) -> float:
+        """
+        Acquire `tokens` tokens in a single call, sleeping until
+        they're due. Returns the time slept.
+
+        If we'd have to sleep for longer than `max_sleep`, nothing
+        is reserved, and a `MaxSleepExceededError` is raised.
+        """
+        self._check_circuit()
+        result = self.script(keys=[self.key], args=self._script_args(tokens))
+        self._trip_circuit(result, tokens)
+        sleep_time = self.sleep_time(result)
+        if sleep_time:
+            time.sleep(sleep_time)
+        if self.metrics is not None:
+            self.metrics.slept(self, sleep_time)
+        return sleep_time
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_val: BaseException | None,
+        exc_tb: TracebackType | None,
+    ) -> None:
+        return
+
+
+class AsyncGCRA(GCRABase, AsyncLuaScriptBase):
+    script_name: ClassVar[str] = 'gcra.lua'
+
+    async def __aenter__(self) -> None:
+        await self.acquire()
+
+    async def acquire(self, tokens: int = 1) -> float:
+        """
+        Acquire `tokens` tokens in a single call, sleeping until
+        they're due. Returns the time slept.
+
+        If we'd have to sleep for longer than `max_sleep`, nothing
+        is reserved, and a `MaxSleepExceededError` is raised.
+        """
+        self._check_circuit()
+        result = await self.script(keys=[self.key], args=self._script_args(tokens))
+        self._trip_circuit(result, tokens)
+        sleep_time = self.sleep_time(result)
+        await asyncio.sleep(sleep_time)
+        if self.metrics is not None:
+            self.metrics.slept(self, sleep_time)
+        return sleep_time
+
+    async def __aexit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_val: BaseException | None,
+        exc_tb: TracebackType | None,
+    ) -> None:
+        return
@@ -0,0 +1,134 @@
+--- Token bucket helpers, shared by the scripts which read or write token bucket state.
+---
+--- Scripts include this with an `include` comment naming this file, which is
+--- replaced by this file when the script is loaded (see `LuaScript`).
+---
+--- The state is saved as "<slot> <tokens>", or packed as 6 big-endian bytes of
+--- the slot, followed by the big-endian bytes of the tokens. Either can be read.
+---
+--- Tokens given back to an earlier slot than the latest are kept as credits, which
+--- later reservations take first. Those are saved as " <slot>:<tokens>" after the
+--- latest slot and its tokens, so state with credits is always saved as text.
+
+-- Read the state in either encoding. Returns the latest slot, its tokens, and the
+-- credits, as a list of {slot, tokens} ordered by slot.
+local function decode_state(data)
+    local last_slot, stored_tokens, rest = data:match('^(%d+) (%-?%d+)(.*)$')
+    if last_slot then
+        local credits = {}
+        for credit_slot, credit_tokens in rest:gmatch(' (%d+):(%d+)') do
+            table.insert(credits, { tonumber(credit_slot), tonumber(credit_tokens) })
+        end
+        return tonumber(last_slot), tonumber(stored_tokens), credits
+    end
+    local slot = 0
+    for i = 1, 6 do
+        slot = slot * 256 + data:byte(i)
+    end
+    local tokens = 0
+    for i = 7, #data do
+        tokens = tokens * 256 + data:byte(i)
+    end
+    return slot, tokens, {}
+end
+
+-- Write the state in the encoding the caller asked for, unless there are credits to save
+local function encode_state(slot, tokens, packed, credits)
+    if not packed or (credits and #credits > 0) then
+        local parts = { string.format('%d %d', slot, tokens) }
+        for _, credit in ipairs(credits or {}) do
+            table.insert(parts, string.format('%d:%d', credit[1], credit[2]))
+        end
+        return table.concat(parts, ' ')
+    end
+    slot = math.floor(slot)
+    tokens = math.max(tokens, 0)
+    local bytes = {}
+    for i = 6, 1, -1 do
+        bytes[i] = slot % 256
+        slot = math.floor(slot / 256)
+    end
+    repeat
+        table.insert(bytes, 7, tokens % 256)
+        tokens = math.floor(tokens / 256)
+    until tokens == 0
+    return string.char(unpack(bytes))
+end
+
+-- How long to keep the state, in milliseconds: until the bucket would have refilled completely,
+-- unless the caller passed a TTL, but never for less time than it takes to get to the slot
+local function state_expiry(ttl, slot, now, capacity, refill_amount, time_between_slots)
+    local refilled = math.max(slot - now, 0) + math.ceil(capacity / refill_amount) * time_between_slots
+    return math.ceil(math.max(ttl or refilled, slot - now, 1))
+end
+
+-- Credits can be handed out until the slot after theirs starts, so drop any older ones
+local function usable_credits(credits, now, time_between_slots)
+    local usable = {}
+    for _, credit in ipairs(credits) do
+        if credit[1] + time_between_slots > now then
+            table.insert(usable, credit)
+        end
+    end
+    return usable
+end
+
+-- Work out which slot can hand out the requested tokens, from the saved state, if any.
+-- Returns the state to save (the latest slot, the tokens left in it and the credits left),
+-- the slot the tokens were taken from, and when they're due, which is later than now if
+-- they're from a future slot, but isn't delayed by the execution time penalty.
+local function reserve_slot(data, now, capacity, refill_amount, time_between_slots, requested)
+    -- Default bucket values (used if no bucket exists yet)
+    local tokens = capacity
+    local slot = now
+    local due = slot
+    local credits = {}
+
+    if data then
+        slot, tokens, credits = decode_state(data)
+        credits = usable_credits(credits, now, time_between_slots)
+        due = slot
+
+        -- The current slot is up to 20ms ahead, for the execution time penalty,
+        -- but that's no reason to wait for the tokens left in it
+        if slot <= now + 20 then
+            due = math.min(slot, now)
+        end
+
+        -- Calculate the number of slots that have passed since the last update
+        local slots_passed = math.floor((now - slot) / time_between_slots)
+        if slots_passed > 0 then
+            -- Refill the tokens based on the number of slots passed, capped by capacity
+            tokens = math.min(tokens + slots_passed * refill_amount, capacity)
+            -- Update the slot to this run, adding a penalty for execution time
+            slot = now + 20
+            due = now
+        end
+    end
+
+    -- If there aren't enough tokens left, move forward to the first slot
+    -- where enough tokens will have been refilled. That's a fresh slot, so the
+    -- tokens left over in this one only carry over as far as the capacity.
+    local next_slot, next_tokens, next_due = slot, tokens, due
+    if tokens < requested then
+        local slots_needed = math.ceil((requested - tokens) / refill_amount)
+        next_slot = slot + slots_needed * time_between_slots
+        next_tokens = math.min(tokens + slots_needed * refill_amount, capacity)
+        next_due = next_slot
+    end
+
+    -- Take the tokens from the earliest credit with enough of them, if that's no later
+    -- than the latest slot, which is then left as it is
+    for i, credit in ipairs(credits) do
+        local credit_due = math.max(credit[1], now)
+        if credit[2] >= requested and credit_due <= next_due then
+            credit[2] = credit[2] - requested
+            if credit[2] <= 0 then
+                table.remove(credits, i)
+            end
+            return slot, tokens, credits, credit[1], credit_due
+        end
+    end
+
+    return next_slot, next_tokens - requested, credits, next_slot, next_due
+end
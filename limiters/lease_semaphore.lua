@@ -0,0 +1,46 @@
+--- Script called from the LeaseSemaphore implementation, to acquire a lease.
+---
+--- Lua scripts are run atomically by default, and since redis
+--- is single threaded, there are no race conditions to worry about.
+---
+--- Holders are stored in a sorted set, scored by the time their lease
+--- expires. Expired leases (e.g., from crashed workers) are reclaimed
+--- before we check whether there is room for another holder.
+---
+--- keys:
+--- * key: The key to use for the sorted set of holders
+---
+--- args:
+--- * capacity: The capacity of the semaphore
+--- * holder: A unique ID for the holder acquiring the lease
+--- * lease: The lease duration, in milliseconds
+---
+--- returns:
+--- * 0 if the lease was acquired, else the number of milliseconds
+---   until the earliest lease expires (an upper bound on how long to wait)
+
+redis.replicate_commands()
+
+local key = KEYS[1]
+local capacity = tonumber(ARGV[1])
+local holder = ARGV[2]
+local lease = tonumber(ARGV[3])
+
+-- Use the Redis clock, so lease deadlines don't depend on client clocks
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+
+-- Reclaim expired leases
+redis.call('ZREMRANGEBYSCORE', key, '-inf', now)
+
+if redis.call('ZCARD', key) < capacity then
+    redis.call('ZADD', key, now + lease, holder)
+    -- Keep the set around for at least as long as the longest lease
+    if redis.call('PTTL', key) < lease then
+        redis.call('PEXPIRE', key, lease)
+    end
+    return 0
+end
+
+local earliest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+return math.max(tonumber(earliest[2]) - now, 1)
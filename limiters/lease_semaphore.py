@@ -0,0 +1,231 @@
+import asyncio
+import logging
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from types import TracebackType
+from typing import Any, ClassVar
+from uuid import uuid4
+
+from pydantic import BaseModel, Field, PrivateAttr
+
+from limiters import LeaseExpiredError, MaxSleepExceededError
+from limiters.base import AsyncLuaScriptBase, KeyLayout, SyncLuaScriptBase
+from limiters.metrics import end_hold, report_rejected, start_hold
+
+logger = logging.getLogger(__name__)
+
+# Leases acquired in the current context (thread or task). A limiter instance can be
+# shared between tasks, so this is where we first look for the lease to extend or release.
+_leases: ContextVar[tuple['Lease', ...]] = ContextVar('leases', default=())
+
+
+@dataclass(eq=False)
+class Lease:
+    """
+    A lease on a lease semaphore, as returned by `acquire`.
+
+    Pass it to the semaphore's `extend` or `release` to act on this lease in
+    particular, e.g., from a different task or thread than the one that acquired it.
+    """
+
+    semaphore: Any
+    holder: str
+    released: bool = False
+
+
+class LeaseSemaphoreBase(BaseModel):
+    name: str
+    capacity: int = Field(gt=0)
+    max_sleep: float = Field(ge=0, default=0.0)
+    lease_duration: float = Field(gt=0, default=30.0)
+    poll_interval: float = Field(gt=0, default=0.1)
+    key_layout: KeyLayout = KeyLayout.SHARED
+
+    _key: str = PrivateAttr()
+    # Leases acquired through this instance and not yet released, oldest first
+    _held: list[Lease] = PrivateAttr(default_factory=list)
+
+    def _post_init(self) -> None:
+        self._key = self.key_layout.key('lease-semaphore', self.name)
+
+    @property
+    def key(self) -> str:
+        """Key to use for the sorted set of lease holders."""
+        return self._key
+
+    @property
+    def holder(self) -> str:
+        """The ID of the lease `extend` and `release` act on, when not passed one. See `_lease`."""
+        return self._lease().holder
+
+    def _lease(self, lease: Lease | None = None) -> Lease:
+        """
+        Return the lease to extend or release: the one passed, or else the most recent one
+        acquired in the current context, or if there are none (e.g., it was acquired in
+        another task), the only one held through this instance. If there are several,
+        there's no telling which is meant, so it has to be passed.
+        """
+        if lease is not None:
+            return lease
+        for held in reversed(_leases.get()):
+            if held.semaphore is self and not held.released:
+                return held
+        if len(self._held) == 1:
+            return self._held[0]
+        if self._held:
+            raise RuntimeError(f'{len(self._held)} leases held for {self.name}, pass the one to use')
+        raise RuntimeError(f'No lease held for {self.name}')
+
+    def _hold(self, holder: str) -> Lease:
+        lease = Lease(self, holder)
+        self._held.append(lease)
+        # Leases released in another context are only marked as released in this one, so drop them here
+        _leases.set((*(held for held in _leases.get() if not held.released), lease))
+        return lease
+
+    def _drop(self, lease: Lease | None) -> Lease:
+        lease = self._lease(lease)
+        lease.released = True
+        if lease in self._held:
+            self._held.remove(lease)
+        if lease in (leases := _leases.get()):
+            _leases.set(tuple(held for held in leases if held is not lease))
+        return lease
+
+    def _new_holder(self) -> str:
+        """A unique ID for a new lease, which is its member in the sorted set."""
+        return uuid4().hex
+
+    def _script_args(self, holder: str) -> list[int | str]:
+        return [self.capacity, holder, self._lease_ms()]
+
+    def _lease_ms(self, lease_duration: float | None = None) -> int:
+        return int((lease_duration or self.lease_duration) * 1000)
+
+    def _sleep_time(self, retry_after: int, start: float) -> float:
+        """
+        Work out how long to sleep before trying to acquire a lease again.
+
+        We don't get notified when a holder releases its lease, so we poll
+        every `poll_interval` seconds, or sooner if the earliest lease expires.
+        """
+        sleep_time = min(self.poll_interval, retry_after / 1000)
+        if self.max_sleep != 0.0:
+            remaining = self.max_sleep - (time.monotonic() - start)
+            if remaining <= 0:
+                report_rejected(self)
+                raise MaxSleepExceededError(f'Max sleep ({self.max_sleep}s) exceeded waiting for Semaphore')
+            sleep_time = min(sleep_time, remaining)
+        return sleep_time
+
+    def __str__(self) -> str:
+        return f'Lease semaphore instance for {self.key}'
+
+
+class SyncLeaseSemaphore(LeaseSemaphoreBase, SyncLuaScriptBase):
+    script_name: ClassVar[str] = 'lease_semaphore.lua'
+
+    def __enter__(self) -> Lease:
+        return self.acquire()
+
+    def acquire(self) -> Lease:
+        """
+        Call the lease semaphore Lua script to reclaim expired leases and acquire
+        a new one, polling until there is room or `max_sleep` is exceeded.
+        """
+        holder = self._new_holder()
+        start = time.monotonic()
+        while retry_after := self.script(keys=[self.key], args=self._script_args(holder)):
+            time.sleep(self._sleep_time(retry_after, start))
+
+        lease = self._hold(holder)
+        if self.metrics is not None:
+            self.metrics.slept(self, time.monotonic() - start)
+            start_hold(self)
+        logger.debug('Acquired lease %s on semaphore %s', holder, self.name)
+        return lease
+
+    def extend(self, lease_duration: float | None = None, lease: Lease | None = None) -> None:
+        """
+        Extend the lease to `lease_duration` seconds from now.
+
+        Defaults to the configured lease duration, and the current lease. Raises
+        `LeaseExpiredError` if the lease expired before we got to extend it.
+        """
+        holder = self._lease(lease).holder
+        if not self.run_script(
+            'lease_semaphore_extend.lua', keys=[self.key], args=[holder, self._lease_ms(lease_duration)]
+        ):
+            raise LeaseExpiredError(f'Lease {holder} on semaphore {self.name} has expired')
+
+    def release(self, lease: Lease | None = None) -> None:
+        """Release the lease, which defaults to the current one."""
+        holder = self._drop(lease).holder
+        if self.metrics is not None:
+            end_hold(self)
+        self.connection.zrem(self.key, holder)  # type: ignore[union-attr]
+
+        logger.debug('Released lease %s on semaphore %s', holder, self.name)
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_val: BaseException | None,
+        exc_tb: TracebackType | None,
+    ) -> None:
+        self.release()
+
+
+class AsyncLeaseSemaphore(LeaseSemaphoreBase, AsyncLuaScriptBase):
+    script_name: ClassVar[str] = 'lease_semaphore.lua'
+
+    async def __aenter__(self) -> Lease:
+        return await self.acquire()
+
+    async def acquire(self) -> Lease:
+        """
+        Call the lease semaphore Lua script to reclaim expired leases and acquire
+        a new one, polling until there is room or `max_sleep` is exceeded.
+        """
+        holder = self._new_holder()
+        start = time.monotonic()
+        while retry_after := await self.script(keys=[self.key], args=self._script_args(holder)):
+            await asyncio.sleep(self._sleep_time(retry_after, start))
+
+        lease = self._hold(holder)
+        if self.metrics is not None:
+            self.metrics.slept(self, time.monotonic() - start)
+            start_hold(self)
+        logger.debug('Acquired lease %s on semaphore %s', holder, self.name)
+        return lease
+
+    async def extend(self, lease_duration: float | None = None, lease: Lease | None = None) -> None:
+        """
+        Extend the lease to `lease_duration` seconds from now.
+
+        Defaults to the configured lease duration, and the current lease. Raises
+        `LeaseExpiredError` if the lease expired before we got to extend it.
+        """
+        holder = self._lease(lease).holder
+        if not await self.run_script(
+            'lease_semaphore_extend.lua', keys=[self.key], args=[holder, self._lease_ms(lease_duration)]
+        ):
+            raise LeaseExpiredError(f'Lease {holder} on semaphore {self.name} has expired')
+
+    async def release(self, lease: Lease | None = None) -> None:
+        """Release the lease, which defaults to the current one."""
+        holder = self._drop(lease).holder
+        if self.metrics is not None:
+            end_hold(self)
+        await self.connection.zrem(self.key, holder)  # type: ignore[union-attr]
+
+        logger.debug('Released lease %s on semaphore %s', holder, self.name)
+
+    async def __aexit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_val: BaseException | None,
+        exc_tb: TracebackType | None,
+    ) -> None:
+        await self.release()
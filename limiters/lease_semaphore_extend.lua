@@ -0,0 +1,31 @@
+--- Script called from the LeaseSemaphore implementation, to extend a lease.
+---
+--- keys:
+--- * key: The key to use for the sorted set of holders
+---
+--- args:
+--- * holder: The ID of the holder extending its lease
+--- * lease: The new lease duration, from now, in milliseconds
+---
+--- returns:
+--- * 1 if the lease was extended, else 0 (the lease had already expired)
+
+redis.replicate_commands()
+
+local key = KEYS[1]
+local holder = ARGV[1]
+local lease = tonumber(ARGV[2])
+
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+
+local deadline = redis.call('ZSCORE', key, holder)
+if not deadline or tonumber(deadline) <= now then
+    return 0
+end
+
+redis.call('ZADD', key, 'XX', now + lease, holder)
+if redis.call('PTTL', key) < lease then
+    redis.call('PEXPIRE', key, lease)
+end
+return 1
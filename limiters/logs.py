@@ -0,0 +1,38 @@
+import logging
+import time
+from typing import Any
+
+
+class RateLimitedLogger:
+    """
+    A logger for messages emitted on every acquire.
+
+    Lets at most one message through every `interval` seconds, so heavy
+    throttling doesn't flood the logs. The number of messages dropped in
+    between is added to the next message that gets through.
+    """
+
+    __slots__ = ('_next', '_suppressed', 'interval', 'logger')
+
+    def __init__(self, logger: logging.Logger, interval: float = 1.0) -> None:
+        self.logger = logger
+        self.interval = interval
+        self._next = 0.0
+        self._suppressed = 0
+
+    def log(self, level: int, msg: str, *args: Any) -> None:
+        if not self.logger.isEnabledFor(level):
+            return
+        now = time.monotonic()
+        if now < self._next:
+            self._suppressed += 1
+            return
+        self._next = now + self.interval
+        if suppressed := self._suppressed:
+            self._suppressed = 0
+            msg += ' (%s similar messages suppressed)'
+            args = (*args, suppressed)
+        self.logger.log(level, msg, *args)
+
+    def info(self, msg: str, *args: Any) -> None:
+        self.log(logging.INFO, msg, *args)
@@ -0,0 +1,388 @@
+"""
+In-process backends, for running limiters without Redis.
+
+`SyncMemoryBackend` and `AsyncMemoryBackend` can be passed as a limiter's
+`connection`. They implement the handful of Redis commands the token buckets
+and semaphores use, and run Python versions of their Lua scripts, looked up
+by the same SHA the limiters pass to `EVALSHA`. State lives in this process
+only, so limits aren't shared with other processes.
+"""
+
+import asyncio
+import math
+import threading
+import time
+from collections import defaultdict, deque
+from collections.abc import Callable
+from typing import Any
+
+from redis.exceptions import NoScriptError
+
+from limiters.scripts import get_script
+
+# How many writes between sweeps for expired keys
+SWEEP_INTERVAL = 10_000
+
+# The token bucket's penalty for execution time, in milliseconds, as in `token_bucket.lua`
+SLOT_PENALTY = 20
+
+# How many slots a token bucket keeps refunded tokens for, at most, as in `token_bucket_refund.lua`
+MAX_CREDITS = 64
+
+
+def _number(value: Any) -> float | None:
+    """Convert a script argument to a number, like Lua's `tonumber`."""
+    if value is None or value == '':
+        return None
+    return float(value)
+
+
+class MemoryStore:
+    """
+    Keys with expiry, and Python versions of the package's Lua scripts.
+
+    Not thread-safe by itself; the backends decide how calls are serialized.
+    """
+
+    def __init__(self) -> None:
+        self._values: dict[str, Any] = {}
+        self._expires: dict[str, float] = {}
+        self._writes = 0
+
+    def get(self, key: str) -> Any:
+        if (expires := self._expires.get(key)) is not None and expires <= time.monotonic():
+            self._values.pop(key, None)
+            del self._expires[key]
+        return self._values.get(key)
+
+    def set(self, key: str, value: Any, expiry: float) -> None:
+        self._values[key] = value
+        self._expires[key] = time.monotonic() + expiry
+        self._writes += 1
+        if self._writes % SWEEP_INTERVAL == 0:
+            now = time.monotonic()
+            for stale in [k for k, expires in self._expires.items() if expires <= now]:
+                del self._values[stale], self._expires[stale]
+
+    def expire(self, key: str, expiry: float) -> bool:
+        if self.get(key) is None:
+            return False
+        self._expires[key] = time.monotonic() + expiry
+        return True
+
+    def lpop(self, key: str) -> bool:
+        """Take a token from a semaphore, if there are any left."""
+        if not (tokens := self.get(key)):
+            return False
+        self._values[key] = tokens - 1
+        return True
+
+    def lpush(self, key: str, expiry: float | None = None) -> None:
+        """Return a token to a semaphore, refreshing its expiry if one is passed."""
+        self._values[key] = (self.get(key) or 0) + 1
+        if expiry is not None:
+            self._expires[key] = time.monotonic() + expiry
+
+    @staticmethod
+    def _now(seconds: Any, microseconds: Any) -> float:
+        # Redis' `TIME`, unless the client passed its own clock
+        if (s := _number(seconds)) is None:
+            return time.time() * 1000
+        return s * 1000 + (_number(microseconds) or 0) / 1000
+
+    @staticmethod
+    def _ttl(
+        ttl: float | None, slot: float, now: float, capacity: float, refill_amount: float, time_between_slots: float
+    ) -> float:
+        """How long to keep a token bucket's state, in seconds, as in `token_bucket.lua`."""
+        refilled = max(slot - now, 0) + math.ceil(capacity / refill_amount) * time_between_slots
+        return math.ceil(max(refilled if ttl is None else ttl, slot - now, 1)) / 1000
+
+    @staticmethod
+    def _credits(credits: list[list[float]], now: float, time_between_slots: float) -> list[list[float]]:
+        """Copies of the refunded tokens that can still be handed out, as in `token_bucket.lua`."""
+        return [[slot, tokens] for slot, tokens in credits if slot + time_between_slots > now]
+
+    def token_bucket(self, keys: list[str], args: list[Any]) -> Any:
+        """See `token_bucket.lua`."""
+        capacity, refill_amount, refill_frequency, seconds, microseconds, *rest = args
+        capacity, refill_amount = float(capacity), float(refill_amount)
+        time_between_slots = float(refill_frequency) * 1000
+        requested = (_number(rest[0]) if rest else None) or 1
+        ttl = _number(rest[1]) if len(rest) > 1 else None
+        max_wait = _number(rest[3]) if len(rest) > 3 else None
+        server_time = _number(seconds) is None
+        now = self._now(seconds, microseconds)
+
+        tokens = float(capacity)
+        slot = due = now
+        credits: list[list[float]] = []
+        if (data := self.get(keys[0])) is not None:
+            slot, tokens, credits = data
+            credits = self._credits(credits, now, time_between_slots)
+            due = min(slot, now) if slot <= now + SLOT_PENALTY else slot
+            if (slots_passed := math.floor((now - slot) / time_between_slots)) > 0:
+                tokens = min(tokens + slots_passed * refill_amount, capacity)
+                slot = now + SLOT_PENALTY
+                due = now
+
+        next_slot, next_tokens, next_due = slot, tokens, due
+        if tokens < requested:
+            slots_needed = math.ceil((requested - tokens) / refill_amount)
+            next_slot = slot + slots_needed * time_between_slots
+            next_tokens = min(tokens + slots_needed * refill_amount, capacity)
+            next_due = next_slot
+
+        reserved, due = next_slot, next_due
+        for credit in credits:
+            if credit[1] >= requested and max(credit[0], now) <= next_due:
+                reserved, due = credit[0], max(credit[0], now)
+                credit[1] -= requested
+                credits = [credit for credit in credits if credit[1] > 0]
+                break
+        else:
+            slot, tokens = next_slot, next_tokens - requested
+
+        wait = max(math.ceil(due - now), 0)
+        if max_wait is not None and wait > max_wait:
+            return [0, wait]
+
+        expiry = self._ttl(ttl, slot, now, capacity, refill_amount, time_between_slots)
+        self.set(keys[0], (int(slot), int(tokens), credits), expiry)
+
+        if max_wait is not None:
+            return [1, wait, int(reserved)]
+        if server_time:
+            return max(math.ceil(reserved - now), 0)
+        return int(reserved)
+
+    def token_bucket_refund(self, keys: list[str], args: list[Any]) -> None:
+        """See `token_bucket_refund.lua`."""
+        capacity, refill_amount, refill_frequency, seconds, microseconds, returned, ttl, _, *rest = args
+        reserved = _number(rest[0]) if rest else None
+        capacity, refill_amount = float(capacity), float(refill_amount)
+        time_between_slots = float(refill_frequency) * 1000
+        now = self._now(seconds, microseconds)
+        if (data := self.get(keys[0])) is None:
+            return
+
+        slot, tokens, credits = data
+        credits = self._credits(credits, now, time_between_slots)
+        if reserved is None:
+            reserved = slot if slot <= now + SLOT_PENALTY else math.floor(now)
+
+        if reserved == slot:
+            tokens = min(tokens + float(returned), capacity)
+        elif reserved < slot and reserved + time_between_slots > now:
+            if credit := next((credit for credit in credits if credit[0] == reserved), None):
+                credit[1] = min(credit[1] + float(returned), capacity)
+            elif len(credits) < MAX_CREDITS:
+                credits = sorted([*credits, [reserved, min(float(returned), capacity)]])
+            else:
+                return
+        else:
+            return
+
+        expiry = self._ttl(_number(ttl), slot, now, capacity, refill_amount, time_between_slots)
+        self.set(keys[0], (int(slot), int(tokens), credits), expiry)
+
+    def semaphore(self, keys: list[str], args: list[Any]) -> int:
+        """See `semaphore.lua`."""
+        key, exists = keys
+        capacity, expiry = int(args[0]), float(args[1])
+        if self.get(exists) is None:
+            self.set(exists, 1, expiry)
+            self.set(key, capacity, expiry)
+        if not self.lpop(key):
+            return 0
+        self.expire(key, expiry)
+        self.expire(exists, expiry)
+        return 1
+
+    def semaphore_release(self, keys: list[str], args: list[Any]) -> None:
+        """See `semaphore_release.lua`."""
+        key, exists = keys
+        expiry = float(args[0])
+        self.lpush(key, expiry)
+        self.expire(exists, expiry)
+
+
+SCRIPTS: dict[str, Callable[[MemoryStore, list[str], list[Any]], Any]] = {
+    'token_bucket.lua': MemoryStore.token_bucket,
+    'token_bucket_refund.lua': MemoryStore.token_bucket_refund,
+    'semaphore.lua': MemoryStore.semaphore,
+    'semaphore_release.lua': MemoryStore.semaphore_release,
+}
+
+# Scripts which return a token to a semaphore, so waiters should be woken up
+RELEASE_SCRIPTS = {'semaphore_release.lua'}
+
+Script = Callable[[MemoryStore, list[str], list[Any]], Any]
+
+# The scripts with Python versions, by SHA
+_scripts_by_sha: dict[str, tuple[str, Script]] = {}
+
+
+def _script(sha: str) -> tuple[str, Script]:
+    if not _scripts_by_sha:
+        for name, script in SCRIPTS.items():
+            _scripts_by_sha[get_script(name).sha] = (name, script)
+    if sha not in _scripts_by_sha:
+        # Limiters check that they can run on a memory backend when they're created, so like
+        # Redis, this only happens when a script is run directly
+        raise NoScriptError('No matching script')
+    return _scripts_by_sha[sha]
+
+
+class MemoryPipeline:
+    """Queues up commands, and runs them in order on `execute`."""
+
+    def __init__(self, backend: Any) -> None:
+        self._backend = backend
+        self._commands: list[tuple[str, tuple[Any, ...]]] = []
+
+    def evalsha(self, sha: str, numkeys: int, *keys_and_args: Any) -> 'MemoryPipeline':
+        self._commands.append(('evalsha', (sha, numkeys, *keys_and_args)))
+        return self
+
+    def expire(self, key: str, expiry: float) -> 'MemoryPipeline':
+        self._commands.append(('expire', (key, expiry)))
+        return self
+
+    def _run(self, raise_on_error: bool) -> list[Any]:
+        results: list[Any] = []
+        for command, args in self._commands:
+            try:
+                results.append(getattr(self._backend, f'_{command}')(*args))
+            except Exception as e:
+                if raise_on_error:
+                    raise
+                results.append(e)
+        self._commands.clear()
+        return results
+
+
+class SyncMemoryPipeline(MemoryPipeline):
+    def execute(self, raise_on_error: bool = True) -> list[Any]:
+        with self._backend._lock:
+            return self._run(raise_on_error)
+
+
+class AsyncMemoryPipeline(MemoryPipeline):
+    async def execute(self, raise_on_error: bool = True) -> list[Any]:
+        return self._run(raise_on_error)
+
+
+class SyncMemoryBackend:
+    """
+    Run sync limiters in this process, without Redis.
+
+    Calls are serialized with a lock, so a backend can be shared between threads,
+    and semaphore waiters block on a condition variable rather than a connection.
+    """
+
+    def __init__(self) -> None:
+        self._store = MemoryStore()
+        self._lock = threading.Condition()
+
+    def _evalsha(self, sha: str, numkeys: int, *keys_and_args: Any) -> Any:
+        name, script = _script(sha)
+        result = script(self._store, list(keys_and_args[:numkeys]), list(keys_and_args[numkeys:]))
+        if name in RELEASE_SCRIPTS:
+            self._lock.notify_all()
+        return result
+
+    def _expire(self, key: str, expiry: float) -> bool:
+        return self._store.expire(key, expiry)
+
+    def evalsha(self, sha: str, numkeys: int, *keys_and_args: Any) -> Any:
+        with self._lock:
+            return self._evalsha(sha, numkeys, *keys_and_args)
+
+    def script_load(self, script: str) -> str:
+        # Every script we can run is already known
+        return ''
+
+    def pipeline(self, transaction: bool = True) -> SyncMemoryPipeline:
+        return SyncMemoryPipeline(self)
+
+    def blpop(self, key: str, timeout: float = 0) -> list[str] | None:
+        """Wait for a semaphore token, for up to `timeout` seconds, or forever if it's 0."""
+        deadline = time.monotonic() + timeout if timeout else None
+        with self._lock:
+            while not self._store.lpop(key):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._lock.wait(remaining)
+        return [key, '1']
+
+
+class AsyncMemoryBackend:
+    """
+    Run async limiters in this process, without Redis.
+
+    Calls run to completion without yielding to the event loop, so they're atomic
+    for coroutines on the same loop, and semaphore waiters wait on futures, in FIFO
+    order, rather than connections. Use a backend from a single event loop.
+    """
+
+    def __init__(self) -> None:
+        self._store = MemoryStore()
+        self._waiters: defaultdict[str, deque[asyncio.Future[None]]] = defaultdict(deque)
+
+    def _evalsha(self, sha: str, numkeys: int, *keys_and_args: Any) -> Any:
+        name, script = _script(sha)
+        keys = list(keys_and_args[:numkeys])
+        result = script(self._store, keys, list(keys_and_args[numkeys:]))
+        if name in RELEASE_SCRIPTS:
+            self._hand_over(keys[0])
+        return result
+
+    def _expire(self, key: str, expiry: float) -> bool:
+        return self._store.expire(key, expiry)
+
+    def _hand_over(self, key: str) -> None:
+        """Give a token straight to the longest waiting coroutine, if there is one."""
+        waiters = self._waiters[key]
+        while waiters and waiters[0].done():
+            waiters.popleft()
+        if waiters and self._store.lpop(key):
+            waiters.popleft().set_result(None)
+        if not waiters:
+            del self._waiters[key]
+
+    async def evalsha(self, sha: str, numkeys: int, *keys_and_args: Any) -> Any:
+        return self._evalsha(sha, numkeys, *keys_and_args)
+
+    async def script_load(self, script: str) -> str:
+        # Every script we can run is already known
+        return ''
+
+    def pipeline(self, transaction: bool = True) -> AsyncMemoryPipeline:
+        return AsyncMemoryPipeline(self)
+
+    async def blpop(self, key: str, timeout: float = 0) -> list[str] | None:
+        """Wait for a semaphore token, for up to `timeout` seconds, or forever if it's 0."""
+        if not self._waiters.get(key) and self._store.lpop(key):
+            return [key, '1']
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters[key].append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout or None)
+        except TimeoutError:
+            if waiter.done():
+                # We were handed a token just as we timed out
+                return [key, '1']
+            waiter.cancel()
+            return None
+        except BaseException:
+            if waiter.done() and not waiter.cancelled():
+                # We were cancelled after being handed a token; pass it on
+                self._store.lpush(key)
+                self._hand_over(key)
+            else:
+                waiter.cancel()
+            raise
+        return [key, '1']
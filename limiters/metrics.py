@@ -0,0 +1,218 @@
+"""
+Hooks for instrumenting limiters.
+
+Pass an instance of a `LimiterMetrics` subclass as a limiter's `metrics` argument
+to be told how long its Redis calls take, how long it sleeps or blocks waiting
+for capacity, how long semaphores are held, and when calls are rejected.
+Limiters without `metrics` skip all of this, at the cost of an `is None` check.
+"""
+
+import bisect
+import threading
+import time
+from collections import Counter
+from collections.abc import Mapping, Sequence
+from contextvars import ContextVar
+from typing import Any
+
+# Upper bounds of the histogram buckets, in seconds (the same as Prometheus uses by default)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+
+# When the semaphores held in the current context (thread or task) were acquired, per limiter instance
+_acquired_at: ContextVar[Mapping[int, tuple[float, ...]]] = ContextVar('acquired_at', default={})
+
+
+class LimiterMetrics:
+    """
+    Receives measurements from limiters. Subclass it, and override the hooks you need.
+
+    Every hook is passed the limiter, so implementations can label measurements
+    with its class and `name`. Hooks are called inline, so they should be fast,
+    and must not raise.
+    """
+
+    def redis_call(self, limiter: Any, seconds: float) -> None:
+        """A Lua script call to Redis took `seconds`, including the round trip."""
+
+    def slept(self, limiter: Any, seconds: float) -> None:
+        """An acquire slept, or blocked, for `seconds` waiting for capacity."""
+
+    def held(self, limiter: Any, seconds: float) -> None:
+        """A semaphore was held for `seconds`, from entering its context manager until exiting it."""
+
+    def rejected(self, limiter: Any) -> None:
+        """An acquire raised `MaxSleepExceededError`, or a `try_acquire` was refused."""
+
+
+def limiter_labels(limiter: Any) -> tuple[str, str]:
+    """Return the kind (e.g., `AsyncTokenBucket`) and name of a limiter, to label measurements with."""
+    return type(limiter).__name__, limiter.name
+
+
+def report_rejected(limiter: Any) -> None:
+    """Report a rejection, if the limiter has metrics."""
+    if limiter.metrics is not None:
+        limiter.metrics.rejected(limiter)
+
+
+def start_hold(limiter: Any) -> None:
+    """Note that the current context just acquired the semaphore."""
+    acquired = _acquired_at.get()
+    _acquired_at.set({**acquired, id(limiter): (*acquired.get(id(limiter), ()), time.perf_counter())})
+
+
+def end_hold(limiter: Any) -> None:
+    """Report how long the current context held the semaphore it's now releasing."""
+    acquired = dict(_acquired_at.get())
+    if not (started := acquired.get(id(limiter))):
+        # Acquired before metrics were enabled, or outside the context manager
+        return
+    if len(started) == 1:
+        del acquired[id(limiter)]
+    else:
+        acquired[id(limiter)] = started[:-1]
+    _acquired_at.set(acquired)
+    limiter.metrics.held(limiter, time.perf_counter() - started[-1])
+
+
+class Histogram:
+    """A thread-safe histogram with fixed buckets."""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        self.bounds = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self.counts[bisect.bisect_left(self.bounds, value)] += 1
+            self.count += 1
+            self.sum += value
+            self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Estimate the `q` quantile (e.g., 0.99), interpolating within the bucket it falls in."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.bounds[i - 1] if i else 0.0
+                upper = self.bounds[i] if i < len(self.bounds) else self.max
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.max
+
+    def __repr__(self) -> str:
+        return f'Histogram(count={self.count}, sum={self.sum:.6f}, max={self.max:.6f})'
+
+
+class InMemoryMetrics(LimiterMetrics):
+    """
+    Collect histograms of each measurement, and counts of rejections, per limiter.
+
+    Histograms are keyed on the measurement (`redis_call`, `slept` or `held`),
+    and the limiter's kind and name:
+
+        metrics.histograms['slept', 'AsyncTokenBucket', 'foo'].quantile(0.99)
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        self.buckets = buckets
+        self.histograms: dict[tuple[str, str, str], Histogram] = {}
+        self.rejections: Counter[tuple[str, str]] = Counter()
+        self._lock = threading.Lock()
+
+    def _observe(self, measurement: str, limiter: Any, seconds: float) -> None:
+        key = (measurement, *limiter_labels(limiter))
+        if (histogram := self.histograms.get(key)) is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(key, Histogram(self.buckets))
+        histogram.observe(seconds)
+
+    def redis_call(self, limiter: Any, seconds: float) -> None:
+        self._observe('redis_call', limiter, seconds)
+
+    def slept(self, limiter: Any, seconds: float) -> None:
+        self._observe('slept', limiter, seconds)
+
+    def held(self, limiter: Any, seconds: float) -> None:
+        self._observe('held', limiter, seconds)
+
+    def rejected(self, limiter: Any) -> None:
+        with self._lock:
+            self.rejections[limiter_labels(limiter)] += 1
+
+
+class PrometheusMetrics(LimiterMetrics):
+    """
+    Report measurements as Prometheus histograms and counters, labelled by limiter kind and name.
+
+    Requires `prometheus-client` to be installed.
+    """
+
+    def __init__(self, namespace: str = 'limiters', registry: Any = None) -> None:
+        try:
+            import prometheus_client
+        except ImportError as e:
+            raise ImportError('PrometheusMetrics requires prometheus-client: pip install prometheus-client') from e
+
+        registry = registry or prometheus_client.REGISTRY
+        labels = ['kind', 'limiter']
+        self._redis_call = prometheus_client.Histogram(
+            'redis_call_seconds', 'Time spent in Redis calls', labels, namespace=namespace, registry=registry
+        )
+        self._slept = prometheus_client.Histogram(
+            'sleep_seconds', 'Time spent waiting for capacity', labels, namespace=namespace, registry=registry
+        )
+        self._held = prometheus_client.Histogram(
+            'hold_seconds', 'Time semaphores were held for', labels, namespace=namespace, registry=registry
+        )
+        self._rejected = prometheus_client.Counter(
+            'rejections', 'Rejected acquires', labels, namespace=namespace, registry=registry
+        )
+
+    def redis_call(self, limiter: Any, seconds: float) -> None:
+        self._redis_call.labels(*limiter_labels(limiter)).observe(seconds)
+
+    def slept(self, limiter: Any, seconds: float) -> None:
+        self._slept.labels(*limiter_labels(limiter)).observe(seconds)
+
+    def held(self, limiter: Any, seconds: float) -> None:
+        self._held.labels(*limiter_labels(limiter)).observe(seconds)
+
+    def rejected(self, limiter: Any) -> None:
+        self._rejected.labels(*limiter_labels(limiter)).inc()
+
+
+class StatsdMetrics(LimiterMetrics):
+    """
+    Report measurements to a StatsD client, as timings in milliseconds and counters.
+
+    Works with any client with `timing(stat, ms)` and `incr(stat)` methods, like the
+    `statsd` package's. Stats are named `<prefix>.<kind>.<limiter name>.<measurement>`.
+    """
+
+    def __init__(self, client: Any, prefix: str = 'limiters') -> None:
+        self.client = client
+        self.prefix = prefix
+
+    def _stat(self, limiter: Any, measurement: str) -> str:
+        kind, name = limiter_labels(limiter)
+        return f'{self.prefix}.{kind}.{name}.{measurement}'
+
+    def redis_call(self, limiter: Any, seconds: float) -> None:
+        self.client.timing(self._stat(limiter, 'redis_call'), seconds * 1000)
+
+    def slept(self, limiter: Any, seconds: float) -> None:
+        self.client.timing(self._stat(limiter, 'slept'), seconds * 1000)
+
+    def held(self, limiter: Any, seconds: float) -> None:
+        self.client.timing(self._stat(limiter, 'held'), seconds * 1000)
+
+    def rejected(self, limiter: Any) -> None:
+        self.client.incr(self._stat(limiter, 'rejected'))
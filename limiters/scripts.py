@@ -0,0 +1,147 @@
+import hashlib
+import re
+from collections.abc import Iterable, Sequence
+from functools import cache
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, TypeAlias
+
+from redis.exceptions import NoScriptError
+
+if TYPE_CHECKING:
+    from redis import Redis as SyncRedis
+    from redis.asyncio import Redis as AsyncRedis
+    from redis.asyncio.cluster import RedisCluster as AsyncRedisCluster
+    from redis.cluster import RedisCluster as SyncRedisCluster
+
+    from limiters.memory import AsyncMemoryBackend, SyncMemoryBackend
+
+    SyncConnection: TypeAlias = SyncRedis[str] | SyncRedisCluster[str] | SyncMemoryBackend
+    AsyncConnection: TypeAlias = AsyncRedis[str] | AsyncRedisCluster[str] | AsyncMemoryBackend
+
+SCRIPT_DIR = Path(__file__).parent
+INCLUDE_DIR = SCRIPT_DIR / 'include'
+INCLUDE = re.compile(r'^-- include: (\S+)$', re.MULTILINE)
+
+
+class LuaScript:
+    """
+    A Lua script shipped with the package.
+
+    The source is read and hashed once, when the script is first requested
+    through `get_script`, and the same instance is then shared by every
+    limiter and connection in the process.
+
+    Scripts are executed with EVALSHA, and only loaded into Redis when
+    Redis replies with NOSCRIPT (e.g., after a restart or a failover).
+
+    Code shared between scripts lives in the `include` directory, and an
+    `-- include: <name>` line is replaced by that file when the script is read.
+    """
+
+    __slots__ = ('name', 'sha', 'source')
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.source = INCLUDE.sub(lambda m: (INCLUDE_DIR / m[1]).read_text(), (SCRIPT_DIR / name).read_text())
+        self.sha = hashlib.sha1(self.source.encode()).hexdigest()
+
+    def __repr__(self) -> str:
+        return f'LuaScript({self.name!r})'
+
+    def run(self, connection: 'SyncConnection', keys: Sequence[str], args: Iterable[Any]) -> Any:
+        """Run the script on a sync connection."""
+        try:
+            return connection.evalsha(self.sha, len(keys), *keys, *args)  # type: ignore[union-attr]
+        except NoScriptError:
+            connection.script_load(self.source)  # type: ignore[union-attr]
+            return connection.evalsha(self.sha, len(keys), *keys, *args)  # type: ignore[union-attr]
+
+    async def run_async(self, connection: 'AsyncConnection', keys: Sequence[str], args: Iterable[Any]) -> Any:
+        """Run the script on an async connection."""
+        try:
+            return await connection.evalsha(self.sha, len(keys), *keys, *args)  # type: ignore[union-attr]
+        except NoScriptError:
+            await connection.script_load(self.source)  # type: ignore[union-attr]
+            return await connection.evalsha(self.sha, len(keys), *keys, *args)  # type: ignore[union-attr]
+
+    def run_many(
+        self,
+        connection: 'SyncConnection',
+        calls: Sequence[tuple[Sequence[str], Iterable[Any]]],
+        raise_on_error: bool = True,
+    ) -> list[Any]:
+        """
+        Run the script once per `(keys, args)` pair, in a single pipeline.
+
+        Cluster pipelines send the calls for each node in one round trip. Calls refused
+        with NOSCRIPT are run again, in a second pipeline, once the script is loaded.
+        With `raise_on_error=False`, a call that fails gets its exception as its result,
+        instead of it being raised for the whole pipeline.
+        """
+        results = self._pipeline(connection, calls).execute(raise_on_error=False)
+        if retry := [i for i, result in enumerate(results) if isinstance(result, NoScriptError)]:
+            connection.script_load(self.source)  # type: ignore[union-attr]
+            retried = self._pipeline(connection, [calls[i] for i in retry]).execute(raise_on_error=False)
+            for i, result in zip(retry, retried, strict=True):
+                results[i] = result
+        return self._raise_errors(results) if raise_on_error else results
+
+    async def run_many_async(
+        self,
+        connection: 'AsyncConnection',
+        calls: Sequence[tuple[Sequence[str], Iterable[Any]]],
+        raise_on_error: bool = True,
+    ) -> list[Any]:
+        """Run the script once per `(keys, args)` pair, in a single pipeline. See `run_many`."""
+        results = await self._pipeline(connection, calls).execute(raise_on_error=False)
+        if retry := [i for i, result in enumerate(results) if isinstance(result, NoScriptError)]:
+            await connection.script_load(self.source)  # type: ignore[union-attr]
+            retried = await self._pipeline(connection, [calls[i] for i in retry]).execute(raise_on_error=False)
+            for i, result in zip(retry, retried, strict=True):
+                results[i] = result
+        return self._raise_errors(results) if raise_on_error else results
+
+    def _pipeline(self, connection: Any, calls: Sequence[tuple[Sequence[str], Iterable[Any]]]) -> Any:
+        pipeline = connection.pipeline(transaction=False)
+        for keys, args in calls:
+            pipeline.evalsha(self.sha, len(keys), *keys, *args)
+        return pipeline
+
+    @staticmethod
+    def _raise_errors(results: list[Any]) -> list[Any]:
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+        return results
+
+
+@cache
+def get_script(name: str) -> LuaScript:
+    """Return the shared `LuaScript` for a script file in the package."""
+    return LuaScript(name)
+
+
+def _script_names(names: Iterable[str]) -> list[str]:
+    return list(names) or sorted(p.name for p in SCRIPT_DIR.glob('*.lua'))
+
+
+def load_scripts(connection: 'SyncConnection', *names: str) -> None:
+    """
+    Load Lua scripts into Redis ahead of time.
+
+    Call this at startup (and after a failover, if you like) to save the first
+    limiter call from an extra NOSCRIPT round trip. Loads every script in the
+    package unless specific script names are passed.
+    """
+    for name in _script_names(names):
+        connection.script_load(get_script(name).source)  # type: ignore[union-attr]
+
+
+async def load_scripts_async(connection: 'AsyncConnection', *names: str) -> None:
+    """
+    Load Lua scripts into Redis ahead of time.
+
+    See `load_scripts`.
+    """
+    for name in _script_names(names):
+        await connection.script_load(get_script(name).source)  # type: ignore[union-attr]
@@ -4,7 +4,10 @@
 --- is single threaded, there are no race conditions to worry about.
 ---
 --- The script checks if a list exists for the Semaphore, and
---- creates one of length `capacity` if it doesn't.
+--- creates one of length `capacity` if it doesn't. It then tries
+--- to pop a token off the list without blocking, and refreshes
+--- the expiry of both keys if it got one. This lets us acquire
+--- an uncontended semaphore in a single round trip.
 ---
 --- keys:
 --- * key: The key to use for the list
@@ -12,9 +15,10 @@
 ---
 --- args:
 --- * capacity: The capacity of the semaphore (i.e., the length of the list)
+--- * expiry: The expiry of the semaphore keys, in seconds
 ---
 --- returns:
---- * 1 if created, else 0 (but the return value isn't used; only useful for debugging)
+--- * 1 if a token was acquired, else 0 (the caller should then wait for one using BLPOP)
 
 redis.replicate_commands()
 
@@ -22,13 +26,14 @@ redis.replicate_commands()
 local key = tostring(KEYS[1])
 local exists = tostring(KEYS[2])
 local capacity = tonumber(ARGV[1])
+local expiry = tonumber(ARGV[2])
 
 -- Check if list exists
 -- Note, we cannot use `EXISTS` or `LLEN` directly on the `key` below,
 -- as a list in Redis will "stop existing" if it's empty (empty state will occur
 -- whenever the Semaphore is fully utilized). Instead, we use a separate
 -- key to check whether a list has been created for our `key` or not.
-local does_not_exist = redis.call('SETNX', string.format(exists, key), 1)
+local does_not_exist = redis.call('SETNX', exists, 1)
 
 -- Create the list if none exists
 if does_not_exist == 1 then
@@ -39,7 +44,13 @@ if does_not_exist == 1 then
         table.insert(args, 1)
     end
     redis.call(unpack(args))
-    return true
 end
 
-return false
+-- Try to acquire a token without blocking
+if not redis.call('LPOP', key) then
+    return 0
+end
+
+redis.call('EXPIRE', key, expiry)
+redis.call('EXPIRE', exists, expiry)
+return 1
@@ -1,14 +1,17 @@
 import logging
-from datetime import datetime
+import time
 from types import TracebackType
 from typing import ClassVar
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PrivateAttr
 from redis.asyncio.client import Pipeline
 from redis.asyncio.cluster import ClusterPipeline
 
 from limiters import MaxSleepExceededError
-from limiters.base import AsyncLuaScriptBase, SyncLuaScriptBase
+from limiters.base import AsyncLuaScriptBase, KeyLayout, SyncLuaScriptBase
+from limiters.memory import AsyncMemoryPipeline
+from limiters.metrics import end_hold, report_rejected, start_hold
+from limiters.waiters import AsyncWaiterQueue, SyncWaiterQueue
 
 logger = logging.getLogger(__name__)
 
@@ -18,16 +21,25 @@ class SemaphoreBase(BaseModel):
     capacity: int = Field(gt=0)
     max_sleep: float = Field(ge=0, default=0.0)
     expiry: int = 30
+    shared_wait: bool = False
+    key_layout: KeyLayout = KeyLayout.SHARED
+
+    _key: str = PrivateAttr()
+    _exists: str = PrivateAttr()
+
+    def _post_init(self) -> None:
+        self._key = self.key_layout.key('semaphore', self.name)
+        self._exists = f'{self._key}-exists'
 
     @property
     def key(self) -> str:
         """Key to use for the Semaphore list."""
-        return f'{{limiter}}:semaphore:{self.name}'
+        return self._key
 
     @property
     def exists(self) -> str:
         """Key to use when checking if the Semaphore list has been created or not."""
-        return f'{{limiter}}:semaphore:{self.name}-exists'
+        return self._exists
 
     def __str__(self) -> str:
         return f'Semaphore instance for queue {self.key}'
@@ -38,32 +50,71 @@ class SyncSemaphore(SemaphoreBase, SyncLuaScriptBase):
 
     def __enter__(self) -> None:
         """
-        Call the semaphore Lua script to create a semaphore, then call BLPOP to acquire it.
+        Call the semaphore Lua script to create the semaphore and try to acquire
+        a token from it. If none are free, call BLPOP to wait for one.
+
+        With `shared_wait`, waiting threads in this process queue up locally, in FIFO
+        order, behind a single BLPOP call in a dispatcher thread, instead of holding
+        a connection each.
         """
-        # Retrieve timestamp for when to wake up from Redis
-        semaphore_created: bool = self.script(
-            keys=[self.key, self.exists],
-            args=[self.capacity],
-        )
-
-        if semaphore_created:
-            logger.info('Created new semaphore `%s` with capacity %s', self.name, self.capacity)
+        if self.shared_wait and SyncWaiterQueue.get(self):
+            # Get in line behind the waiters that were here first
+            acquired = False
+        else:
+            acquired = self.script(keys=[self.key, self.exists], args=[self.capacity, self.expiry])
+        if acquired:
+            logger.debug('Acquired semaphore %s', self.name)
+            if self.metrics is not None:
+                self.metrics.slept(self, 0.0)
+                start_hold(self)
+            return
+
+        logger.debug('Waiting for semaphore %s', self.name)
+        start = time.perf_counter()
+        if self.shared_wait:
+            acquired = SyncWaiterQueue.wait(self)
         else:
-            logger.debug('Skipped creating semaphore, since one exists')
+            acquired = self.connection.blpop(self.key, self.max_sleep) is not None
+            if acquired:
+                self.refresh_expiry()
+
+        if not acquired:
+            # We only get here if we timed out after `max_sleep` seconds
+            report_rejected(self)
+            raise MaxSleepExceededError('Max sleep exceeded waiting for Semaphore')
+
+        logger.debug('Acquired semaphore %s', self.name)
+        if self.metrics is not None:
+            self.metrics.slept(self, time.perf_counter() - start)
+            start_hold(self)
 
-        start = datetime.now()
+    def try_acquire(self) -> bool:
+        """
+        Acquire a token only if one is free right away, without blocking.
+
+        Returns whether we got one; if so, return it with `release()` when done.
+        With `shared_wait`, we don't jump ahead of threads already waiting.
+        """
+        if self.shared_wait and SyncWaiterQueue.get(self):
+            report_rejected(self)
+            return False
+        acquired = bool(self.script(keys=[self.key, self.exists], args=[self.capacity, self.expiry]))
+        if acquired:
+            logger.debug('Acquired semaphore %s', self.name)
+        else:
+            report_rejected(self)
+        return acquired
 
-        self.connection.blpop(self.key, self.max_sleep)
+    def refresh_expiry(self) -> None:
+        """Refresh the expiry of the semaphore keys, after acquiring a token with BLPOP."""
         pipeline = self.connection.pipeline()
         pipeline.expire(self.key, self.expiry)
         pipeline.expire(self.exists, self.expiry)
         pipeline.execute()
 
-        # Raise an exception if we exceeded `max_sleep`
-        if 0.0 < self.max_sleep < (datetime.now() - start).total_seconds():
-            raise MaxSleepExceededError('Max sleep exceeded waiting for Semaphore')
-
-        logger.debug('Acquired semaphore %s', self.name)
+    def release(self) -> None:
+        """Return a token to the semaphore."""
+        self.run_script('semaphore_release.lua', keys=[self.key, self.exists], args=[self.expiry])
 
     def __exit__(
         self,
@@ -71,11 +122,9 @@ class SyncSemaphore(SemaphoreBase, SyncLuaScriptBase):
         exc_val: BaseException | None,
         exc_tb: TracebackType | None,
     ) -> None:
-        pipeline = self.connection.pipeline()
-        pipeline.lpush(self.key, 1)
-        pipeline.expire(self.key, self.expiry)
-        pipeline.expire(self.exists, self.expiry)
-        pipeline.execute()
+        if self.metrics is not None:
+            end_hold(self)
+        self.release()
 
         logger.debug('Released semaphore %s', self.name)
 
@@ -85,31 +134,65 @@ class AsyncSemaphore(SemaphoreBase, AsyncLuaScriptBase):
 
     async def __aenter__(self) -> None:
         """
-        Call the semaphore Lua script to create a semaphore, then call BLPOP to acquire it.
-        """
-        # Retrieve timestamp for when to wake up from Redis
+        Call the semaphore Lua script to create the semaphore and try to acquire
+        a token from it. If none are free, call BLPOP to wait for one.
 
-        if await self.script(
-            keys=[self.key, self.exists],
-            args=[self.capacity],
-        ):
-            logger.info('Created new semaphore `%s` with capacity %s', self.name, self.capacity)
+        With `shared_wait`, waiters in this process queue up locally, in FIFO order,
+        behind a single BLPOP call, instead of holding a connection each.
+        """
+        if self.shared_wait and AsyncWaiterQueue.get(self):
+            # Get in line behind the waiters that were here first
+            acquired = False
         else:
-            logger.debug('Skipped creating semaphore, since one exists')
+            acquired = await self.script(keys=[self.key, self.exists], args=[self.capacity, self.expiry])
+
+        start = time.perf_counter()
+        if not acquired:
+            logger.debug('Waiting for semaphore %s', self.name)
+            if self.shared_wait:
+                acquired = await AsyncWaiterQueue.wait(self)
+            else:
+                acquired = await self.connection.blpop(self.key, self.max_sleep) is not None  # type: ignore[union-attr]
+                if acquired:
+                    await self.refresh_expiry()
+
+            if not acquired:
+                # We only get here if we timed out after `max_sleep` seconds
+                report_rejected(self)
+                raise MaxSleepExceededError(f'Max sleep ({self.max_sleep}s) exceeded waiting for Semaphore')
+
+        logger.debug('Acquired semaphore %s', self.name)
+        if self.metrics is not None:
+            self.metrics.slept(self, time.perf_counter() - start)
+            start_hold(self)
+
+    async def try_acquire(self) -> bool:
+        """
+        Acquire a token only if one is free right away, without blocking.
 
-        start = datetime.now()
+        Returns whether we got one; if so, return it with `release()` when done.
+        With `shared_wait`, we don't jump ahead of coroutines already waiting.
+        """
+        if self.shared_wait and AsyncWaiterQueue.get(self):
+            report_rejected(self)
+            return False
+        acquired = bool(await self.script(keys=[self.key, self.exists], args=[self.capacity, self.expiry]))
+        if acquired:
+            logger.debug('Acquired semaphore %s', self.name)
+        else:
+            report_rejected(self)
+        return acquired
 
-        await self.connection.blpop(self.key, self.max_sleep)  # type: ignore[union-attr]
-        pipeline: Pipeline[str] | ClusterPipeline[str] = self.connection.pipeline()
+    async def refresh_expiry(self) -> None:
+        """Refresh the expiry of the semaphore keys, after acquiring a token with BLPOP."""
+        pipeline: Pipeline[str] | ClusterPipeline[str] | AsyncMemoryPipeline = self.connection.pipeline()
         pipeline.expire(self.key, self.expiry)  # type: ignore[union-attr]
         pipeline.expire(self.exists, self.expiry)  # type: ignore[union-attr]
         await pipeline.execute()
 
-        # Raise an exception if we waited too long
-        if 0.0 < self.max_sleep < (datetime.now() - start).total_seconds():
-            raise MaxSleepExceededError(f'Max sleep ({self.max_sleep}s) exceeded waiting for Semaphore')
-
-        logger.debug('Acquired semaphore %s', self.name)
+    async def release(self) -> None:
+        """Return a token to the semaphore."""
+        await self.run_script('semaphore_release.lua', keys=[self.key, self.exists], args=[self.expiry])
 
     async def __aexit__(
         self,
@@ -117,10 +200,8 @@ class AsyncSemaphore(SemaphoreBase, AsyncLuaScriptBase):
         exc_val: BaseException | None,
         exc_tb: TracebackType | None,
     ) -> None:
-        pipeline: Pipeline[str] | ClusterPipeline[str] = self.connection.pipeline()
-        pipeline.lpush(self.key, 1)  # type: ignore[union-attr]
-        pipeline.expire(self.key, self.expiry)  # type: ignore[union-attr]
-        pipeline.expire(self.exists, self.expiry)  # type: ignore[union-attr]
-        await pipeline.execute()
+        if self.metrics is not None:
+            end_hold(self)
+        await self.release()
 
         logger.debug('Released semaphore %s', self.name)
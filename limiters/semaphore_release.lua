@@ -0,0 +1,19 @@
+--- Script called from the Semaphore implementation, to release a token.
+---
+--- Returns the token to the Semaphore list, and refreshes the
+--- expiry of the semaphore keys, in a single round trip.
+---
+--- keys:
+--- * key: The key to use for the list
+--- * exists: The key to use for the string we use to check if the lists exists
+---
+--- args:
+--- * expiry: The expiry of the semaphore keys, in seconds
+
+local key = KEYS[1]
+local exists = KEYS[2]
+local expiry = tonumber(ARGV[1])
+
+redis.call('LPUSH', key, 1)
+redis.call('EXPIRE', key, expiry)
+redis.call('EXPIRE', exists, expiry)
@@ -0,0 +1,117 @@
+import asyncio
+import logging
+import time
+from types import TracebackType
+from typing import ClassVar
+from uuid import uuid4
+
+from pydantic import BaseModel, Field, PrivateAttr
+
+from limiters import MaxSleepExceededError
+from limiters.base import AsyncLuaScriptBase, KeyLayout, SyncLuaScriptBase
+from limiters.metrics import report_rejected
+
+logger = logging.getLogger(__name__)
+
+
+class SlidingWindowBase(BaseModel):
+    name: str
+    capacity: int = Field(gt=0)
+    window: float = Field(gt=0)
+    max_sleep: float = Field(ge=0, default=0.0)
+    approximate: bool = False
+    key_layout: KeyLayout = KeyLayout.SHARED
+
+    _key: str = PrivateAttr()
+    _script_name: str = PrivateAttr()
+
+    def _post_init(self) -> None:
+        variant = 'counter' if self.approximate else 'log'
+        self._key = self.key_layout.key(f'sliding-window-{variant}', self.name)
+        self._script_name = f'sliding_window_{variant}.lua'
+
+    @property
+    def key(self) -> str:
+        """Key to use for the window's log or counts."""
+        return self._key
+
+    def _script_args(self, tokens: int) -> list[int | str]:
+        if not 0 < tokens <= self.capacity:
+            raise ValueError(
+                f'Cannot acquire {tokens} tokens from {self.name}; must be between 1 and the capacity ({self.capacity})'
+            )
+        return [self.capacity, int(self.window * 1000), tokens, uuid4().hex[:16]]
+
+    def _sleep_time(self, retry_after: int, start: float) -> float:
+        """
+        Work out how long to sleep before trying again.
+
+        The script tells us how long it'll take for enough tokens to leave the
+        window, so we raise right away if that's beyond `max_sleep`.
+        """
+        sleep_time = retry_after / 1000
+        if self.max_sleep != 0.0 and time.monotonic() - start + sleep_time > self.max_sleep:
+            report_rejected(self)
+            raise MaxSleepExceededError(
+                f'Max sleep ({self.max_sleep}s) exceeded waiting for sliding window {self.name}'
+            )
+        return sleep_time
+
+    def __str__(self) -> str:
+        return f'Sliding window instance for {self.key}'
+
+
+class SyncSlidingWindow(SlidingWindowBase, SyncLuaScriptBase):
+    script_name: ClassVar[str] = 'sliding_window_log.lua'
+
+    def __enter__(self) -> float:
+        return self.acquire()
+
+    def acquire(self, tokens: int = 1) -> float:
+        """
+        Acquire `tokens` tokens from the window, sleeping until there's
+        room for them. Returns the time slept.
+        """
+        start = time.monotonic()
+        while retry_after := self.run_script(self._script_name, keys=[self.key], args=self._script_args(tokens)):
+            time.sleep(self._sleep_time(retry_after, start))
+        slept = time.monotonic() - start
+        if self.metrics is not None:
+            self.metrics.slept(self, slept)
+        return slept
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_val: BaseException | None,
+        exc_tb: TracebackType | None,
+    ) -> None:
+        return
+
+
+class AsyncSlidingWindow(SlidingWindowBase, AsyncLuaScriptBase):
+    script_name: ClassVar[str] = 'sliding_window_log.lua'
+
+    async def __aenter__(self) -> None:
+        await self.acquire()
+
+    async def acquire(self, tokens: int = 1) -> float:
+        """
+        Acquire `tokens` tokens from the window, sleeping until there's
+        room for them. Returns the time slept.
+        """
+        start = time.monotonic()
+        while retry_after := await self.run_script(self._script_name, keys=[self.key], args=self._script_args(tokens)):
+            await asyncio.sleep(self._sleep_time(retry_after, start))
+        slept = time.monotonic() - start
+        if self.metrics is not None:
+            self.metrics.slept(self, slept)
+        return slept
+
+    async def __aexit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_val: BaseException | None,
+        exc_tb: TracebackType | None,
+    ) -> None:
+        return
@@ -0,0 +1,69 @@
+--- Script called from the SlidingWindow implementation, with `approximate=True`.
+---
+--- Lua scripts are run atomically by default, and since redis
+--- is single threaded, there are no race conditions to worry about.
+---
+--- Instead of logging every token, we count the tokens handed out in the current
+--- and the previous fixed window, and estimate the number in the rolling window
+--- by assuming the previous window's tokens were handed out evenly:
+---
+---     estimate = previous * (1 - elapsed fraction of the current window) + current
+---
+--- The state is stored as a single string: "<window number> <current> <previous>".
+---
+--- keys:
+--- * key: The key to use for the window counts
+---
+--- args:
+--- * capacity: The max number of tokens to hand out per window
+--- * window: The length of the window, in milliseconds
+--- * tokens: The number of tokens to acquire
+---
+--- returns:
+--- * 0 if the tokens were acquired, else the estimated number of
+---   milliseconds until enough tokens have left the window
+
+redis.replicate_commands()
+
+local key = KEYS[1]
+local capacity = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local tokens = tonumber(ARGV[3])
+
+-- Use the Redis clock, so windows don't depend on client clocks
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+
+local number = math.floor(now / window)
+local elapsed = (now - number * window) / window
+
+-- Retrieve the counts for the current and previous window, if any
+local current = 0
+local previous = 0
+local data = redis.call('GET', key)
+if data then
+    local stored_number, stored_current, stored_previous = data:match('(%S+) (%S+) (%S+)')
+    stored_number = tonumber(stored_number)
+    if stored_number == number then
+        current = tonumber(stored_current)
+        previous = tonumber(stored_previous)
+    elseif stored_number == number - 1 then
+        previous = tonumber(stored_current)
+    end
+end
+
+if previous * (1 - elapsed) + current + tokens <= capacity then
+    -- The previous window's count is needed until the next one is over
+    redis.call('SET', key, string.format('%d %d %d', number, current + tokens, previous), 'PX', 2 * window)
+    return 0
+end
+
+local wait
+if current + tokens <= capacity then
+    -- Wait for enough of the previous window to slide out
+    wait = (1 - (capacity - current - tokens) / previous - elapsed) * window
+else
+    -- Wait for the next window, and for enough of this one to slide out
+    wait = (1 - elapsed) * window + math.max(1 - (capacity - tokens) / current, 0) * window
+end
+return math.max(math.ceil(wait), 1)
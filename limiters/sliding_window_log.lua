@@ -0,0 +1,53 @@
+--- Script called from the SlidingWindow implementation, with `approximate=False`.
+---
+--- Lua scripts are run atomically by default, and since redis
+--- is single threaded, there are no race conditions to worry about.
+---
+--- Every token handed out is logged in a sorted set, scored by the time it
+--- was handed out. Entries older than the window are dropped before we check
+--- whether there's room for more, so the limit holds over any rolling window.
+---
+--- keys:
+--- * key: The key to use for the sorted set of tokens
+---
+--- args:
+--- * capacity: The max number of tokens to hand out per window
+--- * window: The length of the window, in milliseconds
+--- * tokens: The number of tokens to acquire
+--- * id: A unique ID for this call, used to name the sorted set members
+---
+--- returns:
+--- * 0 if the tokens were acquired, else the number of milliseconds
+---   until enough tokens have left the window
+
+redis.replicate_commands()
+
+local key = KEYS[1]
+local capacity = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local tokens = tonumber(ARGV[3])
+local id = ARGV[4]
+
+-- Use the Redis clock, so windows don't depend on client clocks
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+
+-- Forget tokens that have left the window
+redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+
+local count = redis.call('ZCARD', key)
+if count + tokens <= capacity then
+    local args = { 'ZADD', key }
+    for i = 1, tokens do
+        table.insert(args, now)
+        table.insert(args, id .. ':' .. i)
+    end
+    redis.call(unpack(args))
+    redis.call('PEXPIRE', key, window)
+    return 0
+end
+
+-- Wait until the oldest tokens in the way have left the window
+local index = count + tokens - capacity - 1
+local oldest = redis.call('ZRANGE', key, index, index, 'WITHSCORES')
+return math.max(tonumber(oldest[2]) + window - now, 1)
@@ -10,18 +10,51 @@
 ---
 --- The token bucket implementation is forward looking, so we're really just handing
 --- out the next time there would be tokens in the bucket, and letting the client
+--- sleep until then.
+---
+--- args:
+--- * capacity: The maximum number of tokens in the bucket
+--- * refill_amount: The number of tokens added per refill
+--- * refill_frequency: The number of seconds between refills
+--- * seconds, microseconds: The current time, or empty strings to use the Redis server's clock
+--- * tokens: The number of tokens to acquire (defaults to 1)
+--- * ttl: How long to keep the state, in milliseconds, or an empty string to keep it
+---   until the bucket would have refilled completely
+--- * packed: 1 to save the state in the packed encoding, or an empty string
+--- * max_wait: The longest wait to accept, in milliseconds (optional)
+---
+--- The state is saved as described in include/token_bucket.lua, and kept until
+--- the bucket would have refilled completely, unless a TTL is passed.
 ---
 --- returns:
---- * The assigned slot, as a millisecond timestamp
+--- * The assigned slot, as a millisecond timestamp, or when using the server's
+---   clock, the number of milliseconds to wait until the slot
+--- * If max_wait is passed: whether the tokens were reserved (1 or 0), the
+---   number of milliseconds to wait for them, and if they were reserved, the
+---   assigned slot, to refund them to. Nothing is saved if the wait exceeds max_wait.
 
 redis.replicate_commands()
 
+-- include: token_bucket.lua
+
 -- Arguments
 local capacity = tonumber(ARGV[1])
 local refill_amount = tonumber(ARGV[2])
 local time_between_slots = tonumber(ARGV[3]) * 1000 -- Convert to milliseconds
 local seconds = tonumber(ARGV[4])
 local microseconds = tonumber(ARGV[5])
+local requested = tonumber(ARGV[6]) or 1
+local ttl = tonumber(ARGV[7])
+local packed = ARGV[8] == '1'
+local max_wait = tonumber(ARGV[9])
+
+-- Use the server's clock if the client didn't pass its own
+local server_time = not seconds
+if server_time then
+    local time = redis.call('TIME')
+    seconds = tonumber(time[1])
+    microseconds = tonumber(time[2])
+end
 
 -- Keys
 local data_key = KEYS[1]
@@ -29,38 +62,27 @@ local data_key = KEYS[1]
 -- Get current time in milliseconds
 local now = (tonumber(seconds) * 1000) + (tonumber(microseconds) / 1000)
 
--- Default bucket values (used if no bucket exists yet)
-local tokens = capacity
-local slot = now
-
--- Retrieve stored state, if any
-local data = redis.call('GET', data_key)
-if data then
-    local last_slot, stored_tokens = data:match('(%S+) (%S+)')
-    slot = tonumber(last_slot)
-    tokens = tonumber(stored_tokens)
+-- Work out the slot, from the stored state, if any
+local slot, tokens, credits, reserved, due = reserve_slot(
+    redis.call('GET', data_key), now, capacity, refill_amount, time_between_slots, requested
+)
 
-    -- Calculate the number of slots that have passed since the last update
-    local slots_passed = math.floor((now - slot) / time_between_slots)
-    if slots_passed > 0 then
-        -- Refill the tokens based on the number of slots passed, capped by capacity
-        tokens = math.min(tokens + slots_passed * refill_amount, capacity)
-        -- Update the slot to this run, adding a penalty for execution time
-        slot = now + 20
-    end
+-- Refuse without saving anything, if the caller won't wait that long
+local wait = math.max(math.ceil(due - now), 0)
+if max_wait and wait > max_wait then
+    return { 0, wait }
 end
 
--- If no tokens are left, move to the next slot and refill accordingly
-if tokens <= 0 then
-    slot = slot + time_between_slots
-    tokens = refill_amount
-end
-
--- Consume a token
-tokens = tokens - 1
-
--- Save updated state and set expiry
-redis.call('SETEX', data_key, 30, string.format('%d %d', slot, tokens))
+-- Save updated state
+local expiry = state_expiry(ttl, slot, now, capacity, refill_amount, time_between_slots)
+redis.call('SET', data_key, encode_state(slot, tokens, packed, credits), 'PX', expiry)
 
--- Return the slot when the next token will be available
-return slot
+-- Return the slot when the requested tokens will be available,
+-- relative to now if the client can't rely on its own clock
+if max_wait then
+    return { 1, wait, math.floor(reserved) }
+end
+if server_time then
+    return math.max(math.ceil(reserved - now), 0)
+end
+return reserved
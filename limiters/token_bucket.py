@@ -1,16 +1,25 @@
 import asyncio
 import logging
+import math
+import sys
+import threading
 import time
-from datetime import datetime
+from collections.abc import Callable, Sequence
 from types import TracebackType
-from typing import ClassVar
+from typing import Any, ClassVar
+from weakref import WeakKeyDictionary
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PrivateAttr, validator
 
-from limiters import MaxSleepExceededError
-from limiters.base import AsyncLuaScriptBase, SyncLuaScriptBase
+from limiters import MaxSleepExceededError, circuit
+from limiters.base import AcquireResult, AsyncLuaScriptBase, KeyLayout, SyncLuaScriptBase
+from limiters.logs import RateLimitedLogger
+from limiters.metrics import report_rejected
+from limiters.scripts import get_script
+from limiters.waiters import SyncReservationDispatcher
 
 logger = logging.getLogger(__name__)
+sleep_logger = RateLimitedLogger(logger)
 
 
 def create_redis_time_tuple() -> tuple[int, int]:
@@ -26,40 +35,219 @@ def create_redis_time_tuple() -> tuple[int, int]:
     return seconds_part, microseconds_part
 
 
+class TokenLease:
+    """
+    Tokens reserved from a bucket in a single script call, and handed out locally.
+
+    All the tokens are due at `slot`, and can be handed out until `expires`
+    (both local millisecond timestamps). Whatever is left after that is dropped,
+    so a lease never holds on to tokens for long. `reserved` is the bucket's slot
+    the tokens were taken from, to give unused tokens back to.
+    """
+
+    __slots__ = ('expires', 'lock', 'reserved', 'slot', 'tokens')
+
+    def __init__(self, lock: Any) -> None:
+        self.lock = lock
+        self.slot = 0
+        self.reserved = 0
+        self.tokens = 0
+        self.expires = 0.0
+
+    def take(self, tokens: int) -> bool:
+        """Take tokens from the lease, if it has enough left and hasn't expired."""
+        if tokens > self.tokens or time.time() * 1000 >= self.expires:
+            return False
+        self.tokens -= tokens
+        return True
+
+    def put_back(self, slot: int, tokens: int) -> None:
+        """Return tokens we took, unless the lease has been renewed since."""
+        if slot == self.slot:
+            self.tokens += tokens
+
+    def renew(self, slot: int, reserved: int, tokens: int, duration_ms: float) -> None:
+        self.slot = slot
+        self.reserved = reserved
+        self.tokens = tokens
+        self.expires = max(slot, time.time() * 1000) + duration_ms
+
+    def clear(self) -> int:
+        """Empty the lease, and return the number of unexpired tokens that were left."""
+        tokens = self.tokens if time.time() * 1000 < self.expires else 0
+        self.tokens = 0
+        return tokens
+
+
+# Token leases, per connection and bucket key, shared by every limiter instance in the process
+_token_leases: WeakKeyDictionary[Any, dict[str, TokenLease]] = WeakKeyDictionary()
+_token_leases_lock = threading.Lock()
+
+# Refunds from cancelled acquires, which we hold on to until they're done
+_refunds: set[asyncio.Task[Any]] = set()
+
+
 class TokenBucketBase(BaseModel):
     name: str
     capacity: int = Field(gt=0)
     refill_frequency: float = Field(gt=0)
     refill_amount: int = Field(gt=0)
     max_sleep: float = Field(ge=0, default=0.0)
+    lease_size: int = Field(gt=0, default=1)
+    lease_duration: float | None = Field(gt=0, default=None)
+    key_layout: KeyLayout = KeyLayout.SHARED
+    server_time: bool = False
+    local_circuit: bool = False
+    queue_horizon: float | None = Field(gt=0, default=None)
+    ttl: float | None = Field(gt=0, default=None)
+    packed_state: bool = False
 
-    def parse_timestamp(self, timestamp: int) -> float:
-        # Parse to datetime
-        wake_up_time = datetime.fromtimestamp(timestamp / 1000)
+    _key: str = PrivateAttr()
+
+    @validator('lease_size')
+    def lease_size_within_capacity(cls, v: int, values: dict[str, Any]) -> int:
+        if 'capacity' in values and v > values['capacity']:
+            raise ValueError('lease_size cannot exceed the capacity')
+        return v
+
+    def _post_init(self) -> None:
+        self._key = self.key_layout.key('token-bucket', self.name)
 
-        # Establish the current time, with a very small buffer for processing time
-        now = datetime.now()
+    def _lease(self, connection: Any, new_lock: Callable[[], Any]) -> TokenLease | None:
+        """Return the local token lease for this bucket, if leasing is enabled."""
+        if self.lease_size == 1:
+            return None
+        with _token_leases_lock:
+            leases = _token_leases.setdefault(connection, {})
+            if (lease := leases.get(self.key)) is None:
+                lease = leases[self.key] = TokenLease(new_lock())
+            return lease
+
+    def _lease_ms(self) -> float:
+        return (self.lease_duration or self.refill_frequency) * 1000
+
+    def _rate(self) -> tuple[int, int]:
+        """The bucket's capacity and refill amount, which adaptive buckets take from their limit."""
+        return self.capacity, self.refill_amount
+
+    def _script_args(self, tokens: int) -> list[int | float | str]:
+        capacity, refill_amount = self._rate()
+        if not 0 < tokens <= capacity:
+            raise ValueError(
+                f'Cannot acquire {tokens} tokens from {self.name}; must be between 1 and the capacity ({capacity})'
+            )
+        # Empty strings make the scripts use their defaults
+        state = [int(self.ttl * 1000) if self.ttl else '', 1 if self.packed_state else '']
+        if self.server_time:
+            # Empty timestamps make the scripts use the Redis server's clock
+            return [capacity, refill_amount, self.refill_frequency, '', '', tokens, *state]
+        seconds, microseconds = create_redis_time_tuple()
+        return [capacity, refill_amount, self.refill_frequency, seconds, microseconds, tokens, *state]
+
+    def sleep_time(self, result: int) -> float:
+        """Work out how long to sleep, from the result of the token bucket script."""
+        if self.server_time:
+            return self.parse_wait(result)
+        return self.parse_timestamp(result)
+
+    def parse_wait(self, wait: int) -> float:
+        """Validate a wait, in milliseconds, as returned when using the server's clock."""
+        if wait <= 0:
+            return 0
+        return self._check_sleep_time(wait / 1000)
+
+    def parse_timestamp(self, timestamp: int) -> float:
+        """Work out how long to sleep until `timestamp`, in milliseconds, as returned by the script."""
+        sleep_time = timestamp / 1000 - time.time()
 
         # Return if we don't need to sleep
-        if wake_up_time < now:
+        if sleep_time <= 0:
             return 0
 
-        # Establish how long we should sleep
-        sleep_time = (wake_up_time - now).total_seconds()
+        return self._check_sleep_time(sleep_time)
+
+    def _admission_args(self, tokens: int, queued: float) -> list[int | float | str]:
+        """
+        Script arguments to reserve tokens only if they're due within `queue_horizon`,
+        and within what's left of `max_sleep` after we've `queued` for that many seconds.
+        """
+        limits = [] if self.queue_horizon is None else [self.queue_horizon]
+        if self.max_sleep != 0.0:
+            limits.append(self.max_sleep - queued)
+        return [*self._script_args(tokens), math.floor(max(min(limits), 0) * 1000) if limits else sys.maxsize]
+
+    def _due(self, called: float, wait: int) -> int:
+        """Convert an admitted wait, in milliseconds, to a local millisecond timestamp."""
+        # With the server's clock, the wait counts from when the script ran, so count from its reply
+        return int((time.time() if self.server_time else called) * 1000) + wait
+
+    def _requeue_time(self, tokens: int, wait: int, queued: float) -> float:
+        """
+        Work out how long to wait, without a reservation, before asking for refused tokens again.
 
+        Raises if they're due later than `max_sleep` allows. Otherwise they were refused
+        for being beyond `queue_horizon`, so we wait until they'd be due within it.
+        """
+        if self.max_sleep != 0.0 and queued + wait / 1000 > self.max_sleep:
+            if self.local_circuit and tokens == 1:
+                # Nothing was reserved, so this only tells us when a single token is due
+                circuit.trip(self.connection, self.key, wait / 1000)  # type: ignore[attr-defined]
+            raise self._max_sleep_error(queued + wait / 1000)
+        return max(wait / 1000 - (self.queue_horizon or 0), 0.001)
+
+    def _refund_args(self, tokens: int, slot: int | None) -> list[int | float | str]:
+        # Without a slot, the tokens were taken from the current one
+        return [*self._script_args(tokens), '' if slot is None else slot]
+
+    def _reserve_args(self, tokens: int) -> list[int | float | str]:
+        # Always get a relative wait back, and reserve nothing if it's longer than `max_sleep`
+        return [*self._script_args(tokens), int(self.max_sleep * 1000) if self.max_sleep else sys.maxsize]
+
+    @staticmethod
+    def _reserve_calls(
+        buckets: Sequence['TokenBucketBase'], tokens: int
+    ) -> list[tuple[list[int], list[tuple[list[str], list[int | float | str]]]]]:
+        """
+        Group the script calls for `reserve_many` by connection, so each connection gets
+        one pipeline. Returns the indexes of the buckets in each group, with their calls.
+        """
+        groups: dict[int, list[int]] = {}
+        for i, bucket in enumerate(buckets):
+            groups.setdefault(id(bucket.connection), []).append(i)  # type: ignore[attr-defined]
+        return [
+            (indexes, [([buckets[i].key], buckets[i]._reserve_args(tokens)) for i in indexes])
+            for indexes in groups.values()
+        ]
+
+    def _check_circuit(self) -> None:
+        """With `local_circuit`, fail fast if we already know we'd sleep for longer than `max_sleep`."""
+        if (
+            self.local_circuit
+            and self.max_sleep != 0.0
+            and (wait := circuit.busy_for(self.connection, self.key)) > self.max_sleep  # type: ignore[attr-defined]
+        ):
+            raise self._max_sleep_error(wait)
+
+    def _max_sleep_error(self, sleep_time: float) -> MaxSleepExceededError:
+        report_rejected(self)
+        return MaxSleepExceededError(
+            f'Scheduled to sleep `{sleep_time}` seconds. '
+            f'This exceeds the maximum accepted sleep time of `{self.max_sleep}` seconds for {self.name}.'
+        )
+
+    def _check_sleep_time(self, sleep_time: float) -> float:
         # Raise an error if we exceed the maximum sleep setting
         if self.max_sleep != 0.0 and sleep_time > self.max_sleep:
-            raise MaxSleepExceededError(
-                f'Scheduled to sleep `{sleep_time}` seconds. '
-                f'This exceeds the maximum accepted sleep time of `{self.max_sleep}` seconds for {self.name}.'
-            )
+            if self.local_circuit:
+                circuit.trip(self.connection, self.key, sleep_time)  # type: ignore[attr-defined]
+            raise self._max_sleep_error(sleep_time)
 
-        logger.info('Sleeping %s seconds (%s)', sleep_time, self.name)
+        sleep_logger.info('Sleeping %s seconds (%s)', sleep_time, self.name)
         return sleep_time
 
     @property
     def key(self) -> str:
-        return f'{{limiter}}:token-bucket:{self.name}'
+        return self._key
 
     def __str__(self) -> str:
         return f'Token bucket instance for queue {self.key}'
@@ -68,26 +256,156 @@ class TokenBucketBase(BaseModel):
 class SyncTokenBucket(TokenBucketBase, SyncLuaScriptBase):
     script_name: ClassVar[str] = 'token_bucket.lua'
 
+    shared_wait: bool = False
+
+    @validator('shared_wait')
+    def shared_wait_without_leases(cls, v: bool, values: dict[str, Any]) -> bool:
+        if v and (values.get('lease_size', 1) > 1 or values.get('queue_horizon') is not None):
+            raise ValueError('shared_wait cannot be combined with lease_size or queue_horizon')
+        return v
+
     def __enter__(self) -> float:
         """
         Call the token bucket Lua script, receive a datetime for
         when to wake up, then sleep up until that point in time.
         """
+        return self.acquire()
 
-        # Retrieve timestamp for when to wake up from Redis
-        seconds, microseconds = create_redis_time_tuple()
-        timestamp: int = self.script(
-            keys=[self.key],
-            args=[self.capacity, self.refill_amount, self.refill_frequency, seconds, microseconds],
-        )
+    def acquire(self, tokens: int = 1) -> float:
+        """
+        Acquire `tokens` tokens from the bucket in a single call,
+        sleeping until they're available. Returns the time slept.
+
+        When `lease_size` is set, tokens are handed out from a local lease
+        instead, which only calls Redis once per `lease_size` tokens. With
+        `shared_wait`, a dispatcher thread reserves the tokens, and wakes us
+        up when they're due.
+        """
+
+        self._check_circuit()
+        if self.shared_wait:
+            return self._acquire_shared(tokens)
+
+        # Retrieve when to wake up from our lease, or from Redis
+        queued = 0.0
+        lease = self._lease(self.connection, threading.Lock)
+        if lease is not None and tokens <= self.lease_size:
+            with lease.lock:
+                if not lease.take(tokens):
+                    due, queued, slot = self._reserve(self.lease_size)
+                    lease.renew(due, slot, self.lease_size - tokens, self._lease_ms())
+                timestamp = lease.slot
+        else:
+            timestamp, queued, _ = self._reserve(tokens)
 
         # Estimate sleep time
         sleep_time = self.parse_timestamp(timestamp)
 
         # Sleep before returning
-        time.sleep(sleep_time)
+        if sleep_time:
+            time.sleep(sleep_time)
+        if self.metrics is not None:
+            self.metrics.slept(self, queued + sleep_time)
 
-        return sleep_time
+        return queued + sleep_time
+
+    def _acquire_shared(self, tokens: int) -> float:
+        waiter = SyncReservationDispatcher.wait(self, tokens)
+        if not waiter.granted:
+            if self.local_circuit and tokens == 1:
+                # Nothing was reserved, so this only tells us when a single token is due
+                circuit.trip(self.connection, self.key, waiter.wait)
+            raise self._max_sleep_error(waiter.wait)
+
+        if waiter.wait:
+            sleep_logger.info('Slept %s seconds (%s)', waiter.wait, self.name)
+        if self.metrics is not None:
+            self.metrics.slept(self, waiter.wait)
+        return waiter.wait
+
+    def _reserve(self, tokens: int) -> tuple[int, float, int]:
+        """
+        Reserve tokens from the bucket, and return when they're due, as a local millisecond
+        timestamp, how many seconds we queued locally, without a reservation, first, and
+        the bucket's slot they were reserved in.
+
+        With `max_sleep` or `queue_horizon` set, the script only reserves tokens due within
+        them, so callers that give up don't push back the callers queued behind them.
+        """
+        # With our own clock, and no limits, the script's reply is the slot, and when it's due
+        if self.max_sleep == 0.0 and self.queue_horizon is None and not self.server_time:
+            slot = self.script(keys=[self.key], args=self._script_args(tokens))
+            return slot, 0.0, slot
+
+        started = called = time.time()
+        while True:
+            granted, wait, *reserved = self.script(keys=[self.key], args=self._admission_args(tokens, called - started))
+            if granted:
+                return self._due(called, wait), called - started, reserved[0]
+            time.sleep(self._requeue_time(tokens, wait, time.time() - started))
+            called = time.time()
+
+    def try_acquire(self, tokens: int = 1) -> AcquireResult:
+        """
+        Acquire `tokens` tokens only if they're available right away, without sleeping.
+
+        If they aren't, nothing is reserved, and the result says how long until they
+        would be. This always checks the shared bucket, and never uses the local lease.
+        """
+        if self.local_circuit and (wait := circuit.busy_for(self.connection, self.key)):
+            report_rejected(self)
+            return AcquireResult(False, wait)
+        granted, wait, *_ = self.script(keys=[self.key], args=[*self._script_args(tokens), 0])
+        if not granted:
+            report_rejected(self)
+            if self.local_circuit and tokens == 1:
+                # Nothing was reserved, so this only tells us when a single token is due
+                circuit.trip(self.connection, self.key, wait / 1000)
+        return AcquireResult(bool(granted), wait / 1000)
+
+    @classmethod
+    def reserve_many(cls, buckets: Sequence['SyncTokenBucket'], tokens: int = 1) -> list[float | None]:
+        """
+        Reserve `tokens` tokens from each of the buckets, without sleeping.
+
+        The script calls for all the buckets are sent in one pipeline per connection
+        (and, for a cluster, per node), rather than one round trip per bucket.
+        Returns how many seconds until each bucket's tokens are due, in the same order
+        as the buckets, so the caller can schedule the work. Where that would be longer
+        than the bucket's `max_sleep`, nothing is reserved, and the wait is None.
+        Like `try_acquire`, this always uses the shared buckets, and never local leases.
+        """
+        script = get_script(cls.script_name)
+        results: list[Any] = [None] * len(buckets)
+        for indexes, calls in cls._reserve_calls(buckets, tokens):
+            group_results = script.run_many(buckets[indexes[0]].connection, calls)
+            for i, result in zip(indexes, group_results, strict=True):
+                results[i] = result
+        return [wait / 1000 if reserved else None for reserved, wait, *_ in results]
+
+    def refund(self, tokens: int, slot: int | None = None) -> None:
+        """
+        Return tokens we acquired, but won't use, to the bucket.
+
+        Tokens are given back to the slot they were taken from (the current slot, unless
+        `slot` says otherwise). If someone has reserved a later slot since, they're kept
+        for the next reservation instead, until the slot after theirs starts. They're
+        never added to someone else's slot, which would let the bucket hand out more
+        than its rate.
+        """
+        self.run_script('token_bucket_refund.lua', keys=[self.key], args=self._refund_args(tokens, slot))
+        logger.debug('Refunded %s tokens to %s', tokens, self.name)
+
+    def release_lease(self) -> None:
+        """Return any tokens left in the local lease to the bucket."""
+        lease = self._lease(self.connection, threading.Lock)
+        if lease is None:
+            return
+        with lease.lock:
+            if tokens := lease.clear():
+                self.run_script(
+                    'token_bucket_refund.lua', keys=[self.key], args=self._refund_args(tokens, lease.reserved)
+                )
 
     def __exit__(
         self,
@@ -106,19 +424,137 @@ class AsyncTokenBucket(TokenBucketBase, AsyncLuaScriptBase):
         Call the token bucket Lua script, receive a datetime for
         when to wake up, then sleep up until that point in time.
         """
+        await self.acquire()
 
-        # Retrieve timestamp for when to wake up from Redis
-        seconds, microseconds = create_redis_time_tuple()
-        timestamp = await self.script(
-            keys=[self.key],
-            args=[self.capacity, self.refill_amount, self.refill_frequency, seconds, microseconds],
-        )
+    async def acquire(self, tokens: int = 1) -> float:
+        """
+        Acquire `tokens` tokens from the bucket in a single call,
+        sleeping until they're available. Returns the time slept.
+
+        When `lease_size` is set, tokens are handed out from a local lease
+        instead, which only calls Redis once per `lease_size` tokens.
+        """
+
+        self._check_circuit()
+
+        # Retrieve when to wake up from our lease, or from Redis
+        queued = 0.0
+        lease = self._lease(self.connection, asyncio.Lock)
+        if lease is not None and tokens <= self.lease_size:
+            async with lease.lock:
+                if not lease.take(tokens):
+                    due, queued, slot = await self._reserve(self.lease_size)
+                    lease.renew(due, slot, self.lease_size - tokens, self._lease_ms())
+                timestamp = lease.slot
+        else:
+            lease = None
+            timestamp, queued, slot = await self._reserve(tokens)
 
         # Estimate sleep time
         sleep_time = self.parse_timestamp(timestamp)
 
         # Sleep before returning
-        await asyncio.sleep(sleep_time)
+        try:
+            await asyncio.sleep(sleep_time)
+        except asyncio.CancelledError:
+            # Don't hold up everyone queued behind us for tokens we'll never use
+            if lease is not None:
+                lease.put_back(timestamp, tokens)
+            else:
+                await self.refund(tokens, slot)
+            raise
+
+        if self.metrics is not None:
+            self.metrics.slept(self, queued + sleep_time)
+        return queued + sleep_time
+
+    async def _reserve(self, tokens: int) -> tuple[int, float, int]:
+        """
+        Reserve tokens from the bucket, and return when they're due, as a local millisecond
+        timestamp, how many seconds we queued locally, without a reservation, first, and
+        the bucket's slot they were reserved in.
+
+        With `max_sleep` or `queue_horizon` set, the script only reserves tokens due within
+        them, so callers that give up don't push back the callers queued behind them.
+        """
+        # With our own clock, and no limits, the script's reply is the slot, and when it's due
+        if self.max_sleep == 0.0 and self.queue_horizon is None and not self.server_time:
+            slot = await self.script(keys=[self.key], args=self._script_args(tokens))
+            return slot, 0.0, slot
+
+        started = called = time.time()
+        while True:
+            granted, wait, *reserved = await self.script(
+                keys=[self.key], args=self._admission_args(tokens, called - started)
+            )
+            if granted:
+                return self._due(called, wait), called - started, reserved[0]
+            await asyncio.sleep(self._requeue_time(tokens, wait, time.time() - started))
+            called = time.time()
+
+    @classmethod
+    async def reserve_many(cls, buckets: Sequence['AsyncTokenBucket'], tokens: int = 1) -> list[float | None]:
+        """
+        Reserve `tokens` tokens from each of the buckets, without sleeping.
+
+        The script calls for all the buckets are sent in one pipeline per connection
+        (and, for a cluster, per node), rather than one round trip per bucket.
+        Returns how many seconds until each bucket's tokens are due, in the same order
+        as the buckets, so the caller can schedule the work. Where that would be longer
+        than the bucket's `max_sleep`, nothing is reserved, and the wait is None.
+        Like `try_acquire`, this always uses the shared buckets, and never local leases.
+        """
+        script = get_script(cls.script_name)
+        groups = cls._reserve_calls(buckets, tokens)
+        pipelines = [script.run_many_async(buckets[indexes[0]].connection, calls) for indexes, calls in groups]
+        results: list[Any] = [None] * len(buckets)
+        for (indexes, _), group_results in zip(groups, await asyncio.gather(*pipelines), strict=True):
+            for i, result in zip(indexes, group_results, strict=True):
+                results[i] = result
+        return [wait / 1000 if reserved else None for reserved, wait, *_ in results]
+
+    async def refund(self, tokens: int, slot: int | None = None) -> None:
+        """
+        Return tokens we acquired, but won't use, to the bucket. See `SyncTokenBucket.refund`.
+
+        The refund is shielded, so it completes even if we're cancelled meanwhile.
+        """
+        task = asyncio.create_task(
+            self.run_script('token_bucket_refund.lua', keys=[self.key], args=self._refund_args(tokens, slot))
+        )
+        _refunds.add(task)
+        task.add_done_callback(_refunds.discard)
+        await asyncio.shield(task)
+        logger.debug('Refunded %s tokens to %s', tokens, self.name)
+
+    async def try_acquire(self, tokens: int = 1) -> AcquireResult:
+        """
+        Acquire `tokens` tokens only if they're available right away, without sleeping.
+
+        If they aren't, nothing is reserved, and the result says how long until they
+        would be. This always checks the shared bucket, and never uses the local lease.
+        """
+        if self.local_circuit and (wait := circuit.busy_for(self.connection, self.key)):
+            report_rejected(self)
+            return AcquireResult(False, wait)
+        granted, wait, *_ = await self.script(keys=[self.key], args=[*self._script_args(tokens), 0])
+        if not granted:
+            report_rejected(self)
+            if self.local_circuit and tokens == 1:
+                # Nothing was reserved, so this only tells us when a single token is due
+                circuit.trip(self.connection, self.key, wait / 1000)
+        return AcquireResult(bool(granted), wait / 1000)
+
+    async def release_lease(self) -> None:
+        """Return any tokens left in the local lease to the bucket."""
+        lease = self._lease(self.connection, asyncio.Lock)
+        if lease is None:
+            return
+        async with lease.lock:
+            if tokens := lease.clear():
+                await self.run_script(
+                    'token_bucket_refund.lua', keys=[self.key], args=self._refund_args(tokens, lease.reserved)
+                )
 
     async def __aexit__(
         self,
@@ -0,0 +1,95 @@
+--- Return unused tokens to a token bucket.
+---
+--- Tokens taken from the latest slot go back to it. Tokens taken from an earlier slot
+--- are kept as a credit for that slot, which later reservations take before moving on
+--- to the latest slot, so whoever is queued next gets them. Adding them to the latest
+--- slot instead would let the bucket hand out more tokens than its rate allows. Tokens
+--- are dropped once the slot after theirs has started, since that's been refilled.
+---
+--- keys:
+--- * key: The key name to use for the token bucket
+---
+--- args:
+--- * capacity: The max number of tokens the bucket can hold
+--- * refill_amount: How many tokens to add to the bucket per refill
+--- * time_between_slots: How often to refill the bucket (seconds)
+--- * seconds: Timestamp in seconds, or an empty string to use the Redis server's clock
+--- * microseconds: Microseconds part of the timestamp
+--- * tokens: The number of tokens to return
+--- * ttl, packed: How long to keep the state, and how to encode it (as for token_bucket.lua)
+--- * slot: The slot the tokens were taken from, as returned by token_bucket.lua, or an empty
+---   string for tokens taken from the current slot
+
+redis.replicate_commands()
+
+-- include: token_bucket.lua
+
+-- Arguments
+local capacity = tonumber(ARGV[1])
+local refill_amount = tonumber(ARGV[2])
+local time_between_slots = tonumber(ARGV[3]) * 1000 -- Convert to milliseconds
+local seconds = tonumber(ARGV[4])
+local microseconds = tonumber(ARGV[5])
+local returned = tonumber(ARGV[6])
+local ttl = tonumber(ARGV[7])
+local packed = ARGV[8] == '1'
+local reserved = tonumber(ARGV[9])
+
+-- How many slots to keep credits for, at most
+local max_credits = 64
+
+-- Use the server's clock if the client didn't pass its own
+if not seconds then
+    local time = redis.call('TIME')
+    seconds = tonumber(time[1])
+    microseconds = tonumber(time[2])
+end
+
+-- Keys
+local data_key = KEYS[1]
+
+-- Get current time in milliseconds
+local now = (tonumber(seconds) * 1000) + (tonumber(microseconds) / 1000)
+
+-- If the bucket expired, it's full again, and there's nothing to return the tokens to
+local data = redis.call('GET', data_key)
+if not data then
+    return
+end
+
+-- Tokens taken without a slot are from the current one, which may be the latest slot,
+-- up to 20ms ahead of now for the execution time penalty
+local slot, tokens, credits = decode_state(data)
+credits = usable_credits(credits, now, time_between_slots)
+if not reserved then
+    reserved = slot <= now + 20 and slot or math.floor(now)
+end
+
+if reserved == slot then
+    -- The latest slot gets them back, up to the capacity
+    tokens = math.min(tokens + returned, capacity)
+elseif reserved < slot and reserved + time_between_slots > now then
+    -- An earlier slot keeps them as a credit, up to the capacity, and in slot order
+    local position = #credits + 1
+    for i, credit in ipairs(credits) do
+        if credit[1] == reserved then
+            credit[2] = math.min(credit[2] + returned, capacity)
+            position = nil
+            break
+        elseif credit[1] > reserved then
+            position = i
+            break
+        end
+    end
+    if position then
+        if #credits >= max_credits then
+            return
+        end
+        table.insert(credits, position, { reserved, math.min(returned, capacity) })
+    end
+else
+    return
+end
+
+local expiry = state_expiry(ttl, slot, now, capacity, refill_amount, time_between_slots)
+redis.call('SET', data_key, encode_state(slot, tokens, packed, credits), 'PX', expiry)
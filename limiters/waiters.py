@@ -0,0 +1,309 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from typing import TYPE_CHECKING, Any, ClassVar
+
+from limiters.scripts import get_script
+
+if TYPE_CHECKING:
+    from limiters.semaphore import AsyncSemaphore, SyncSemaphore
+    from limiters.token_bucket import SyncTokenBucket
+
+logger = logging.getLogger(__name__)
+
+# How long each BLPOP blocks for, before the dispatcher checks whether anyone is still waiting
+BLPOP_TIMEOUT = 1
+
+
+class AsyncWaiterQueue:
+    """
+    Coroutines in this process waiting for the same semaphore.
+
+    Instead of every waiter holding a pool connection in its own BLPOP, a single
+    dispatcher task calls BLPOP on behalf of all of them, and hands each token it
+    pops to the longest waiting coroutine. The number of connections used for
+    waiting is then one per semaphore, however many coroutines are queued.
+    """
+
+    _queues: ClassVar[dict[tuple[asyncio.AbstractEventLoop, Any, str], 'AsyncWaiterQueue']] = {}
+    _background_tasks: ClassVar[set[asyncio.Task[None]]] = set()
+
+    def __init__(self, semaphore: 'AsyncSemaphore') -> None:
+        self.semaphore = semaphore
+        self.waiters: deque[asyncio.Future[None]] = deque()
+        self.dispatcher: asyncio.Task[None] | None = None
+
+    @classmethod
+    def _queue_key(cls, semaphore: 'AsyncSemaphore') -> tuple[asyncio.AbstractEventLoop, Any, str]:
+        return asyncio.get_running_loop(), semaphore.connection, semaphore.key
+
+    @classmethod
+    def get(cls, semaphore: 'AsyncSemaphore') -> 'AsyncWaiterQueue | None':
+        """Return the queue of local waiters for a semaphore, if anyone is waiting."""
+        return cls._queues.get(cls._queue_key(semaphore))
+
+    @classmethod
+    async def wait(cls, semaphore: 'AsyncSemaphore') -> bool:
+        """
+        Wait in line for a token from the semaphore.
+
+        Returns False if we gave up after `max_sleep` seconds.
+        """
+        queue_key = cls._queue_key(semaphore)
+        if (queue := cls._queues.get(queue_key)) is None:
+            queue = cls._queues[queue_key] = cls(semaphore)
+
+        waiter = asyncio.get_running_loop().create_future()
+        queue.waiters.append(waiter)
+        if queue.dispatcher is None:
+            queue.dispatcher = asyncio.create_task(queue._dispatch(queue_key))
+
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), semaphore.max_sleep or None)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled() and waiter.exception() is None:
+                if isinstance(e, TimeoutError):
+                    # We timed out just as we were handed a token, so we might as well use it
+                    return True
+                # We were cancelled after being handed a token; pass it on
+                queue._hand_over()
+            else:
+                waiter.cancel()
+            if isinstance(e, TimeoutError):
+                return False
+            raise
+        return True
+
+    def _prune(self) -> bool:
+        """Drop waiters who gave up from the front of the queue, and return whether anyone is still waiting."""
+        while self.waiters and self.waiters[0].done():
+            self.waiters.popleft()
+        return bool(self.waiters)
+
+    def _hand_over(self) -> None:
+        """Give a token to the longest waiting coroutine, or return it to the semaphore."""
+        if self._prune():
+            self.waiters.popleft().set_result(None)
+            return
+        task = asyncio.create_task(self.semaphore.release())
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    async def _dispatch(self, queue_key: tuple[asyncio.AbstractEventLoop, Any, str]) -> None:
+        semaphore = self.semaphore
+        try:
+            while self._prune():
+                if await semaphore.connection.blpop(semaphore.key, BLPOP_TIMEOUT) is None:  # type: ignore[union-attr]
+                    continue
+                await semaphore.refresh_expiry()
+                self._hand_over()
+        except BaseException as e:
+            logger.debug('Failed waiting for semaphore %s: %s', semaphore.name, e)
+            for waiter in self.waiters:
+                if not waiter.done():
+                    waiter.set_exception(e)
+            if not isinstance(e, Exception):
+                raise
+        finally:
+            # Nobody is waiting anymore, so there's no await between our last check and this
+            del self._queues[queue_key]
+
+
+class SyncWaiter:
+    """A thread waiting in line, which the dispatcher wakes up by setting its event."""
+
+    __slots__ = ('abandoned', 'error', 'event', 'granted', 'wait')
+
+    def __init__(self) -> None:
+        self.event = threading.Event()
+        self.granted = False
+        self.abandoned = False
+        self.error: BaseException | None = None
+        # For token buckets, how many seconds until the tokens are (or would have been) due
+        self.wait = 0.0
+
+
+class SyncWaiterQueue:
+    """
+    Threads in this process waiting for the same semaphore.
+
+    Like `AsyncWaiterQueue`, but for threads: a single dispatcher thread calls BLPOP
+    on behalf of all of them, and hands each token it pops to the longest waiting
+    thread, which waits on an event rather than holding a connection of its own.
+    """
+
+    _queues: ClassVar[dict[tuple[Any, str], 'SyncWaiterQueue']] = {}
+    _lock: ClassVar[threading.Lock] = threading.Lock()
+
+    def __init__(self, semaphore: 'SyncSemaphore') -> None:
+        self.semaphore = semaphore
+        self.waiters: deque[SyncWaiter] = deque()
+
+    @classmethod
+    def get(cls, semaphore: 'SyncSemaphore') -> 'SyncWaiterQueue | None':
+        """Return the queue of local waiters for a semaphore, if anyone is waiting."""
+        return cls._queues.get((semaphore.connection, semaphore.key))
+
+    @classmethod
+    def wait(cls, semaphore: 'SyncSemaphore') -> bool:
+        """
+        Wait in line for a token from the semaphore.
+
+        Returns False if we gave up after `max_sleep` seconds.
+        """
+        queue_key = (semaphore.connection, semaphore.key)
+        waiter = SyncWaiter()
+        with cls._lock:
+            if (queue := cls._queues.get(queue_key)) is None:
+                queue = cls._queues[queue_key] = cls(semaphore)
+                threading.Thread(
+                    target=queue._dispatch, args=(queue_key,), name=f'limiters-{semaphore.name}', daemon=True
+                ).start()
+            queue.waiters.append(waiter)
+
+        waiter.event.wait(semaphore.max_sleep or None)
+        with cls._lock:
+            if waiter.error is not None:
+                raise waiter.error
+            # We might have been handed a token just as we timed out, in which case we use it
+            waiter.abandoned = not waiter.granted
+            return waiter.granted
+
+    def _prune(self) -> bool:
+        """Drop waiters who gave up from the front of the queue, and return whether anyone is still waiting."""
+        while self.waiters and self.waiters[0].abandoned:
+            self.waiters.popleft()
+        return bool(self.waiters)
+
+    def _hand_over(self) -> bool:
+        """Give a token to the longest waiting thread, returning False if nobody's left to take it."""
+        with self._lock:
+            if not self._prune():
+                return False
+            waiter = self.waiters.popleft()
+            waiter.granted = True
+            waiter.event.set()
+            return True
+
+    def _dispatch(self, queue_key: tuple[Any, str]) -> None:
+        semaphore = self.semaphore
+        try:
+            while True:
+                with self._lock:
+                    if not self._prune():
+                        # Nobody is waiting, and new waiters need the lock to join this queue
+                        del self._queues[queue_key]
+                        return
+                if semaphore.connection.blpop(semaphore.key, BLPOP_TIMEOUT) is None:
+                    continue
+                semaphore.refresh_expiry()
+                if not self._hand_over():
+                    semaphore.release()
+        except Exception as e:
+            logger.debug('Failed waiting for semaphore %s: %s', semaphore.name, e)
+            with self._lock:
+                del self._queues[queue_key]
+                for waiter in self.waiters:
+                    waiter.error = e
+                    waiter.event.set()
+
+
+class SyncReservationDispatcher:
+    """
+    Reserves tokens, and wakes up the threads waiting for them, for all token buckets on a connection.
+
+    Threads hand their reservations to a single dispatcher thread, which sends everything
+    that queued up meanwhile to Redis in one pipeline, and wakes each thread up with an
+    event once its tokens are due. Redis calls for waiting threads then use one connection,
+    however many threads there are, and all the timed wakeups are done by one thread.
+    """
+
+    _dispatchers: ClassVar[dict[Any, 'SyncReservationDispatcher']] = {}
+    _lock: ClassVar[threading.Lock] = threading.Lock()
+
+    def __init__(self, connection: Any) -> None:
+        self.connection = connection
+        self.pending: list[tuple[SyncWaiter, SyncTokenBucket, int]] = []
+        self.due: list[tuple[float, int, SyncWaiter]] = []
+        self.wakeup = threading.Condition(self._lock)
+        self._counter = itertools.count()
+
+    @classmethod
+    def wait(cls, bucket: 'SyncTokenBucket', tokens: int) -> SyncWaiter:
+        """
+        Reserve tokens, and wait until they're due.
+
+        Returns the waiter, which says whether the tokens were granted, and if they
+        weren't (because they'd be due later than `max_sleep`), how long until they would be.
+        """
+        waiter = SyncWaiter()
+        with cls._lock:
+            if (dispatcher := cls._dispatchers.get(bucket.connection)) is None:
+                dispatcher = cls._dispatchers[bucket.connection] = cls(bucket.connection)
+                threading.Thread(target=dispatcher._dispatch, name='limiters-token-buckets', daemon=True).start()
+            dispatcher.pending.append((waiter, bucket, tokens))
+            dispatcher.wakeup.notify()
+
+        waiter.event.wait()
+        if waiter.error is not None:
+            raise waiter.error
+        return waiter
+
+    def _reserve(self, pending: list[tuple[SyncWaiter, 'SyncTokenBucket', int]]) -> None:
+        # The arguments include the time, so they're only worked out as the pipeline is sent
+        reservations = []
+        for waiter, bucket, tokens in pending:
+            try:
+                reservations.append((waiter, bucket, [bucket.key], bucket._reserve_args(tokens)))
+            except Exception as e:
+                waiter.error = e
+                waiter.event.set()
+        if not reservations:
+            return
+
+        start = time.perf_counter()
+        try:
+            calls = [(keys, args) for _, _, keys, args in reservations]
+            results = get_script('token_bucket.lua').run_many(self.connection, calls, raise_on_error=False)
+        except Exception as e:
+            logger.debug('Failed reserving tokens: %s', e)
+            results = [e] * len(reservations)
+        finally:
+            elapsed = time.perf_counter() - start
+
+        now = time.monotonic()
+        with self._lock:
+            for (waiter, bucket, _, _), result in zip(reservations, results, strict=True):
+                if bucket.metrics is not None:
+                    bucket.metrics.redis_call(bucket, elapsed)
+                if isinstance(result, Exception):
+                    waiter.error = result
+                    waiter.event.set()
+                    continue
+                granted, wait, *_ = result
+                waiter.granted, waiter.wait = bool(granted), wait / 1000
+                if not granted:
+                    waiter.event.set()
+                else:
+                    heapq.heappush(self.due, (now + wait / 1000, next(self._counter), waiter))
+
+    def _dispatch(self) -> None:
+        while True:
+            with self._lock:
+                while True:
+                    now = time.monotonic()
+                    while self.due and self.due[0][0] <= now:
+                        heapq.heappop(self.due)[2].event.set()
+                    if self.pending:
+                        break
+                    if not self.due:
+                        # Nothing to do, and new waiters need the lock to use this dispatcher
+                        del self._dispatchers[self.connection]
+                        return
+                    self.wakeup.wait(self.due[0][0] - now)
+                pending, self.pending = self.pending, []
+            self._reserve(pending)
@@ -0,0 +1,76 @@
+--- Script called from the WeightedSemaphore implementation, to acquire a lease.
+---
+--- Works like `lease_semaphore.lua`, except that each holder takes a number
+--- of permits, and belongs to a priority class. Holders are stored in a sorted
+--- set, scored by the time their lease expires, as `<permits>:<id>:<class>`.
+---
+--- Each class can have permits reserved for it. A lease is only granted if,
+--- after granting it, there are still enough permits left for the unused
+--- reservations of every other class, so no class can ever be kept from
+--- its reserved permits by another.
+---
+--- keys:
+--- * key: The key to use for the sorted set of holders
+---
+--- args:
+--- * capacity: The total number of permits
+--- * holder: The member to add for the holder acquiring the lease
+--- * lease: The lease duration, in milliseconds
+--- * permits: The number of permits to take
+--- * class: The priority class of the holder
+--- * The remaining args are pairs of class names and their reserved permits
+---
+--- returns:
+--- * 0 if the lease was acquired, else the number of milliseconds
+---   until the earliest lease expires (an upper bound on how long to wait)
+
+redis.replicate_commands()
+
+local key = KEYS[1]
+local capacity = tonumber(ARGV[1])
+local holder = ARGV[2]
+local lease = tonumber(ARGV[3])
+local permits = tonumber(ARGV[4])
+local class = ARGV[5]
+
+-- Use the Redis clock, so lease deadlines don't depend on client clocks
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+
+-- Reclaim expired leases
+redis.call('ZREMRANGEBYSCORE', key, '-inf', now)
+
+-- Count the permits in use, in total and per class
+local used = 0
+local used_by = {}
+for _, member in ipairs(redis.call('ZRANGE', key, 0, -1)) do
+    local taken, holder_class = string.match(member, '^(%d+):[^:]*:(.*)$')
+    taken = tonumber(taken)
+    used = used + taken
+    used_by[holder_class] = (used_by[holder_class] or 0) + taken
+end
+
+-- Permits we can't have: those in use, and those reserved for other classes, but unused
+local unavailable = used + permits
+for i = 6, #ARGV, 2 do
+    local reserved_class = ARGV[i]
+    if reserved_class ~= class then
+        unavailable = unavailable + math.max(tonumber(ARGV[i + 1]) - (used_by[reserved_class] or 0), 0)
+    end
+end
+
+if unavailable <= capacity then
+    redis.call('ZADD', key, now + lease, holder)
+    -- Keep the set around for at least as long as the longest lease
+    if redis.call('PTTL', key) < lease then
+        redis.call('PEXPIRE', key, lease)
+    end
+    return 0
+end
+
+local earliest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+if not earliest[2] then
+    -- Nothing is held, but these permits are reserved for other classes, so just poll
+    return lease
+end
+return math.max(tonumber(earliest[2]) - now, 1)
@@ -0,0 +1,63 @@
+from typing import Any, ClassVar
+from uuid import uuid4
+
+from pydantic import Field, validator
+
+from limiters.lease_semaphore import AsyncLeaseSemaphore, LeaseSemaphoreBase, SyncLeaseSemaphore
+
+
+class WeightedSemaphoreBase(LeaseSemaphoreBase):
+    priority: str = 'default'
+    reserved: dict[str, int] = Field(default_factory=dict)
+    permits: int = Field(gt=0, default=1)
+
+    @validator('reserved')
+    def reserved_within_capacity(cls, v: dict[str, int], values: dict[str, Any]) -> dict[str, int]:
+        if any(permits < 0 for permits in v.values()):
+            raise ValueError('reserved permits cannot be negative')
+        if 'capacity' in values and sum(v.values()) > values['capacity']:
+            raise ValueError('reserved permits cannot exceed the capacity')
+        return v
+
+    @validator('permits')
+    def permits_within_capacity(cls, v: int, values: dict[str, Any]) -> int:
+        if 'capacity' in values and 'reserved' in values:
+            others = sum(permits for c, permits in values['reserved'].items() if c != values.get('priority'))
+            if v > values['capacity'] - others:
+                raise ValueError('permits cannot exceed the capacity not reserved for other classes')
+        return v
+
+    def _post_init(self) -> None:
+        self._key = self.key_layout.key('weighted-semaphore', self.name)
+
+    def _new_holder(self) -> str:
+        return f'{self.permits}:{uuid4().hex}:{self.priority}'
+
+    def _script_args(self, holder: str) -> list[int | str]:
+        reserved = [arg for c, permits in sorted(self.reserved.items()) for arg in (c, permits)]
+        return [*super()._script_args(holder), self.permits, self.priority, *reserved]
+
+    def __str__(self) -> str:
+        return f'Weighted semaphore instance for {self.key}'
+
+
+class SyncWeightedSemaphore(WeightedSemaphoreBase, SyncLeaseSemaphore):
+    """
+    A lease semaphore where each holder takes `permits` permits, and belongs to a `priority` class.
+
+    Permits in `reserved` are kept for their class: other classes can only take permits
+    as long as enough are left over for every class's unused reservation.
+    """
+
+    script_name: ClassVar[str] = 'weighted_semaphore.lua'
+
+
+class AsyncWeightedSemaphore(WeightedSemaphoreBase, AsyncLeaseSemaphore):
+    """
+    A lease semaphore where each holder takes `permits` permits, and belongs to a `priority` class.
+
+    Permits in `reserved` are kept for their class: other classes can only take permits
+    as long as enough are left over for every class's unused reservation.
+    """
+
+    script_name: ClassVar[str] = 'weighted_semaphore.lua'
@@ -0,0 +1,38 @@
+import asyncio
+from uuid import uuid4
+
+import pytest
+
+from limiters import AsyncAdaptiveLeaseSemaphore, AsyncAdaptiveLimit, MaxSleepExceededError, Outcome
+from tests.conftest import ASYNC_CONNECTIONS
+
+
+@pytest.mark.parametrize('connection', ASYNC_CONNECTIONS)
+async def test_adaptive_lease_semaphore(connection):
+    conn = connection()
+    name = uuid4().hex[:6]
+    limit = AsyncAdaptiveLimit(name=name, initial=2, maximum=4, cooldown=0, connection=conn)
+    semaphore = AsyncAdaptiveLeaseSemaphore(name=name, limit=limit, max_sleep=0.1, connection=conn)
+
+    async def hold(acquired=None):
+        async with semaphore:
+            if acquired is not None:
+                acquired.set()
+            await asyncio.sleep(0.2)
+
+    # Two holders fit, but not three
+    acquired = [asyncio.Event() for _ in range(2)]
+    holders = [asyncio.create_task(hold(event)) for event in acquired]
+    await asyncio.gather(*[event.wait() for event in acquired])
+    with pytest.raises(MaxSleepExceededError):
+        await hold()
+
+    # Until successes raise the limit
+    for _ in range(3):
+        await limit.report(Outcome.SUCCESS)
+    assert limit.value == 3
+    await hold()
+
+    await asyncio.gather(*holders)
+    assert [int(adjustment.after) for adjustment in await limit.history()] == [3]
+    await conn.aclose()
@@ -0,0 +1,82 @@
+from uuid import uuid4
+
+import pytest
+from pydantic import ValidationError
+
+from limiters import Outcome, SyncAdaptiveLimit, SyncAdaptiveTokenBucket
+from tests.conftest import SYNC_CONNECTIONS
+
+
+def sync_limit_factory(**kwargs) -> SyncAdaptiveLimit:
+    return SyncAdaptiveLimit(**({'name': uuid4().hex[:6], 'initial': 4, 'maximum': 10} | kwargs))
+
+
+@pytest.mark.parametrize('connection', SYNC_CONNECTIONS)
+def test_sync_aimd(connection):
+    limit = sync_limit_factory(connection=connection(), cooldown=60)
+
+    # About a full limit's worth of successes adds one
+    for _ in range(4):
+        limit.report(Outcome.SUCCESS)
+    assert limit.value == 4
+    assert limit.report(Outcome.SUCCESS) == 5
+
+    # Throttling halves the limit, once per cooldown
+    assert limit.report(Outcome.THROTTLED) == 2
+    assert limit.report('timeout') == 2
+
+    # Every process sees the same limit
+    assert sync_limit_factory(connection=connection(), name=limit.name, cooldown=60).current() == 2
+
+    history = limit.history()
+    assert [(adjustment.outcome, int(adjustment.after)) for adjustment in history] == [
+        (Outcome.THROTTLED, 2),
+        (Outcome.SUCCESS, 5),
+    ]
+
+
+@pytest.mark.parametrize('connection', SYNC_CONNECTIONS)
+def test_sync_limit_bounds(connection):
+    limit = sync_limit_factory(connection=connection(), initial=2, minimum=2, maximum=3, cooldown=0)
+
+    for _ in range(20):
+        limit.report(Outcome.SUCCESS)
+    assert limit.value == 3
+
+    for _ in range(5):
+        limit.report(Outcome.THROTTLED)
+    assert limit.value == 2
+
+
+@pytest.mark.parametrize('connection', SYNC_CONNECTIONS)
+def test_sync_adaptive_token_bucket(connection):
+    conn = connection()
+    limit = sync_limit_factory(connection=conn, initial=2, cooldown=0)
+    bucket = SyncAdaptiveTokenBucket(name=limit.name, limit=limit, refill_frequency=1, connection=conn)
+
+    assert bucket.try_acquire(tokens=2)
+    assert not bucket.try_acquire()
+
+    # Once the limit drops, so does the largest acquire the bucket allows
+    limit.report(Outcome.THROTTLED)
+    with pytest.raises(ValueError, match=r'the capacity \(1\)'):
+        bucket.acquire(tokens=2)
+
+
+@pytest.mark.parametrize(
+    'config',
+    [
+        {'initial': 4, 'minimum': 5, 'maximum': 10},
+        {'initial': 11, 'maximum': 10},
+        {'initial': 4, 'maximum': 10, 'decrease': 1},
+    ],
+)
+def test_sync_adaptive_limit_config(config):
+    with pytest.raises(ValidationError):
+        sync_limit_factory(connection=SYNC_CONNECTIONS[0](), **config)
+
+
+def test_sync_adaptive_lease_size():
+    limit = sync_limit_factory(connection=SYNC_CONNECTIONS[0](), minimum=2)
+    with pytest.raises(ValidationError):
+        SyncAdaptiveTokenBucket(name='foo', limit=limit, refill_frequency=1, lease_size=3, connection=limit.connection)
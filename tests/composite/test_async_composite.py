@@ -0,0 +1,61 @@
+import asyncio
+import re
+import time
+
+import pytest
+from pydantic import ValidationError
+
+from limiters import AsyncCompositeLimiter
+from tests.conftest import (
+    ASYNC_CONNECTIONS,
+    STANDALONE_ASYNC_CONNECTION,
+    STANDALONE_SYNC_CONNECTION,
+    async_semaphore_factory,
+    async_tokenbucket_factory,
+    run,
+    sync_tokenbucket_factory,
+)
+
+
+@pytest.mark.parametrize('connection', ASYNC_CONNECTIONS)
+@pytest.mark.parametrize('single_script', [True, False])
+async def test_composite(connection, single_script):
+    conn, other = connection(), connection()
+    limiter = AsyncCompositeLimiter(
+        limiters=[
+            async_tokenbucket_factory(connection=conn, capacity=2, refill_amount=2, refill_frequency=0.2),
+            async_tokenbucket_factory(connection=conn, capacity=1, refill_frequency=0.1),
+            async_semaphore_factory(connection=conn if single_script else other, capacity=2),
+        ]
+    )
+    assert limiter._single_script is single_script
+
+    # The second bucket is the bottleneck, allowing one every 100ms
+    start = time.monotonic()
+    await asyncio.gather(*[run(limiter, 0.05) for _ in range(4)])
+    elapsed = time.monotonic() - start
+    await conn.aclose()
+    await other.aclose()
+    assert 0.3 <= elapsed < 0.6
+
+
+@pytest.mark.parametrize('connection', [STANDALONE_ASYNC_CONNECTION])
+def test_repr(connection):
+    conn = connection()
+    limiter = AsyncCompositeLimiter(
+        limiters=[
+            async_tokenbucket_factory(connection=conn, name='test'),
+            async_semaphore_factory(connection=conn, name='test'),
+        ]
+    )
+    assert re.match(r'Composite limiter for {limiter}:token-bucket:test, {limiter}:semaphore:test', str(limiter))
+
+
+@pytest.mark.parametrize('connection', [STANDALONE_ASYNC_CONNECTION])
+def test_init_types(connection):
+    with pytest.raises(ValidationError, match='at least one limiter is required'):
+        AsyncCompositeLimiter(limiters=[])
+
+    # Sync limiters don't belong in an async composite
+    with pytest.raises(ValidationError):
+        AsyncCompositeLimiter(limiters=[sync_tokenbucket_factory(connection=STANDALONE_SYNC_CONNECTION())])
@@ -0,0 +1,58 @@
+import time
+
+import pytest
+from redis.cluster import RedisCluster
+
+from limiters import MaxSleepExceededError, SyncCompositeLimiter
+from tests.conftest import SYNC_CONNECTIONS, sync_semaphore_factory, sync_tokenbucket_factory
+
+
+@pytest.mark.parametrize('connection', SYNC_CONNECTIONS)
+def test_sync_composite(connection):
+    conn = connection()
+    bucket = sync_tokenbucket_factory(connection=conn, capacity=1, refill_frequency=0.2)
+    semaphore = sync_semaphore_factory(connection=conn, capacity=1)
+    limiter = SyncCompositeLimiter(limiters=[bucket, semaphore])
+    assert limiter._single_script
+
+    start = time.monotonic()
+    for _ in range(3):
+        with limiter:
+            assert conn.llen(semaphore.key) == 0
+    assert 0.35 < time.monotonic() - start < 0.6
+    assert conn.llen(semaphore.key) == 1
+
+
+@pytest.mark.parametrize('connection', SYNC_CONNECTIONS)
+@pytest.mark.parametrize('single_script', [True, False])
+def test_sync_composite_wastes_no_tokens(connection, single_script):
+    conn = connection()
+    bucket = sync_tokenbucket_factory(connection=conn, capacity=1, refill_frequency=10)
+    semaphore = sync_semaphore_factory(connection=conn if single_script else connection(), capacity=1)
+    limiter = SyncCompositeLimiter(limiters=[bucket, semaphore], max_sleep=0.3)
+    assert limiter._single_script is single_script
+
+    # While the semaphore is taken, we wait without holding on to the bucket's only token
+    with semaphore:
+        start = time.monotonic()
+        with pytest.raises(MaxSleepExceededError), limiter:
+            pass
+        assert time.monotonic() - start >= 0.25
+
+    assert bucket.try_acquire()
+
+
+@pytest.mark.parametrize('connection', SYNC_CONNECTIONS)
+def test_sync_composite_cluster_slots(connection):
+    conn = connection()
+    limiter = SyncCompositeLimiter(
+        limiters=[
+            sync_tokenbucket_factory(connection=conn, key_layout='per-limiter'),
+            sync_semaphore_factory(connection=conn, key_layout='per-limiter'),
+        ]
+    )
+
+    # Per-limiter keys are spread over the cluster, so we can't use a single script there
+    assert limiter._single_script is not isinstance(conn, RedisCluster)
+    with limiter:
+        pass
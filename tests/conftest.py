@@ -10,7 +10,20 @@ from redis.asyncio.cluster import RedisCluster as AsyncRedisCluster
 from redis.client import Redis as SyncRedis
 from redis.cluster import RedisCluster as SyncRedisCluster
 
-from limiters import AsyncSemaphore, AsyncTokenBucket, SyncSemaphore, SyncTokenBucket
+from limiters import (
+    AsyncGCRA,
+    AsyncLeaseSemaphore,
+    AsyncSemaphore,
+    AsyncSlidingWindow,
+    AsyncTokenBucket,
+    AsyncWeightedSemaphore,
+    SyncGCRA,
+    SyncLeaseSemaphore,
+    SyncSemaphore,
+    SyncSlidingWindow,
+    SyncTokenBucket,
+    SyncWeightedSemaphore,
+)
 
 if TYPE_CHECKING:
     from datetime import timedelta
@@ -35,7 +48,10 @@ def delta_to_seconds(t: 'timedelta') -> float:
     return t.seconds + t.microseconds / 1_000_000
 
 
-async def run(pt: AsyncSemaphore | AsyncTokenBucket, sleep_duration: float) -> None:
+async def run(
+    pt: AsyncSemaphore | AsyncLeaseSemaphore | AsyncTokenBucket | AsyncSlidingWindow | AsyncGCRA,
+    sleep_duration: float,
+) -> None:
     async with pt:
         await asyncio.sleep(sleep_duration)
 
@@ -49,6 +65,14 @@ def get_tokenbucket_defaults():
     }
 
 
+def sync_gcra_factory(*, connection: SyncRedis | SyncRedisCluster, **kwargs) -> SyncGCRA:
+    return SyncGCRA(connection=connection, **(get_tokenbucket_defaults() | kwargs))
+
+
+def async_gcra_factory(*, connection: AsyncRedis | AsyncRedisCluster, **kwargs) -> AsyncGCRA:
+    return AsyncGCRA(connection=connection, **(get_tokenbucket_defaults() | kwargs))
+
+
 def sync_tokenbucket_factory(*, connection: SyncRedis | SyncRedisCluster, **kwargs) -> SyncTokenBucket:
     return SyncTokenBucket(connection=connection, **(get_tokenbucket_defaults() | kwargs))
 
@@ -70,3 +94,35 @@ def sync_semaphore_factory(*, connection: SyncRedis | SyncRedisCluster, **kwargs
 
 def async_semaphore_factory(*, connection: AsyncRedis | AsyncRedisCluster, **kwargs) -> AsyncSemaphore:
     return AsyncSemaphore(connection=connection, **(get_semaphore_defaults() | kwargs))
+
+
+def sync_lease_semaphore_factory(*, connection: SyncRedis | SyncRedisCluster, **kwargs) -> SyncLeaseSemaphore:
+    return SyncLeaseSemaphore(connection=connection, **(get_semaphore_defaults() | kwargs))
+
+
+def async_lease_semaphore_factory(*, connection: AsyncRedis | AsyncRedisCluster, **kwargs) -> AsyncLeaseSemaphore:
+    return AsyncLeaseSemaphore(connection=connection, **(get_semaphore_defaults() | kwargs))
+
+
+def sync_weighted_semaphore_factory(*, connection: SyncRedis | SyncRedisCluster, **kwargs) -> SyncWeightedSemaphore:
+    return SyncWeightedSemaphore(connection=connection, **(get_semaphore_defaults() | kwargs))
+
+
+def async_weighted_semaphore_factory(*, connection: AsyncRedis | AsyncRedisCluster, **kwargs) -> AsyncWeightedSemaphore:
+    return AsyncWeightedSemaphore(connection=connection, **(get_semaphore_defaults() | kwargs))
+
+
+def get_sliding_window_defaults():
+    return {
+        'name': uuid4().hex[:6],
+        'capacity': 1,
+        'window': 1.0,
+    }
+
+
+def sync_sliding_window_factory(*, connection: SyncRedis | SyncRedisCluster, **kwargs) -> SyncSlidingWindow:
+    return SyncSlidingWindow(connection=connection, **(get_sliding_window_defaults() | kwargs))
+
+
+def async_sliding_window_factory(*, connection: AsyncRedis | AsyncRedisCluster, **kwargs) -> AsyncSlidingWindow:
+    return AsyncSlidingWindow(connection=connection, **(get_sliding_window_defaults() | kwargs))
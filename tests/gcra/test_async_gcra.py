@@ -0,0 +1,82 @@
+import asyncio
+import re
+import time
+
+import pytest
+from pydantic import ValidationError
+
+from limiters import AsyncGCRA, MaxSleepExceededError
+from tests.conftest import ASYNC_CONNECTIONS, async_gcra_factory, run
+
+
+@pytest.mark.parametrize('connection', ASYNC_CONNECTIONS)
+@pytest.mark.parametrize(
+    'n, frequency, timeout',
+    [
+        (5, 0.2, 1.0),
+        (4, 0.3, 1.2),
+    ],
+)
+async def test_gcra_runtimes(connection, n, frequency, timeout):
+    conn = connection()
+    limiter = async_gcra_factory(connection=conn, capacity=1, refill_frequency=frequency)
+
+    start = time.monotonic()
+    await asyncio.gather(*[run(limiter, 0) for _ in range(n + 1)])
+    elapsed = time.monotonic() - start
+    await conn.aclose()
+    assert abs(timeout - elapsed) <= 0.1
+
+
+@pytest.mark.parametrize('connection', ASYNC_CONNECTIONS)
+async def test_gcra_spreads_out_refills(connection):
+    conn = connection()
+    limiter = async_gcra_factory(connection=conn, capacity=4, refill_amount=4, refill_frequency=0.4)
+
+    # After the initial burst, tokens are due every 100ms, rather than 4 at the time every 400ms
+    await asyncio.gather(*[limiter.acquire() for _ in range(4)])
+    sleeps = sorted(await asyncio.gather(*[limiter.acquire() for _ in range(4)]))
+    await conn.aclose()
+    for expected, sleep in zip([0.1, 0.2, 0.3, 0.4], sleeps, strict=True):
+        assert abs(expected - sleep) <= 0.05
+
+
+@pytest.mark.parametrize('connection', ASYNC_CONNECTIONS)
+def test_repr(connection):
+    limiter = async_gcra_factory(connection=connection(), name='test')
+    assert re.match(r'GCRA instance for {limiter}:gcra:test', str(limiter))
+
+
+@pytest.mark.parametrize('connection', ASYNC_CONNECTIONS)
+@pytest.mark.parametrize(
+    'config,error',
+    [
+        ({'capacity': 0}, ValidationError),
+        ({'refill_frequency': 0}, ValidationError),
+        ({'refill_amount': 0}, ValidationError),
+        ({'max_sleep': -1}, ValidationError),
+        ({'refill_frequency': 0.01, 'refill_amount': 3}, None),
+    ],
+)
+def test_init_types(connection, config, error):
+    if error:
+        with pytest.raises(error):
+            async_gcra_factory(connection=connection(), **config)
+    else:
+        async_gcra_factory(connection=connection(), **config)
+
+
+@pytest.mark.parametrize('connection', ASYNC_CONNECTIONS)
+async def test_gcra_local_circuit(connection, mocker):
+    limiter = async_gcra_factory(connection=connection(), refill_frequency=0.4, max_sleep=0.1, local_circuit=True)
+    spy = mocker.spy(AsyncGCRA, 'script')
+    await limiter.acquire()
+
+    for _ in range(3):
+        with pytest.raises(MaxSleepExceededError):
+            await limiter.acquire()
+    assert spy.call_count == 2
+
+    await asyncio.sleep(0.4)
+    assert await limiter.acquire() < 0.1
+    assert spy.call_count == 3
@@ -0,0 +1,43 @@
+import time
+
+import pytest
+
+from limiters import MaxSleepExceededError
+from tests.conftest import SYNC_CONNECTIONS, sync_gcra_factory
+
+
+@pytest.mark.parametrize('connection', SYNC_CONNECTIONS)
+def test_sync_gcra(connection):
+    limiter = sync_gcra_factory(connection=connection(), capacity=2, refill_frequency=0.2)
+
+    start = time.monotonic()
+    for _ in range(5):
+        with limiter:
+            pass
+
+    # Two tokens in a burst, then one every 200ms
+    assert 0.5 < time.monotonic() - start < 0.7
+
+
+@pytest.mark.parametrize('connection', SYNC_CONNECTIONS)
+def test_sync_gcra_stores_a_single_number(connection):
+    conn = connection()
+    limiter = sync_gcra_factory(connection=conn, capacity=10, refill_frequency=1, refill_amount=10)
+    limiter.acquire(tokens=5)
+
+    assert int(conn.get(limiter.key)) > 0
+    assert 0 < conn.pttl(limiter.key) <= 500
+
+
+@pytest.mark.parametrize('connection', SYNC_CONNECTIONS)
+def test_sync_gcra_max_sleep_reserves_nothing(connection):
+    limiter = sync_gcra_factory(connection=connection(), refill_frequency=0.5, max_sleep=0.1)
+    limiter.acquire()
+
+    for _ in range(3):
+        with pytest.raises(MaxSleepExceededError, match='exceeds the maximum accepted sleep time'):
+            limiter.acquire()
+
+    # None of the refused calls pushed the next token further out
+    time.sleep(0.5)
+    assert limiter.acquire() < 0.1
@@ -0,0 +1,185 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from pydantic import ValidationError
+
+from limiters import (
+    AsyncSemaphore,
+    AsyncTokenBucket,
+    MaxSleepExceededError,
+    SyncCompositeLimiter,
+    SyncSemaphore,
+    SyncTokenBucket,
+)
+from limiters.memory import AsyncMemoryBackend, SyncMemoryBackend
+from tests.conftest import (
+    async_gcra_factory,
+    async_lease_semaphore_factory,
+    async_semaphore_factory,
+    async_tokenbucket_factory,
+    sync_gcra_factory,
+    sync_lease_semaphore_factory,
+    sync_semaphore_factory,
+    sync_sliding_window_factory,
+    sync_tokenbucket_factory,
+    sync_weighted_semaphore_factory,
+)
+
+
+def test_sync_token_bucket():
+    bucket = sync_tokenbucket_factory(connection=SyncMemoryBackend(), capacity=2, refill_frequency=0.1)
+
+    start = time.monotonic()
+    for _ in range(5):
+        with bucket:
+            pass
+
+    # Two tokens in the bucket, then one every 100ms
+    assert 0.25 < time.monotonic() - start < 0.4
+    assert not bucket.try_acquire()
+    waits = SyncTokenBucket.reserve_many([bucket, bucket])
+    assert waits == [pytest.approx(0.1, abs=0.01), pytest.approx(0.2, abs=0.01)]
+
+
+def test_sync_semaphore_across_threads():
+    semaphore = sync_semaphore_factory(connection=SyncMemoryBackend(), capacity=2)
+    lock = threading.Lock()
+    holders = []
+
+    def hold():
+        with semaphore:
+            with lock:
+                holders.append(1)
+                assert len(holders) <= 2
+            time.sleep(0.05)
+            with lock:
+                holders.pop()
+
+    start = time.monotonic()
+    threads = [threading.Thread(target=hold) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Three rounds of two holders
+    assert 0.15 <= time.monotonic() - start < 0.25
+
+
+def test_sync_semaphore_max_sleep():
+    semaphore = sync_semaphore_factory(connection=SyncMemoryBackend(), max_sleep=0.1)
+
+    with semaphore:
+        assert not semaphore.try_acquire()
+        with pytest.raises(MaxSleepExceededError):
+            semaphore.__enter__()
+
+    # The token was returned
+    with semaphore:
+        pass
+
+
+def test_backends_are_separate():
+    first = sync_tokenbucket_factory(connection=SyncMemoryBackend(), name='foo')
+    second = sync_tokenbucket_factory(connection=SyncMemoryBackend(), name='foo')
+
+    assert first.try_acquire()
+    assert second.try_acquire()
+
+
+@pytest.mark.parametrize(
+    'factory',
+    [
+        sync_gcra_factory,
+        async_gcra_factory,
+        sync_sliding_window_factory,
+        sync_lease_semaphore_factory,
+        async_lease_semaphore_factory,
+        sync_weighted_semaphore_factory,
+    ],
+)
+def test_unsupported_limiters(factory):
+    backend = AsyncMemoryBackend() if factory.__name__.startswith('async') else SyncMemoryBackend()
+    with pytest.raises(ValidationError, match='not supported by the memory backends'):
+        factory(connection=backend)
+
+
+def test_composite_limiters():
+    backend = SyncMemoryBackend()
+    bucket = sync_tokenbucket_factory(connection=backend)
+    semaphore = sync_semaphore_factory(connection=backend)
+    with pytest.raises(ValidationError, match='not supported by the memory backends'):
+        SyncCompositeLimiter(limiters=[bucket, semaphore])
+
+    # With a backend each, the limiters are acquired from one at a time, which works
+    with SyncCompositeLimiter(limiters=[bucket, sync_semaphore_factory(connection=SyncMemoryBackend())]):
+        pass
+
+
+async def test_async_token_bucket():
+    bucket = async_tokenbucket_factory(connection=AsyncMemoryBackend(), capacity=2, refill_frequency=0.1)
+
+    start = time.monotonic()
+    await asyncio.gather(*(bucket.acquire() for _ in range(5)))
+    assert 0.25 < time.monotonic() - start < 0.4
+    assert await AsyncTokenBucket.reserve_many([bucket]) == [pytest.approx(0.1, abs=0.01)]
+
+
+@pytest.mark.parametrize('shared_wait', [False, True])
+async def test_async_semaphore(shared_wait):
+    semaphore = async_semaphore_factory(connection=AsyncMemoryBackend(), capacity=2, shared_wait=shared_wait)
+    order = []
+
+    async def hold(i):
+        async with semaphore:
+            order.append(i)
+            await asyncio.sleep(0.05)
+
+    start = time.monotonic()
+    await asyncio.gather(*(hold(i) for i in range(6)))
+
+    # Waiters are handed tokens in the order they arrived
+    assert order == list(range(6))
+    assert 0.15 <= time.monotonic() - start < 0.25
+
+
+async def test_async_semaphore_cancelled_waiters_keep_no_tokens():
+    semaphore = async_semaphore_factory(connection=AsyncMemoryBackend(), max_sleep=1)
+
+    await semaphore.__aenter__()
+    waiter = asyncio.create_task(semaphore.__aenter__())
+    await asyncio.sleep(0.01)
+
+    # The waiter is handed the token, but cancelled before it gets to use it
+    await semaphore.__aexit__(None, None, None)
+    waiter.cancel()
+
+    try:
+        await waiter
+    except asyncio.CancelledError:
+        pass
+    else:
+        # It went ahead after all
+        await semaphore.__aexit__(None, None, None)
+
+    # Either way, the token wasn't lost
+    async with semaphore:
+        pass
+
+
+async def test_async_semaphore_max_sleep():
+    semaphore = async_semaphore_factory(connection=AsyncMemoryBackend(), max_sleep=0.1)
+
+    async with semaphore:
+        with pytest.raises(MaxSleepExceededError):
+            async with semaphore:
+                pass
+
+
+def test_connection_types():
+    with pytest.raises(ValidationError):
+        AsyncSemaphore(name='foo', capacity=1, connection=SyncMemoryBackend())
+    with pytest.raises(ValidationError):
+        SyncSemaphore(name='foo', capacity=1, connection=AsyncMemoryBackend())
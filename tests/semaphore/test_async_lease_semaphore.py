@@ -0,0 +1,67 @@
+import asyncio
+from datetime import datetime
+from uuid import uuid4
+
+import pytest
+
+from limiters import MaxSleepExceededError
+from tests.conftest import ASYNC_CONNECTIONS, async_lease_semaphore_factory, delta_to_seconds, run
+
+
+@pytest.mark.parametrize('connection', ASYNC_CONNECTIONS)
+async def test_lease_semaphore_runtimes(connection):
+    conn = connection()
+    # A single instance can be shared between tasks
+    semaphore = async_lease_semaphore_factory(connection=conn, capacity=2, poll_interval=0.01)
+
+    before = datetime.now()
+    await asyncio.gather(*[run(semaphore, sleep_duration=0.2) for _ in range(5)])
+    elapsed = delta_to_seconds(datetime.now() - before)
+    await conn.aclose()
+
+    # 5 holders with a capacity of 2 should take three rounds
+    assert 0.6 <= elapsed < 1
+
+
+@pytest.mark.parametrize('connection', ASYNC_CONNECTIONS)
+async def test_crashed_holder_is_reclaimed(connection):
+    conn = connection()
+    name = uuid4().hex[:6]
+
+    # Acquire without ever releasing, like a worker that crashed
+    await async_lease_semaphore_factory(connection=conn, name=name, lease_duration=0.2).__aenter__()
+
+    await asyncio.wait_for(run(async_lease_semaphore_factory(connection=conn, name=name), 0), timeout=1)
+    await conn.aclose()
+
+
+@pytest.mark.parametrize('connection', ASYNC_CONNECTIONS)
+async def test_max_sleep(connection):
+    conn = connection()
+    name = uuid4().hex[:6]
+    try:
+        with pytest.raises(MaxSleepExceededError, match=r'Max sleep \(0\.5s\) exceeded waiting for Semaphore'):
+            await asyncio.gather(
+                *[run(async_lease_semaphore_factory(connection=conn, name=name, max_sleep=0.5), 1) for _ in range(2)]
+            )
+    finally:
+        await conn.aclose()
+
+
+@pytest.mark.parametrize('connection', ASYNC_CONNECTIONS)
+async def test_lease_released_from_another_task(connection):
+    conn = connection()
+    name = uuid4().hex[:6]
+    semaphore = async_lease_semaphore_factory(connection=conn, name=name, capacity=1)
+
+    # The lease is acquired in a task of its own, but released by us
+    lease = await asyncio.wait_for(semaphore.__aenter__(), timeout=1)
+    await semaphore.__aexit__(None, None, None)
+    assert lease.released
+    assert await conn.zcard(semaphore.key) == 0
+
+    # Or released by handle, from any task
+    lease = await semaphore.acquire()
+    await asyncio.create_task(semaphore.release(lease))
+    assert await conn.zcard(semaphore.key) == 0
+    await conn.aclose()
@@ -6,12 +6,14 @@ from uuid import uuid4
 
 import pytest
 from pydantic import ValidationError
+from redis.asyncio import BlockingConnectionPool
 from redis.asyncio.client import Monitor, Redis
 
 from limiters import AsyncSemaphore, MaxSleepExceededError
 from tests.conftest import (
     ASYNC_CONNECTIONS,
     STANDALONE_ASYNC_CONNECTION,
+    STANDALONE_URL,
     async_semaphore_factory,
     delta_to_seconds,
     run,
@@ -143,17 +145,13 @@ async def test_redis_instructions(connection):
             str(await m.connection.read_response()),
             # SETNX
             str(await m.connection.read_response()),
-            # BLPOP
-            str(await m.connection.read_response()),
-            # MULTI
+            # LPOP
             str(await m.connection.read_response()),
             # EXPIRE
             str(await m.connection.read_response()),
             # EXPIRE
             str(await m.connection.read_response()),
-            # EXEC
-            str(await m.connection.read_response()),
-            # MULTI
+            # EVALSHA
             str(await m.connection.read_response()),
             # LPUSH
             str(await m.connection.read_response()),
@@ -161,8 +159,6 @@ async def test_redis_instructions(connection):
             str(await m.connection.read_response()),
             # EXPIRE
             str(await m.connection.read_response()),
-            # EXEC
-            str(await m.connection.read_response()),
         ]
         # Make sure there are no other commands generated
         with pytest.raises(asyncio.TimeoutError):
@@ -176,15 +172,84 @@ async def test_redis_instructions(connection):
         assert 'EVALSHA' in commands[0], f'was {commands[0]}'
         assert 'SETNX' in commands[1], f'was {commands[1]}'
         assert f'{{limiter}}:semaphore:{name}-exists' in commands[1], f'was {commands[1]}'
-        assert 'BLPOP' in commands[2], f'was {commands[2]}'
-        assert 'MULTI' in commands[3], f'was {commands[3]}'
+        assert 'LPOP' in commands[2], f'was {commands[2]}'
+        assert 'EXPIRE' in commands[3], f'was {commands[3]}'
         assert 'EXPIRE' in commands[4], f'was {commands[4]}'
-        assert 'EXPIRE' in commands[5], f'was {commands[5]}'
-        assert 'EXEC' in commands[6], f'was {commands[6]}'
-        assert 'MULTI' in commands[7], f'was {commands[7]}'
-        assert 'LPUSH' in commands[8], f'was {commands[8]}'
-        assert 'EXPIRE' in commands[9], f'was {commands[9]}'
-        assert f'{{limiter}}:semaphore:{name}' in commands[9], f'was {commands[9]}'
-        assert 'EXPIRE' in commands[10], f'was {commands[10]}'
-        assert f'{{limiter}}:semaphore:{name}-exists' in commands[10], f'was {commands[10]}'
-        assert 'EXEC' in commands[11], f'was {commands[11]}'
+        assert 'EVALSHA' in commands[5], f'was {commands[5]}'
+        assert 'LPUSH' in commands[6], f'was {commands[6]}'
+        assert 'EXPIRE' in commands[7], f'was {commands[7]}'
+        assert f'{{limiter}}:semaphore:{name}' in commands[7], f'was {commands[7]}'
+        assert 'EXPIRE' in commands[8], f'was {commands[8]}'
+        assert f'{{limiter}}:semaphore:{name}-exists' in commands[8], f'was {commands[8]}'
+
+
+async def test_shared_wait_connections():
+    # Three connections are enough for two holders and the shared BLPOP,
+    # however many coroutines are waiting
+    pool = BlockingConnectionPool.from_url(STANDALONE_URL, max_connections=3, timeout=5)
+    conn = Redis(connection_pool=pool)
+    name = uuid4().hex[:6]
+
+    await asyncio.wait_for(
+        asyncio.gather(
+            *[
+                run(async_semaphore_factory(connection=conn, name=name, capacity=2, shared_wait=True), 0.01)
+                for _ in range(50)
+            ]
+        ),
+        timeout=10,
+    )
+    await conn.aclose()
+    await pool.aclose()
+
+
+@pytest.mark.parametrize('connection', ASYNC_CONNECTIONS)
+async def test_shared_wait_is_fifo(connection):
+    conn = connection()
+    name = uuid4().hex[:6]
+    order = []
+
+    async def _run(i: int) -> None:
+        async with async_semaphore_factory(connection=conn, name=name, shared_wait=True):
+            order.append(i)
+            await asyncio.sleep(0.01)
+
+    tasks = []
+    for i in range(10):
+        tasks.append(asyncio.create_task(_run(i)))
+        await asyncio.sleep(0.01)
+    await asyncio.gather(*tasks)
+    await conn.aclose()
+
+    assert order == list(range(10))
+
+
+@pytest.mark.parametrize('connection', ASYNC_CONNECTIONS)
+async def test_shared_wait_max_sleep(connection):
+    conn = connection()
+    name = uuid4().hex[:6]
+    try:
+        with pytest.raises(MaxSleepExceededError):
+            await asyncio.gather(
+                *[
+                    run(async_semaphore_factory(connection=conn, name=name, max_sleep=0.5, shared_wait=True), 1)
+                    for _ in range(2)
+                ]
+            )
+        # The permit is returned once the holder is done, even though the waiter gave up
+        await asyncio.sleep(1)
+        assert await conn.llen(f'{{limiter}}:semaphore:{name}') == 1
+    finally:
+        await conn.aclose()
+
+
+@pytest.mark.parametrize('connection', ASYNC_CONNECTIONS)
+async def test_try_acquire(connection):
+    conn = connection()
+    semaphore = async_semaphore_factory(connection=conn, capacity=1)
+
+    assert await semaphore.try_acquire()
+    assert not await semaphore.try_acquire()
+    await semaphore.release()
+    assert await semaphore.try_acquire()
+    await conn.aclose()
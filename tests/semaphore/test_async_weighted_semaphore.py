@@ -0,0 +1,38 @@
+import asyncio
+from uuid import uuid4
+
+import pytest
+
+from tests.conftest import ASYNC_CONNECTIONS, async_weighted_semaphore_factory
+
+
+@pytest.mark.parametrize('connection', ASYNC_CONNECTIONS)
+async def test_reserved_capacity(connection):
+    config = {
+        'connection': connection(),
+        'name': uuid4().hex[:6],
+        'capacity': 3,
+        'poll_interval': 0.01,
+        'reserved': {'interactive': 1},
+    }
+    batch = async_weighted_semaphore_factory(**config, priority='batch', permits=2)
+    interactive = async_weighted_semaphore_factory(**config, priority='interactive')
+    done = []
+
+    async def run(semaphore, label):
+        async with semaphore:
+            await asyncio.sleep(0.2)
+        done.append(label)
+
+    # The batch jobs have to take turns, but never hold up interactive work
+    start = asyncio.get_running_loop().time()
+    tasks = [asyncio.create_task(run(batch, 'batch')) for _ in range(3)]
+    await asyncio.sleep(0.01)
+    await run(interactive, 'interactive')
+
+    assert done.count('batch') <= 1
+    assert asyncio.get_running_loop().time() - start < 0.3
+
+    await asyncio.gather(*tasks)
+    assert asyncio.get_running_loop().time() - start >= 0.6
+    await config['connection'].aclose()
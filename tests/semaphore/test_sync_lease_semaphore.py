@@ -0,0 +1,105 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import pytest
+
+from limiters import LeaseExpiredError, MaxSleepExceededError
+from limiters.lease_semaphore import _leases
+from tests.conftest import SYNC_CONNECTIONS, sync_lease_semaphore_factory
+
+
+@pytest.mark.parametrize('connection', SYNC_CONNECTIONS)
+def test_sync_lease_semaphore(connection):
+    name = uuid4().hex[:6]
+    conn = connection()
+
+    def _run():
+        with sync_lease_semaphore_factory(connection=conn, name=name, capacity=2, poll_interval=0.01):
+            time.sleep(0.2)
+
+    start = datetime.now()
+    threads = [threading.Thread(target=_run) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # 4 holders with a capacity of 2 should take two rounds
+    assert timedelta(seconds=0.4) < datetime.now() - start < timedelta(seconds=1)
+
+
+@pytest.mark.parametrize('connection', SYNC_CONNECTIONS)
+def test_sync_crashed_holder_is_reclaimed(connection):
+    name = uuid4().hex[:6]
+    conn = connection()
+
+    # Acquire without ever releasing, like a worker that crashed
+    sync_lease_semaphore_factory(connection=conn, name=name, lease_duration=0.2).__enter__()
+
+    start = datetime.now()
+    with sync_lease_semaphore_factory(connection=conn, name=name, max_sleep=1):
+        pass
+    assert timedelta(seconds=0.15) < datetime.now() - start < timedelta(seconds=1)
+
+
+@pytest.mark.parametrize('connection', SYNC_CONNECTIONS)
+def test_sync_extend(connection):
+    name = uuid4().hex[:6]
+    conn = connection()
+    holder = sync_lease_semaphore_factory(connection=conn, name=name, lease_duration=0.2)
+
+    with holder:
+        holder.extend(2)
+        time.sleep(0.3)
+        with (
+            pytest.raises(MaxSleepExceededError),
+            sync_lease_semaphore_factory(connection=conn, name=name, max_sleep=0.2),
+        ):
+            pass
+
+    with holder:
+        time.sleep(0.3)
+        with pytest.raises(LeaseExpiredError):
+            holder.extend()
+
+
+@pytest.mark.parametrize('connection', SYNC_CONNECTIONS)
+def test_sync_lease_released_from_another_thread(connection):
+    conn = connection()
+    semaphore = sync_lease_semaphore_factory(connection=conn, lease_duration=0.2)
+    lease = semaphore.acquire()
+
+    thread = threading.Thread(target=semaphore.extend, args=(2, lease))
+    thread.start()
+    thread.join()
+    time.sleep(0.3)
+    semaphore.extend(lease=lease)
+
+    thread = threading.Thread(target=semaphore.release, args=(lease,))
+    thread.start()
+    thread.join()
+    assert lease.released
+    assert conn.zcard(semaphore.key) == 0
+
+
+@pytest.mark.parametrize('connection', SYNC_CONNECTIONS)
+def test_sync_lease_must_be_passed_from_another_thread(connection):
+    semaphore = sync_lease_semaphore_factory(connection=connection(), capacity=2)
+    first, second = semaphore.acquire(), semaphore.acquire()
+
+    # Another thread has no lease of its own, and there's no telling which one it meant
+    with ThreadPoolExecutor() as pool, pytest.raises(RuntimeError):
+        pool.submit(semaphore.release).result()
+    assert not first.released
+    assert not second.released
+
+    # Leases released elsewhere don't pile up in the acquiring thread's context
+    for lease in (first, second):
+        thread = threading.Thread(target=semaphore.release, args=(lease,))
+        thread.start()
+        thread.join()
+    with semaphore as third:
+        assert [lease for lease in _leases.get() if lease.semaphore is semaphore] == [third]
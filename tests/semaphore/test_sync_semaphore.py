@@ -5,9 +5,10 @@ from datetime import datetime, timedelta
 from uuid import uuid4
 
 import pytest
+from redis import BlockingConnectionPool, Redis
 
 from limiters import MaxSleepExceededError
-from tests.conftest import SYNC_CONNECTIONS, sync_semaphore_factory
+from tests.conftest import STANDALONE_URL, SYNC_CONNECTIONS, sync_semaphore_factory
 
 logger = logging.getLogger(__name__)
 
@@ -36,3 +37,69 @@ async def test_sync_max_sleep(connection):
     time.sleep(0.1)
     with pytest.raises(MaxSleepExceededError, match=r'Max sleep exceeded waiting for Semaphore'):
         _run(name, 0, c)
+
+
+@pytest.mark.parametrize('connection', SYNC_CONNECTIONS)
+def test_sync_max_sleep_keeps_capacity(connection):
+    name = uuid4().hex[:6]
+    c = connection()
+    holder = sync_semaphore_factory(connection=c, name=name, capacity=1, max_sleep=0.1)
+    holder.__enter__()
+    with pytest.raises(MaxSleepExceededError):
+        _run(name, 0, c)
+    holder.__exit__(None, None, None)
+
+    # Timing out must not have consumed the permit
+    assert c.llen(holder.key) == 1
+
+
+@pytest.mark.parametrize('connection', SYNC_CONNECTIONS)
+def test_sync_try_acquire(connection):
+    semaphore = sync_semaphore_factory(connection=connection(), capacity=2)
+
+    start = time.monotonic()
+    assert semaphore.try_acquire()
+    assert semaphore.try_acquire()
+    assert not semaphore.try_acquire()
+    assert time.monotonic() - start < 0.1
+
+    semaphore.release()
+    assert semaphore.try_acquire()
+
+
+def test_sync_shared_wait_connections():
+    # Three connections are enough for two holders and the shared BLPOP, however many threads are waiting
+    conn = Redis(connection_pool=BlockingConnectionPool.from_url(STANDALONE_URL, max_connections=3, timeout=5))
+    semaphore = sync_semaphore_factory(connection=conn, capacity=2, shared_wait=True)
+    order = []
+
+    def hold(i):
+        with semaphore:
+            order.append(i)
+            time.sleep(0.01)
+
+    threads = [threading.Thread(target=hold, args=(i,)) for i in range(30)]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.001)
+    for thread in threads:
+        thread.join(timeout=10)
+
+    assert sorted(order) == list(range(30))
+    assert conn.llen(semaphore.key) == 2
+
+
+@pytest.mark.parametrize('connection', SYNC_CONNECTIONS)
+def test_sync_shared_wait_max_sleep(connection):
+    conn = connection()
+    semaphore = sync_semaphore_factory(connection=conn, max_sleep=0.2, shared_wait=True)
+
+    with semaphore:
+        start = time.monotonic()
+        with pytest.raises(MaxSleepExceededError):
+            sync_semaphore_factory(connection=conn, name=semaphore.name, max_sleep=0.2, shared_wait=True).__enter__()
+        assert 0.2 <= time.monotonic() - start < 0.5
+
+    # The waiter that gave up didn't take the token when it was released
+    time.sleep(0.1)
+    assert semaphore.try_acquire()
@@ -0,0 +1,63 @@
+from uuid import uuid4
+
+import pytest
+from pydantic import ValidationError
+
+from limiters import MaxSleepExceededError
+from tests.conftest import SYNC_CONNECTIONS, sync_weighted_semaphore_factory
+
+
+@pytest.mark.parametrize('connection', SYNC_CONNECTIONS)
+def test_sync_weighted_acquires(connection):
+    config = {'connection': connection(), 'name': uuid4().hex[:6], 'capacity': 5, 'max_sleep': 0.1}
+
+    with (
+        sync_weighted_semaphore_factory(**config, permits=3),
+        sync_weighted_semaphore_factory(**config, permits=2),
+        pytest.raises(MaxSleepExceededError),
+        sync_weighted_semaphore_factory(**config),
+    ):
+        pass
+
+    with sync_weighted_semaphore_factory(**config, permits=5):
+        pass
+
+
+@pytest.mark.parametrize('connection', SYNC_CONNECTIONS)
+def test_sync_reserved_capacity(connection):
+    config = {
+        'connection': connection(),
+        'name': uuid4().hex[:6],
+        'capacity': 4,
+        'max_sleep': 0.1,
+        'reserved': {'interactive': 1},
+    }
+    batch = sync_weighted_semaphore_factory(**config, priority='batch')
+    interactive = sync_weighted_semaphore_factory(**config, priority='interactive')
+
+    # Batch work can't take the permit reserved for interactive work
+    with batch, batch, batch:
+        with pytest.raises(MaxSleepExceededError), batch:
+            pass
+
+        # But interactive work can use its own, and any that are unreserved
+        with interactive:
+            pass
+
+    # Once interactive work has its reserved permit, it competes for the rest like anyone else
+    with interactive, interactive, batch, batch, pytest.raises(MaxSleepExceededError), interactive:
+        pass
+
+
+@pytest.mark.parametrize(
+    'config',
+    [
+        {'capacity': 2, 'reserved': {'interactive': 3}},
+        {'capacity': 2, 'reserved': {'interactive': -1}},
+        {'capacity': 2, 'permits': 3},
+        {'capacity': 2, 'permits': 2, 'priority': 'batch', 'reserved': {'interactive': 1}},
+    ],
+)
+def test_sync_weighted_semaphore_config(config):
+    with pytest.raises(ValidationError):
+        sync_weighted_semaphore_factory(connection=SYNC_CONNECTIONS[0](), **config)
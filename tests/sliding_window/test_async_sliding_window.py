@@ -0,0 +1,74 @@
+import asyncio
+import re
+import time
+from uuid import uuid4
+
+import pytest
+from pydantic import ValidationError
+
+from limiters import MaxSleepExceededError
+from tests.conftest import ASYNC_CONNECTIONS, async_sliding_window_factory, run
+
+
+@pytest.mark.parametrize('connection', ASYNC_CONNECTIONS)
+@pytest.mark.parametrize('approximate', [False, True])
+async def test_sliding_window_runtimes(connection, approximate):
+    conn = connection()
+    window = async_sliding_window_factory(connection=conn, capacity=5, window=0.5, approximate=approximate)
+
+    start = time.monotonic()
+    handed_out = []
+
+    async def acquire() -> None:
+        await window.acquire()
+        handed_out.append(time.monotonic())
+
+    await asyncio.gather(*[acquire() for _ in range(10)])
+    await conn.aclose()
+
+    handed_out.sort()
+    if not approximate:
+        # No more than 5 tokens are handed out in any 500ms
+        assert all(b - a >= 0.45 for a, b in zip(handed_out, handed_out[5:], strict=False))
+    assert 0.1 < time.monotonic() - start < 1.2
+
+
+@pytest.mark.parametrize('connection', ASYNC_CONNECTIONS)
+async def test_max_sleep(connection):
+    conn = connection()
+    name = uuid4().hex[:6]
+    try:
+        with pytest.raises(MaxSleepExceededError, match=r'Max sleep \(1.0s\) exceeded'):
+            await asyncio.gather(
+                *[
+                    run(async_sliding_window_factory(connection=conn, name=name, window=5, max_sleep=1), 0)
+                    for _ in range(3)
+                ]
+            )
+    finally:
+        await conn.aclose()
+
+
+@pytest.mark.parametrize('connection', ASYNC_CONNECTIONS)
+def test_repr(connection):
+    window = async_sliding_window_factory(connection=connection(), name='test', approximate=True)
+    assert re.match(r'Sliding window instance for {limiter}:sliding-window-counter:test', str(window))
+
+
+@pytest.mark.parametrize('connection', ASYNC_CONNECTIONS)
+@pytest.mark.parametrize(
+    'config,error',
+    [
+        ({'capacity': 0}, ValidationError),
+        ({'window': 0}, ValidationError),
+        ({'window': 0.1}, None),
+        ({'max_sleep': -1}, ValidationError),
+        ({'approximate': 'test'}, ValidationError),
+    ],
+)
+def test_init_types(connection, config, error):
+    if error:
+        with pytest.raises(error):
+            async_sliding_window_factory(connection=connection(), **config)
+    else:
+        async_sliding_window_factory(connection=connection(), **config)
@@ -0,0 +1,60 @@
+import time
+
+import pytest
+
+from limiters import MaxSleepExceededError
+from tests.conftest import SYNC_CONNECTIONS, sync_sliding_window_factory
+
+
+@pytest.mark.parametrize('connection', SYNC_CONNECTIONS)
+def test_sync_sliding_window_log(connection):
+    window = sync_sliding_window_factory(connection=connection(), capacity=3, window=0.5)
+
+    start = time.monotonic()
+    for _ in range(3):
+        with window:
+            pass
+    assert time.monotonic() - start < 0.1
+
+    # The next token is free once the first one has left the window
+    with window:
+        pass
+    assert 0.4 < time.monotonic() - start < 0.65
+
+
+@pytest.mark.parametrize('connection', SYNC_CONNECTIONS)
+def test_sync_sliding_window_counter(connection):
+    window = sync_sliding_window_factory(connection=connection(), capacity=3, window=0.5, approximate=True)
+
+    start = time.monotonic()
+    for _ in range(3):
+        window.acquire()
+    assert time.monotonic() - start < 0.1
+
+    # We'll have to wait for the next window, and then some of the previous one to slide out
+    window.acquire()
+    assert 0.1 < time.monotonic() - start < 0.75
+
+
+@pytest.mark.parametrize('connection', SYNC_CONNECTIONS)
+@pytest.mark.parametrize('approximate', [False, True])
+def test_sync_sliding_window_max_sleep(connection, approximate):
+    window = sync_sliding_window_factory(connection=connection(), window=10, max_sleep=0.5, approximate=approximate)
+    window.acquire()
+
+    start = time.monotonic()
+    with pytest.raises(MaxSleepExceededError, match=r'Max sleep \(0.5s\) exceeded waiting for sliding window'):
+        window.acquire()
+
+    # We know we'd have to wait too long, so we don't wait at all
+    assert time.monotonic() - start < 0.1
+
+
+@pytest.mark.parametrize('connection', SYNC_CONNECTIONS)
+@pytest.mark.parametrize('approximate', [False, True])
+def test_sync_sliding_window_many_tokens(connection, approximate):
+    window = sync_sliding_window_factory(connection=connection(), capacity=10, window=10, approximate=approximate)
+    assert window.acquire(tokens=10) < 0.1
+
+    with pytest.raises(ValueError, match='Cannot acquire 11 tokens'):
+        window.acquire(tokens=11)
@@ -0,0 +1,93 @@
+import pytest
+from pydantic import BaseModel, PrivateAttr, ValidationError
+from redis.crc import key_slot
+
+from limiters import KeyLayout, SyncTokenBucket
+from limiters.base import CachedValidationModel, _validation_cache
+from limiters.metrics import InMemoryMetrics
+from tests.conftest import (
+    STANDALONE_SYNC_CONNECTION,
+    SYNC_CONNECTIONS,
+    sync_semaphore_factory,
+    sync_tokenbucket_factory,
+)
+
+
+@pytest.mark.parametrize('connection', [STANDALONE_SYNC_CONNECTION])
+def test_validation_is_cached(connection, mocker):
+    conn = connection()
+    first = sync_tokenbucket_factory(connection=conn, name='cached')
+    validate = mocker.patch.object(BaseModel, '__init__')
+
+    second = sync_tokenbucket_factory(connection=conn, name='cached')
+
+    validate.assert_not_called()
+    assert first == second
+    assert first.key == second.key == '{limiter}:token-bucket:cached'
+    assert second.connection is conn
+
+
+@pytest.mark.parametrize('connection', [STANDALONE_SYNC_CONNECTION])
+def test_cache_does_not_share_connections(connection):
+    a, b = connection(), connection()
+    assert sync_semaphore_factory(connection=a, name='cached').connection is a
+    assert sync_semaphore_factory(connection=b, name='cached').connection is b
+    assert not any(conn in key for key in _validation_cache for conn in (a, b))
+
+
+@pytest.mark.parametrize('connection', [STANDALONE_SYNC_CONNECTION])
+def test_cache_only_holds_plain_values(connection):
+    metrics = InMemoryMetrics()
+    sync_tokenbucket_factory(connection=connection(), name='cached', metrics=metrics)
+    assert not any(value is metrics for _, _, arguments in _validation_cache for _, _, value in arguments)
+
+
+def test_cache_copies_private_state():
+    class Tagged(CachedValidationModel):
+        name: str
+
+        _tags: list[str] = PrivateAttr()
+
+        def _post_init(self) -> None:
+            self._tags = [self.name]
+
+    first, second = Tagged(name='cached'), Tagged(name='cached')
+    first._tags.append('changed')
+    assert second._tags == ['cached']
+
+
+@pytest.mark.parametrize('connection', [STANDALONE_SYNC_CONNECTION])
+def test_cache_distinguishes_types(connection):
+    conn = connection()
+    assert sync_tokenbucket_factory(connection=conn, name=1).name == '1'
+    assert sync_tokenbucket_factory(connection=conn, name=True).name == 'True'
+
+
+@pytest.mark.parametrize('connection', [STANDALONE_SYNC_CONNECTION])
+def test_invalid_config_is_never_cached(connection):
+    for _ in range(2):
+        with pytest.raises(ValidationError):
+            SyncTokenBucket(name='x', capacity=-1, refill_frequency=1, refill_amount=1, connection=connection())
+
+
+@pytest.mark.parametrize('connection', [STANDALONE_SYNC_CONNECTION])
+def test_per_limiter_key_layout(connection):
+    conn = connection()
+    foo = sync_semaphore_factory(connection=conn, name='foo', key_layout='per-limiter')
+    bar = sync_semaphore_factory(connection=conn, name='bar', key_layout=KeyLayout.PER_LIMITER)
+
+    assert foo.key == '{limiter:foo}:semaphore'
+    assert key_slot(foo.key.encode()) == key_slot(foo.exists.encode())
+    assert key_slot(foo.key.encode()) != key_slot(bar.key.encode())
+
+    # The default layout keeps every limiter in the same slot
+    assert sync_semaphore_factory(connection=conn, name='foo').key == '{limiter}:semaphore:foo'
+
+
+@pytest.mark.parametrize('connection', SYNC_CONNECTIONS)
+def test_per_limiter_key_layout_runs_scripts(connection):
+    conn = connection()
+    with sync_semaphore_factory(connection=conn, key_layout='per-limiter'):
+        pass
+    with sync_tokenbucket_factory(connection=conn, key_layout='per-limiter'):
+        pass
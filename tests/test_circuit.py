@@ -0,0 +1,36 @@
+from limiters import circuit
+
+
+class Connection:
+    pass
+
+
+def test_circuit_is_per_connection():
+    first, second = Connection(), Connection()
+    circuit.trip(first, 'key', 10)
+
+    assert 9 < circuit.busy_for(first, 'key') <= 10
+    assert circuit.busy_for(second, 'key') == 0
+
+
+def test_circuit_forgets_the_oldest_keys(mocker):
+    mocker.patch('limiters.circuit.CIRCUIT_SIZE', 3)
+    mocker.patch.dict('limiters.circuit._busy_until', clear=True)
+    connection = Connection()
+    for key in ['a', 'b', 'c']:
+        circuit.trip(connection, key, 10)
+
+    # Nothing has expired, so the key tripped longest ago makes room
+    circuit.trip(connection, 'a', 20)
+    circuit.trip(connection, 'd', 10)
+    assert circuit.busy_for(connection, 'b') == 0
+    assert all(circuit.busy_for(connection, key) for key in ['a', 'c', 'd'])
+
+
+def test_circuit_forgets_connections_once_theyre_gone():
+    connection = Connection()
+    circuit.trip(connection, 'key', 10)
+    del connection
+
+    # Even if a new connection ends up with the same ID, which it usually does
+    assert circuit.busy_for(Connection(), 'key') == 0
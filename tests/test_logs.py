@@ -0,0 +1,28 @@
+import logging
+
+from limiters.logs import RateLimitedLogger
+
+
+def test_rate_limited_logger(caplog, mocker):
+    monotonic = mocker.patch('limiters.logs.time.monotonic', return_value=100.0)
+    logger = RateLimitedLogger(logging.getLogger('test'), interval=1.0)
+
+    with caplog.at_level(logging.INFO, logger='test'):
+        for _ in range(5):
+            logger.info('Sleeping %s seconds', 1)
+        monotonic.return_value = 101.0
+        logger.info('Sleeping %s seconds', 2)
+
+    assert caplog.messages == ['Sleeping 1 seconds', 'Sleeping 2 seconds (4 similar messages suppressed)']
+
+
+def test_rate_limited_logger_skips_disabled_levels(caplog):
+    logger = RateLimitedLogger(logging.getLogger('test'))
+
+    with caplog.at_level(logging.WARNING, logger='test'):
+        logger.info('Sleeping %s seconds', 1)
+    with caplog.at_level(logging.INFO, logger='test'):
+        logger.info('Sleeping %s seconds', 2)
+
+    # Disabled messages aren't counted as suppressed either
+    assert caplog.messages == ['Sleeping 2 seconds']
@@ -0,0 +1,107 @@
+import asyncio
+
+import pytest
+
+from limiters import MaxSleepExceededError
+from limiters.metrics import Histogram, InMemoryMetrics, PrometheusMetrics, StatsdMetrics
+from tests.conftest import (
+    ASYNC_CONNECTIONS,
+    SYNC_CONNECTIONS,
+    async_semaphore_factory,
+    sync_gcra_factory,
+    sync_tokenbucket_factory,
+)
+
+
+def test_histogram_quantiles():
+    histogram = Histogram(buckets=[1, 2, 3])
+    for value in [0.5] * 50 + [1.5] * 40 + [2.5] * 9 + [7]:
+        histogram.observe(value)
+
+    assert histogram.count == 100
+    assert histogram.max == 7
+    assert histogram.quantile(0.5) == 1
+    assert 1 < histogram.quantile(0.9) <= 2
+    assert 2 < histogram.quantile(0.99) <= 3
+    assert histogram.quantile(1) == 7
+
+
+@pytest.mark.parametrize('connection', SYNC_CONNECTIONS)
+def test_token_bucket_metrics(connection):
+    metrics = InMemoryMetrics()
+    bucket = sync_tokenbucket_factory(connection=connection(), refill_frequency=0.2, max_sleep=0.5, metrics=metrics)
+
+    bucket.acquire()
+    bucket.acquire()
+    assert not bucket.try_acquire()
+
+    labels = ('SyncTokenBucket', bucket.name)
+    assert metrics.histograms['redis_call', *labels].count == 3
+    slept = metrics.histograms['slept', *labels]
+    assert slept.count == 2
+    assert 0.1 < slept.sum <= 0.2
+    assert metrics.rejections[labels] == 1
+
+
+@pytest.mark.parametrize('connection', SYNC_CONNECTIONS)
+def test_max_sleep_rejections(connection):
+    metrics = InMemoryMetrics()
+    limiter = sync_gcra_factory(connection=connection(), refill_frequency=1, max_sleep=0.1, metrics=metrics)
+
+    limiter.acquire()
+    for _ in range(3):
+        with pytest.raises(MaxSleepExceededError):
+            limiter.acquire()
+
+    assert metrics.rejections['SyncGCRA', limiter.name] == 3
+
+
+@pytest.mark.parametrize('connection', ASYNC_CONNECTIONS)
+async def test_semaphore_metrics(connection):
+    metrics = InMemoryMetrics()
+    semaphore = async_semaphore_factory(connection=connection(), capacity=1, metrics=metrics)
+
+    async def hold(seconds):
+        async with semaphore:
+            await asyncio.sleep(seconds)
+
+    await asyncio.gather(hold(0.1), hold(0.2))
+    async with semaphore:
+        assert not await semaphore.try_acquire()
+
+    labels = ('AsyncSemaphore', semaphore.name)
+    held = metrics.histograms['held', *labels]
+    assert held.count == 3
+    assert 0.3 <= held.sum < 0.4
+    assert metrics.rejections[labels] == 1
+
+    # The second coroutine waited for the first to release the semaphore
+    assert 0.1 <= metrics.histograms['slept', *labels].max < 0.2
+
+
+def test_statsd_metrics(mocker):
+    client = mocker.Mock()
+    metrics = StatsdMetrics(client, prefix='app')
+    bucket = mocker.Mock(name='bucket')
+    bucket.name = 'foo'
+
+    metrics.slept(bucket, 0.25)
+    metrics.rejected(bucket)
+
+    client.timing.assert_called_once_with('app.Mock.foo.slept', 250)
+    client.incr.assert_called_once_with('app.Mock.foo.rejected')
+
+
+def test_prometheus_metrics(mocker):
+    prometheus_client = pytest.importorskip('prometheus_client')
+    registry = prometheus_client.CollectorRegistry()
+    metrics = PrometheusMetrics(registry=registry)
+    bucket = mocker.Mock()
+    bucket.name = 'foo'
+
+    metrics.slept(bucket, 0.25)
+    metrics.rejected(bucket)
+
+    labels = {'kind': 'Mock', 'limiter': 'foo'}
+    assert registry.get_sample_value('limiters_sleep_seconds_sum', labels) == 0.25
+    assert registry.get_sample_value('limiters_rejections_total', labels) == 1
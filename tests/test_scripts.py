@@ -0,0 +1,58 @@
+import pytest
+
+from limiters import load_scripts, load_scripts_async
+from limiters.scripts import get_script
+from tests.conftest import (
+    ASYNC_CONNECTIONS,
+    STANDALONE_ASYNC_CONNECTION,
+    STANDALONE_SYNC_CONNECTION,
+    SYNC_CONNECTIONS,
+    async_tokenbucket_factory,
+    sync_tokenbucket_factory,
+)
+
+
+def test_scripts_are_shared():
+    assert get_script('token_bucket.lua') is get_script('token_bucket.lua')
+    assert get_script('token_bucket.lua') is not get_script('semaphore.lua')
+
+
+@pytest.mark.parametrize('name', ['token_bucket.lua', 'token_bucket_refund.lua', 'composite.lua'])
+def test_includes_are_expanded(name):
+    source = get_script(name).source
+    assert '-- include:' not in source
+    assert 'local function decode_state' in source
+
+
+@pytest.mark.parametrize('connection', [STANDALONE_SYNC_CONNECTION])
+def test_sync_noscript_fallback(connection):
+    conn = connection()
+    conn.script_flush()
+    with sync_tokenbucket_factory(connection=conn):
+        pass
+    assert conn.script_exists(get_script('token_bucket.lua').sha) == [True]
+
+
+@pytest.mark.parametrize('connection', [STANDALONE_ASYNC_CONNECTION])
+async def test_async_noscript_fallback(connection):
+    conn = connection()
+    await conn.script_flush()
+    async with async_tokenbucket_factory(connection=conn):
+        pass
+    assert await conn.script_exists(get_script('token_bucket.lua').sha) == [True]
+    await conn.aclose()
+
+
+@pytest.mark.parametrize('connection', SYNC_CONNECTIONS)
+def test_sync_load_scripts(connection):
+    conn = connection()
+    load_scripts(conn)
+    assert all(conn.script_exists(get_script('semaphore.lua').sha, get_script('token_bucket.lua').sha))
+
+
+@pytest.mark.parametrize('connection', ASYNC_CONNECTIONS)
+async def test_async_load_scripts(connection):
+    conn = connection()
+    await load_scripts_async(conn, 'semaphore.lua')
+    assert all(await conn.script_exists(get_script('semaphore.lua').sha))
+    await conn.aclose()
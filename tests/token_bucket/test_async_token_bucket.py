@@ -1,6 +1,8 @@
 import asyncio
+import itertools
 import logging
 import re
+import time
 from datetime import datetime
 from uuid import uuid4
 
@@ -139,3 +141,169 @@ async def test_max_sleep(connection):
             )
     finally:
         await conn.aclose()
+
+
+@pytest.mark.parametrize('connection', ASYNC_CONNECTIONS)
+async def test_acquire_many_tokens(connection):
+    conn = connection()
+    bucket = async_tokenbucket_factory(connection=conn, capacity=10, refill_amount=5, refill_frequency=0.2)
+
+    before = datetime.now()
+    # The first 10 are free, and the last 10 need two refills
+    await asyncio.gather(bucket.acquire(tokens=4), bucket.acquire(tokens=6), bucket.acquire(tokens=10))
+    elapsed = delta_to_seconds(datetime.now() - before)
+    await conn.aclose()
+    assert abs(0.4 - elapsed) <= 0.25
+
+
+@pytest.mark.parametrize('connection', ASYNC_CONNECTIONS)
+async def test_lease_tokens(connection, mocker):
+    spy = mocker.spy(AsyncTokenBucket, 'script')
+    conn = connection()
+    name = uuid4().hex[:6]
+    bucket = async_tokenbucket_factory(connection=conn, name=name, capacity=10, refill_amount=10, lease_size=5)
+
+    # Concurrent tasks share the lease, and only the first to find it empty renews it
+    await asyncio.gather(*[bucket.acquire() for _ in range(10)])
+    assert spy.call_count == 2
+
+    # The leases used up the whole bucket, so others have to wait for a refill
+    assert await async_tokenbucket_factory(connection=conn, name=name, capacity=10).acquire() > 0.5
+    await conn.aclose()
+
+
+@pytest.mark.parametrize('connection', ASYNC_CONNECTIONS)
+async def test_release_lease(connection):
+    conn = connection()
+    name = uuid4().hex[:6]
+    bucket = async_tokenbucket_factory(connection=conn, name=name, capacity=5, lease_size=5)
+    await bucket.acquire()
+    await bucket.release_lease()
+
+    # The 4 tokens we didn't use are back in the bucket
+    assert await async_tokenbucket_factory(connection=conn, name=name, capacity=5).acquire(tokens=4) == 0
+    await conn.aclose()
+
+
+@pytest.mark.parametrize('connection', ASYNC_CONNECTIONS)
+async def test_server_time(connection, mocker):
+    # Our clock is way off, but we never use it
+    mocker.patch('limiters.token_bucket.create_redis_time_tuple', return_value=(0, 0))
+    conn = connection()
+    bucket = async_tokenbucket_factory(connection=conn, capacity=2, refill_frequency=0.2, server_time=True)
+
+    before = datetime.now()
+    await asyncio.gather(*[bucket.acquire() for _ in range(4)])
+    elapsed = delta_to_seconds(datetime.now() - before)
+    await conn.aclose()
+    assert abs(0.4 - elapsed) <= 0.1
+
+
+@pytest.mark.parametrize('connection', ASYNC_CONNECTIONS)
+async def test_try_acquire(connection):
+    conn = connection()
+    bucket = async_tokenbucket_factory(connection=conn, capacity=1, refill_frequency=0.2)
+
+    assert await bucket.try_acquire()
+    result = await bucket.try_acquire()
+    assert not result
+    assert 0.1 < result.retry_after <= 0.2
+
+    await asyncio.sleep(result.retry_after)
+    assert await bucket.try_acquire()
+    await conn.aclose()
+
+
+@pytest.mark.parametrize('connection', ASYNC_CONNECTIONS)
+async def test_queue_horizon(connection):
+    conn = connection()
+    name = uuid4().hex[:6]
+    batch = async_tokenbucket_factory(connection=conn, name=name, refill_frequency=0.2, queue_horizon=0.05)
+    interactive = async_tokenbucket_factory(connection=conn, name=name, refill_frequency=0.2)
+    done = []
+
+    async def acquire(bucket, label):
+        await bucket.acquire()
+        done.append(label)
+
+    batch_work = [asyncio.create_task(acquire(batch, 'batch')) for _ in range(3)]
+    await asyncio.sleep(0.01)
+
+    # Batch work only holds the first token, so interactive work goes straight to the front of the queue
+    assert await interactive.acquire() < 0.25
+    assert done == ['batch']
+
+    await asyncio.gather(*batch_work)
+    assert done == ['batch', 'batch', 'batch']
+    await conn.aclose()
+
+
+@pytest.mark.parametrize('connection', ASYNC_CONNECTIONS)
+async def test_cancelled_acquires_are_refunded(connection):
+    conn = connection()
+    bucket = async_tokenbucket_factory(connection=conn, capacity=1, refill_frequency=0.1)
+    granted = []
+
+    async def acquire():
+        await bucket.acquire()
+        granted.append(time.monotonic())
+
+    # Reserve the next 2 seconds worth of tokens, then cancel every other reservation
+    started = time.monotonic()
+    tasks = [asyncio.create_task(acquire()) for _ in range(20)]
+    await asyncio.sleep(0.05)
+    for task in tasks[1::2]:
+        task.cancel()
+    await asyncio.gather(*tasks[1::2], return_exceptions=True)
+
+    # Latecomers take the cancelled slots, instead of queueing after them, but refunds never
+    # hand out a slot twice, so they can't exceed the rate of one token per 100ms either
+    await asyncio.gather(*tasks[::2], *[acquire() for _ in range(10)])
+    await conn.aclose()
+    assert len(granted) == 20
+    assert all(later - earlier > 0.08 for earlier, later in itertools.pairwise(sorted(granted)))
+    assert max(granted) - started < 2.2
+
+
+@pytest.mark.parametrize('connection', ASYNC_CONNECTIONS)
+async def test_timed_out_acquires_are_refunded(connection):
+    conn = connection()
+    bucket = async_tokenbucket_factory(connection=conn, capacity=1, refill_frequency=0.5)
+    await bucket.acquire()
+
+    with pytest.raises(TimeoutError):
+        await asyncio.wait_for(bucket.acquire(), timeout=0.1)
+
+    # The timed out call gave its slot back, so we get it instead of the one after
+    assert await bucket.acquire() < 0.5
+    await conn.aclose()
+
+
+@pytest.mark.parametrize('connection', [STANDALONE_ASYNC_CONNECTION])
+async def test_cancelled_leased_acquires_are_refunded(connection):
+    conn = connection()
+    bucket = async_tokenbucket_factory(connection=conn, capacity=4, refill_amount=4, refill_frequency=0.5, lease_size=2)
+    await bucket.acquire(tokens=4)
+
+    # Both tokens in the next lease are due in 500ms; cancel one of them
+    first, second = asyncio.create_task(bucket.acquire()), asyncio.create_task(bucket.acquire())
+    await asyncio.sleep(0.1)
+    second.cancel()
+    await asyncio.gather(first, second, return_exceptions=True)
+
+    # The cancelled token went back into the lease
+    assert bucket._lease(conn, asyncio.Lock).tokens == 1
+    await conn.aclose()
+
+
+@pytest.mark.parametrize('connection', ASYNC_CONNECTIONS)
+async def test_reserve_many(connection):
+    conns = [connection(), connection()]
+    buckets = [async_tokenbucket_factory(connection=conns[i % 2], capacity=2, refill_frequency=0.4) for i in range(6)]
+
+    assert await AsyncTokenBucket.reserve_many(buckets, tokens=2) == [0] * 6
+    waits = await AsyncTokenBucket.reserve_many(buckets)
+    assert all(0.3 < wait <= 0.4 for wait in waits)
+
+    for conn in conns:
+        await conn.aclose()
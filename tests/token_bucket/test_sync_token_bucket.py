@@ -1,11 +1,18 @@
 import logging
+import threading
+import time
 from datetime import datetime, timedelta
 from uuid import uuid4
 
 import pytest
+from pydantic import ValidationError
+from redis import BlockingConnectionPool, Redis
+from redis.exceptions import ResponseError
 
-from limiters import MaxSleepExceededError
-from tests.conftest import SYNC_CONNECTIONS, sync_tokenbucket_factory
+from limiters import MaxSleepExceededError, SyncTokenBucket
+from limiters.memory import SyncMemoryBackend
+from limiters.metrics import InMemoryMetrics
+from tests.conftest import STANDALONE_URL, SYNC_CONNECTIONS, sync_tokenbucket_factory
 
 logger = logging.getLogger(__name__)
 
@@ -38,3 +45,292 @@ async def test_sync_max_sleep(connection):
         sync_tokenbucket_factory(connection=connection(), name=name, max_sleep=0.1),
     ):
         pass
+
+
+@pytest.mark.parametrize('connection', SYNC_CONNECTIONS)
+def test_sync_acquire_many_tokens(connection):
+    bucket = sync_tokenbucket_factory(connection=connection(), capacity=10, refill_amount=5, refill_frequency=0.2)
+
+    # The bucket starts out full
+    assert bucket.acquire(tokens=10) == 0
+
+    # 7 tokens need two refills
+    start = datetime.now()
+    bucket.acquire(tokens=7)
+    assert timedelta(seconds=0.3) < datetime.now() - start < timedelta(seconds=0.6)
+
+
+@pytest.mark.parametrize('connection', SYNC_CONNECTIONS)
+@pytest.mark.parametrize('tokens', [0, 11])
+def test_sync_acquire_invalid_tokens(connection, tokens):
+    bucket = sync_tokenbucket_factory(connection=connection(), capacity=10)
+    with pytest.raises(ValueError, match=rf'Cannot acquire {tokens} tokens'):
+        bucket.acquire(tokens=tokens)
+
+
+@pytest.mark.parametrize('connection', SYNC_CONNECTIONS)
+def test_sync_lease_tokens(connection, mocker):
+    spy = mocker.spy(SyncTokenBucket, 'script')
+    name = uuid4().hex[:6]
+    config = {'name': name, 'capacity': 10, 'refill_amount': 10, 'lease_size': 5}
+    first = sync_tokenbucket_factory(connection=connection(), **config)
+    second = sync_tokenbucket_factory(connection=connection(), **config)
+
+    # Each connection leases 5 tokens, with a single call, and hands them out locally
+    for _ in range(5):
+        assert first.acquire() == 0
+        assert second.acquire() == 0
+    assert spy.call_count == 2
+
+    # The leases used up the whole bucket, so others have to wait for a refill
+    assert sync_tokenbucket_factory(connection=connection(), name=name, capacity=10, refill_amount=10).acquire() > 0.5
+
+
+@pytest.mark.parametrize('connection', SYNC_CONNECTIONS)
+def test_sync_release_lease(connection):
+    name = uuid4().hex[:6]
+    conn = connection()
+    bucket = sync_tokenbucket_factory(connection=conn, name=name, capacity=5, lease_size=5)
+    bucket.acquire()
+    bucket.release_lease()
+
+    # The 4 tokens we didn't use are back in the bucket
+    assert sync_tokenbucket_factory(connection=conn, name=name, capacity=5).acquire(tokens=4) == 0
+
+
+@pytest.mark.parametrize('connection', SYNC_CONNECTIONS)
+def test_sync_lease_size_within_capacity(connection):
+    with pytest.raises(ValidationError, match='lease_size cannot exceed the capacity'):
+        sync_tokenbucket_factory(connection=connection(), capacity=5, lease_size=6)
+
+
+@pytest.mark.parametrize('connection', SYNC_CONNECTIONS)
+def test_sync_server_time(connection, mocker):
+    # Our clock is way off, but we never use it
+    mocker.patch('limiters.token_bucket.create_redis_time_tuple', return_value=(0, 0))
+    bucket = sync_tokenbucket_factory(connection=connection(), refill_frequency=0.2, server_time=True)
+
+    assert bucket.acquire() == 0
+    assert 0.1 < bucket.acquire() <= 0.2
+    assert 0.1 < bucket.acquire() <= 0.2
+
+
+@pytest.mark.parametrize('connection', SYNC_CONNECTIONS)
+@pytest.mark.parametrize('server_time', [False, True])
+def test_sync_try_acquire(connection, server_time):
+    conn = connection()
+    bucket = sync_tokenbucket_factory(connection=conn, capacity=2, refill_frequency=0.5, server_time=server_time)
+
+    assert bucket.try_acquire(tokens=2)
+    state = conn.get(bucket.key)
+
+    # Rejected calls say when to retry, and leave the bucket as it was
+    for _ in range(3):
+        result = bucket.try_acquire()
+        assert not result.granted
+        assert 0.3 < result.retry_after <= 0.5
+    assert conn.get(bucket.key) == state
+
+    # Sleeping callers aren't pushed back by the rejected calls
+    assert bucket.acquire() <= 0.5
+
+
+@pytest.mark.parametrize('connection', SYNC_CONNECTIONS)
+def test_sync_local_circuit(connection, mocker):
+    bucket = sync_tokenbucket_factory(connection=connection(), refill_frequency=0.4, max_sleep=0.1, local_circuit=True)
+    spy = mocker.spy(SyncTokenBucket, 'script')
+    bucket.acquire()
+
+    with pytest.raises(MaxSleepExceededError):
+        bucket.acquire()
+    assert spy.call_count == 2
+
+    # We know the bucket is busy for longer than we'd sleep, so we don't ask Redis again
+    for _ in range(3):
+        with pytest.raises(MaxSleepExceededError):
+            bucket.acquire()
+        assert not bucket.try_acquire()
+    assert spy.call_count == 2
+
+    # Until the time has passed
+    time.sleep(0.8)
+    assert bucket.acquire() < 0.1
+    assert spy.call_count == 3
+
+
+@pytest.mark.parametrize('connection', [*SYNC_CONNECTIONS, SyncMemoryBackend])
+def test_sync_slots_never_exceed_capacity(connection):
+    bucket = sync_tokenbucket_factory(connection=connection(), capacity=10, refill_amount=10, refill_frequency=1)
+
+    # Tokens left over in one slot don't add to what a later slot can hand out
+    granted: dict[int, int] = {}
+    for tokens in [1, 10, 9, 3, 8, 10, 2]:
+        (wait,) = SyncTokenBucket.reserve_many([bucket], tokens=tokens)
+        granted[round(wait)] = granted.get(round(wait), 0) + tokens
+    assert granted == {0: 1, 1: 10, 2: 9, 3: 3, 4: 8, 5: 10, 6: 2}
+
+
+@pytest.mark.parametrize('connection', [*SYNC_CONNECTIONS, SyncMemoryBackend])
+def test_sync_try_acquire_right_after_a_refill(connection, mocker):
+    now = int(time.time())
+    times = [(now, 0), (now, 150_000), (now, 151_000), (now, 152_000)]
+    mocker.patch('limiters.token_bucket.create_redis_time_tuple', side_effect=times)
+    bucket = sync_tokenbucket_factory(connection=connection(), capacity=100, refill_amount=100, refill_frequency=0.1)
+    assert bucket.try_acquire()
+
+    # The refilled slot includes a penalty for execution time, which isn't a reason to refuse
+    assert bucket.try_acquire()
+    assert bucket.try_acquire()
+    assert SyncTokenBucket.reserve_many([bucket]) == [0]
+
+
+@pytest.mark.parametrize('connection', [*SYNC_CONNECTIONS, SyncMemoryBackend])
+def test_sync_refunds_go_to_the_next_reservation(connection, mocker):
+    now = int(time.time())
+    mocker.patch('limiters.token_bucket.create_redis_time_tuple', return_value=(now, 0))
+    bucket = sync_tokenbucket_factory(connection=connection(), capacity=1, refill_frequency=1)
+    assert SyncTokenBucket.reserve_many([bucket]) == [0]
+    assert SyncTokenBucket.reserve_many([bucket]) == [1]
+    assert SyncTokenBucket.reserve_many([bucket]) == [2]
+
+    # The second slot's token is given back, after the third slot was reserved,
+    # so the next reservation takes it, and the one after that queues up as usual
+    bucket.refund(1, now * 1000 + 1000)
+    assert SyncTokenBucket.reserve_many([bucket]) == [1]
+    assert SyncTokenBucket.reserve_many([bucket]) == [3]
+
+
+@pytest.mark.parametrize('connection', SYNC_CONNECTIONS)
+def test_sync_max_sleep_reserves_nothing(connection):
+    name = uuid4().hex[:6]
+    bucket = sync_tokenbucket_factory(connection=connection(), name=name, refill_frequency=0.4, max_sleep=0.1)
+    bucket.acquire()
+    for _ in range(3):
+        with pytest.raises(MaxSleepExceededError):
+            bucket.acquire()
+
+    # The callers that gave up didn't push back the next one in line
+    assert 0.3 < sync_tokenbucket_factory(connection=connection(), name=name, refill_frequency=0.4).acquire() <= 0.4
+
+
+@pytest.mark.parametrize('connection', SYNC_CONNECTIONS)
+def test_sync_state_ttl(connection):
+    conn = connection()
+
+    # The state is kept until a slow bucket would have refilled, so it doesn't reset to full early
+    slow = sync_tokenbucket_factory(connection=conn, capacity=10, refill_amount=10, refill_frequency=3600)
+    slow.acquire()
+    assert 3_590_000 < conn.pttl(slow.key) <= 3_600_000
+
+    explicit = sync_tokenbucket_factory(connection=conn, refill_frequency=3600, ttl=5)
+    explicit.acquire()
+    assert 4_900 < conn.pttl(explicit.key) <= 5_000
+
+    # But never for less time than it takes to get to a reserved slot
+    assert explicit.reserve_many([explicit]) == [pytest.approx(3600, abs=1)]
+    assert conn.pttl(explicit.key) > 3_590_000
+
+
+@pytest.mark.parametrize('connection', SYNC_CONNECTIONS)
+def test_sync_packed_state(connection):
+    conn = connection()
+    name = uuid4().hex[:6]
+    config = {'connection': conn, 'name': name, 'capacity': 300, 'refill_amount': 300, 'refill_frequency': 0.4}
+    sync_tokenbucket_factory(**config).acquire(tokens=2)
+
+    # Buckets saved in the text encoding can be read, and written back packed
+    packed = sync_tokenbucket_factory(**config, packed_state=True)
+    assert packed.acquire() == 0
+    assert len(conn.get(packed.key)) == 8
+    assert packed.try_acquire(tokens=297)
+    assert len(conn.get(packed.key)) == 7
+    assert not packed.try_acquire()
+
+    # And the other scripts read and write the same encoding
+    packed.refund(2)
+    assert packed.try_acquire(tokens=2)
+    assert 0.3 < sync_tokenbucket_factory(**config).acquire() <= 0.4
+
+
+@pytest.mark.parametrize('connection', SYNC_CONNECTIONS)
+def test_sync_reserve_many(connection, mocker):
+    conn = connection()
+    buckets = [sync_tokenbucket_factory(connection=conn, refill_frequency=0.4) for _ in range(5)]
+    buckets[-1] = sync_tokenbucket_factory(connection=conn, refill_frequency=0.4, max_sleep=0.1)
+    evalsha = mocker.spy(conn, 'evalsha')
+
+    assert SyncTokenBucket.reserve_many(buckets) == [0] * 5
+    waits = SyncTokenBucket.reserve_many(buckets)
+    assert all(0.3 < wait <= 0.4 for wait in waits[:-1])
+
+    # Everything went through a pipeline
+    assert evalsha.call_count == 0
+
+    # The bucket which would wait for longer than its max sleep reserved nothing
+    assert waits[-1] is None
+    time.sleep(0.4)
+    assert buckets[-1].acquire() < 0.1
+
+
+@pytest.mark.parametrize('connection', SYNC_CONNECTIONS)
+def test_sync_reserve_many_loads_scripts(connection):
+    conn = connection()
+    conn.script_flush()
+
+    buckets = [sync_tokenbucket_factory(connection=conn, capacity=2) for _ in range(3)]
+    assert SyncTokenBucket.reserve_many(buckets, tokens=2) == [0] * 3
+
+
+def test_sync_shared_wait():
+    # Waiting threads don't use connections of their own
+    conn = Redis(connection_pool=BlockingConnectionPool.from_url(STANDALONE_URL, max_connections=1, timeout=5))
+    bucket = sync_tokenbucket_factory(connection=conn, refill_frequency=0.05, max_sleep=0.5, shared_wait=True)
+    slept, refused = [], []
+
+    def acquire():
+        try:
+            slept.append(bucket.acquire())
+        except MaxSleepExceededError:
+            refused.append(True)
+
+    threads = [threading.Thread(target=acquire) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    # Threads were woken up one refill apart, until the rest would have waited longer than max_sleep.
+    # The wait counts from when each pipeline is sent, so a later pipeline can admit one more.
+    assert 8 <= len(slept) <= 12
+    assert len(slept) + len(refused) == 20
+    assert max(slept) <= 0.5
+
+
+def test_sync_shared_wait_errors_and_metrics():
+    conn = Redis(connection_pool=BlockingConnectionPool.from_url(STANDALONE_URL, max_connections=1, timeout=5))
+    metrics = InMemoryMetrics()
+    good = sync_tokenbucket_factory(connection=conn, capacity=2, max_sleep=0.5, shared_wait=True, metrics=metrics)
+    bad = sync_tokenbucket_factory(connection=conn, max_sleep=0.5, shared_wait=True)
+    conn.rpush(bad.key, 1)
+    errors = []
+
+    def acquire(bucket):
+        try:
+            bucket.acquire()
+        except ResponseError as e:
+            errors.append((bucket, e))
+
+    threads = [threading.Thread(target=acquire, args=(bucket,)) for bucket in [good, bad, good]]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    # Only the call that failed raised, and every call for a bucket with metrics was reported
+    assert [bucket for bucket, _ in errors] == [bad]
+    assert metrics.histograms['redis_call', 'SyncTokenBucket', good.name].count == 2
+
+
+def test_sync_shared_wait_config():
+    with pytest.raises(ValidationError):
+        sync_tokenbucket_factory(connection=SYNC_CONNECTIONS[0](), capacity=2, lease_size=2, shared_wait=True)